@@ -19,6 +19,7 @@ import os
 from opengraph import fetch_multiple_opengraph
 from ai_insight import analyze_opengraph_data
 from search import process_opengraph_for_search, search_relevant_items
+from search.vectors import has_vector, vector_to_list
 from clustering import create_manual_cluster, classify_by_labels, discover_clusters
 from clustering.storage import save_clustering_result, save_multiple_clusters
 
@@ -27,7 +28,14 @@ app = FastAPI(title="Tab Cleaner MVP", version="0.0.1")
 
 @app.on_event("startup")
 async def startup_event():
-    """应用启动时初始化向量数据库"""
+    """应用启动时初始化共享 HTTP 客户端和向量数据库"""
+    try:
+        from search.http_client import init_embed_client
+        await init_embed_client()
+        print("[Startup] ✓ Embedding HTTP client initialized")
+    except Exception as e:
+        print(f"[Startup] ⚠ Embedding HTTP client initialization failed: {e}")
+    
     try:
         # 检查是否配置了数据库连接
         db_host = os.getenv("ADBPG_HOST", "")
@@ -62,6 +70,13 @@ async def shutdown_event():
         print("[Shutdown] Vector database connection pool closed")
     except Exception as e:
         print(f"[Shutdown] Error closing vector database: {e}")
+    
+    try:
+        from search.http_client import close_embed_client
+        await close_embed_client()
+        print("[Shutdown] Embedding HTTP client closed")
+    except Exception as e:
+        print(f"[Shutdown] Error closing embedding HTTP client: {e}")
 
 app.add_middleware(
     CORSMiddleware,
@@ -279,8 +294,8 @@ async def generate_embeddings(request: EmbeddingRequest):
                     try:
                         db_item = await get_opengraph_item(url)
                         if db_item:
-                            has_text_emb = db_item.get("text_embedding") and len(db_item.get("text_embedding", [])) > 0
-                            has_image_emb = db_item.get("image_embedding") and len(db_item.get("image_embedding", [])) > 0
+                            has_text_emb = has_vector(db_item.get("text_embedding"))
+                            has_image_emb = has_vector(db_item.get("image_embedding"))
                             if has_text_emb or has_image_emb:
                                 # 数据库有 embedding，直接使用
                                 print(f"[API] ✓ Found in DB: {url[:50]}... (text_emb: {has_text_emb}, image_emb: {has_image_emb})")
@@ -293,8 +308,8 @@ async def generate_embeddings(request: EmbeddingRequest):
                                     "tab_id": db_item.get("tab_id") or item.get("tab_id"),
                                     "tab_title": db_item.get("tab_title") or item.get("tab_title"),
                                     "embedding": None,
-                                    "text_embedding": db_item.get("text_embedding"),
-                                    "image_embedding": db_item.get("image_embedding"),
+                                    "text_embedding": vector_to_list(db_item.get("text_embedding")),
+                                    "image_embedding": vector_to_list(db_item.get("image_embedding")),
                                     "has_embedding": True,
                                     "similarity": item.get("similarity")
                                 })
@@ -328,7 +343,7 @@ async def generate_embeddings(request: EmbeddingRequest):
                     from vector_db import upsert_opengraph_item
                     stored_count = 0
                     for item in processed_items:
-                        if item.get("text_embedding") or item.get("image_embedding"):
+                        if has_vector(item.get("text_embedding")) or has_vector(item.get("image_embedding")):
                             success = await upsert_opengraph_item(
                                 url=item.get("url"),
                                 title=item.get("title"),
@@ -343,7 +358,10 @@ async def generate_embeddings(request: EmbeddingRequest):
                                     "is_screenshot": item.get("is_screenshot", False),
                                     "is_doc_card": item.get("is_doc_card", False),
                                     "success": item.get("success", False),
-                                }
+                                    **({"embedding_mode": item["embedding_mode"]} if item.get("embedding_mode") else {}),
+                                },
+                                embed_model=item.get("embed_model"),
+                                embed_version=item.get("embed_version"),
                             )
                             if success:
                                 stored_count += 1
@@ -356,8 +374,8 @@ async def generate_embeddings(request: EmbeddingRequest):
             
             # 添加到结果中
             for item in processed_items:
-                has_text_emb = item.get("text_embedding") and len(item.get("text_embedding", [])) > 0
-                has_image_emb = item.get("image_embedding") and len(item.get("image_embedding", [])) > 0
+                has_text_emb = has_vector(item.get("text_embedding"))
+                has_image_emb = has_vector(item.get("image_embedding"))
                 has_emb_flag = item.get("has_embedding", False)
                 
                 if not has_emb_flag and (has_text_emb or has_image_emb):
@@ -373,8 +391,8 @@ async def generate_embeddings(request: EmbeddingRequest):
                     "tab_id": item.get("tab_id"),
                     "tab_title": item.get("tab_title"),
                     "embedding": None,  # 不再使用融合 embedding
-                    "text_embedding": item.get("text_embedding"),
-                    "image_embedding": item.get("image_embedding"),
+                    "text_embedding": vector_to_list(item.get("text_embedding")),
+                    "image_embedding": vector_to_list(item.get("image_embedding")),
                     "has_embedding": has_emb_flag,
                     "similarity": item.get("similarity")
                 })
@@ -382,15 +400,11 @@ async def generate_embeddings(request: EmbeddingRequest):
         # 统计信息
         items_with_embedding = sum(1 for r in result_data if 
             r.get("has_embedding", False) or
-            (r.get("text_embedding") and len(r.get("text_embedding", [])) > 0) or
-            (r.get("image_embedding") and len(r.get("image_embedding", [])) > 0)
-        )
-        items_with_text_emb = sum(1 for r in result_data if 
-            r.get("text_embedding") and len(r.get("text_embedding", [])) > 0
-        )
-        items_with_image_emb = sum(1 for r in result_data if 
-            r.get("image_embedding") and len(r.get("image_embedding", [])) > 0
+            has_vector(r.get("text_embedding")) or
+            has_vector(r.get("image_embedding"))
         )
+        items_with_text_emb = sum(1 for r in result_data if has_vector(r.get("text_embedding")))
+        items_with_image_emb = sum(1 for r in result_data if has_vector(r.get("image_embedding")))
         from_db = len(result_data) - len(items_to_process) if items_to_process else len(result_data)
         newly_generated = len(items_to_process) if items_to_process else 0
         
@@ -405,8 +419,8 @@ async def generate_embeddings(request: EmbeddingRequest):
             sample = result_data[0]
             print(f"[API] Sample item: {sample.get('url', '')[:50]}...")
             print(f"[API]   - has_embedding flag: {sample.get('has_embedding')}")
-            print(f"[API]   - text_embedding: {bool(sample.get('text_embedding'))} (length: {len(sample.get('text_embedding', []))})")
-            print(f"[API]   - image_embedding: {bool(sample.get('image_embedding'))} (length: {len(sample.get('image_embedding', []))})")
+            print(f"[API]   - text_embedding: {has_vector(sample.get('text_embedding'))} (length: {len(sample.get('text_embedding') or [])})")
+            print(f"[API]   - image_embedding: {has_vector(sample.get('image_embedding'))} (length: {len(sample.get('image_embedding') or [])})")
         
         return {"ok": True, "data": result_data}
     except Exception as e:
@@ -452,7 +466,7 @@ async def search_content(request: SearchRequest):
                     try:
                         # 生成查询文本的 embedding
                         query_emb = await embed_text(request.query_text)
-                        if query_emb:
+                        if query_emb is not None:
                             # 从数据库搜索
                             db_results = await search_by_text_embedding(query_emb, top_k=20)
                             if db_results:
@@ -471,7 +485,7 @@ async def search_content(request: SearchRequest):
                             if img_b64:
                                 # 生成查询图像的 embedding
                                 query_emb = await embed_image(img_b64)
-                                if query_emb:
+                                if query_emb is not None:
                                     # 从数据库搜索
                                     db_results = await search_by_image_embedding(query_emb, top_k=20)
                                     if db_results:
@@ -0,0 +1,177 @@
+"""
+后台向量回填
+每一行记录生成其向量的模型和版本（embed_model / embed_version）。切换 MM_EMBED_MODEL、
+或修改预处理参数并递增 EMBED_VERSION 后，不需要删表重建：回填任务按 url 顺序分批找出来源标记
+与当前不一致的行，以 background 优先级重新生成向量并写回，写入间隔可配置，避免挤占在线请求的上游配额。
+
+回填完成前，新旧模型的行同时存在；搜索时按模型分别生成查询向量并分别检索（见 main.search_content），
+预处理版本不同但模型相同的行与当前查询向量可以直接比较。
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from search import metrics
+
+BACKFILL_ENABLED = os.getenv("BACKFILL_ENABLED", "true").lower() == "true"
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "20"))  # 每批重新生成的行数
+BACKFILL_INTERVAL_S = float(os.getenv("BACKFILL_INTERVAL_S", "1"))  # 两批之间的间隔（节流）
+BACKFILL_IDLE_S = float(os.getenv("BACKFILL_IDLE_S", "300"))  # 一轮扫描结束后，下一轮检查前的等待时间
+
+
+class BackfillRunner:
+    """单个异步任务：循环扫描过期的行并重新生成向量"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        # 最近一次统计的过期行：[{"embed_model", "embed_version", "count"}]
+        self.stale: List[Dict[str, Any]] = []
+        self.backfilled = 0
+        self.failed = 0
+        self.last_pass_at: Optional[float] = None
+        metrics.register_gauge("backfill_pending_rows", lambda: sum(s["count"] for s in self.stale))
+
+    async def start(self):
+        await self.refresh()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def notify(self):
+        """立即开始下一轮扫描"""
+        self._wakeup.set()
+
+    async def refresh(self):
+        """重新统计过期的行"""
+        from search.embed import embedding_tag
+        from vector_db import count_stale_embeddings
+        
+        try:
+            self.stale = await count_stale_embeddings(*embedding_tag())
+        except Exception as e:
+            print(f"[Backfill] Failed to count stale rows: {type(e).__name__}: {e}")
+
+    def stale_models(self) -> Dict[str, Optional[int]]:
+        """
+        还有未回填行的旧模型 → 这些行生成时的向量维度（搜索时需要按该模型和维度单独生成查询向量）
+        
+        同一模型有多种维度时取行数最多的一种（self.stale 按行数降序）
+        """
+        from search.embed import embedding_tag
+        
+        current_model = embedding_tag()[0]
+        models: Dict[str, Optional[int]] = {}
+        for s in self.stale:
+            if s["embed_model"] and s["embed_model"] != current_model:
+                models.setdefault(s["embed_model"], s.get("embed_dim"))
+        return dict(sorted(models.items()))
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if self.stale:
+                pending = sum(s["count"] for s in self.stale)
+                print(f"[Backfill] {pending} row(s) with stale embeddings, starting pass")
+                try:
+                    await self._pass()
+                except Exception as e:
+                    print(f"[Backfill] Pass failed: {type(e).__name__}: {e}")
+                self.last_pass_at = time.time()
+                await self.refresh()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=BACKFILL_IDLE_S)
+            except asyncio.TimeoutError:
+                pass
+            await self.refresh()
+
+    async def _pass(self):
+        """按 url 顺序扫描一轮；生成失败的行保持原样，下一轮再试"""
+        from search.embed import embedding_tag
+        from search.priority import BACKGROUND, embed_priority
+        from vector_db import fetch_stale_items, write_backfill_embeddings
+        
+        embed_model, embed_version = embedding_tag()
+        after_url = None
+        while True:
+            items = await fetch_stale_items(embed_model, embed_version, after_url, BACKFILL_BATCH_SIZE)
+            if not items:
+                break
+            after_url = items[-1]["url"]
+            
+            with embed_priority(BACKGROUND):
+                text_vecs, image_vecs = await reembed_items(items)
+            rows = [
+                (item["url"], item.get("content_fingerprint"), text_vec, image_vec)
+                for item, text_vec, image_vec in zip(items, text_vecs, image_vecs)
+                if text_vec is not None or image_vec is not None
+            ]
+            written = await write_backfill_embeddings(embed_model, embed_version, rows)
+            self.backfilled += written
+            self.failed += len(items) - len(rows)
+            metrics.inc("backfill_rows_total", written)
+            metrics.inc("backfill_failed_total", len(items) - len(rows))
+            print(f"[Backfill] Re-embedded {written}/{len(items)} row(s) (total {self.backfilled})")
+            await asyncio.sleep(BACKFILL_INTERVAL_S)
+
+    def status(self) -> Dict[str, Any]:
+        from search.embed import embedding_tag
+        
+        embed_model, embed_version = embedding_tag()
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "target": {"embed_model": embed_model, "embed_version": embed_version},
+            "pending": sum(s["count"] for s in self.stale),
+            "stale": self.stale,
+            "backfilled": self.backfilled,
+            "failed": self.failed,
+            "last_pass_at": self.last_pass_at,
+        }
+
+
+async def reembed_items(items: List[Dict[str, Any]]):
+    """
+    与 ingest 相同的文本提取和图片选择（截图优先），批量生成文本 / 图像向量
+    
+    回填和 migrate_embedding_dim.py --mode reembed 共用，返回 (text_vecs, image_vecs)，与 items 按下标对应
+    """
+    from search.embed import embed_texts, embed_images
+    from search.preprocess import extract_text_from_item
+    
+    text_vecs = await embed_texts([extract_text_from_item(item) for item in items])
+    images = [item.get("screenshot_image") or item.get("image") or "" for item in items]
+    image_idx = [i for i, image in enumerate(images) if image]
+    image_vecs = [None] * len(items)
+    if image_idx:
+        for i, vec in zip(image_idx, await embed_images([images[i] for i in image_idx])):
+            image_vecs[i] = vec
+    return text_vecs, image_vecs
+
+
+# 进程级单例
+_runner: Optional[BackfillRunner] = None
+
+
+async def start_backfill() -> Optional[BackfillRunner]:
+    global _runner
+    if _runner is None and BACKFILL_ENABLED:
+        _runner = BackfillRunner()
+        await _runner.start()
+        print("[Backfill] Started")
+    return _runner
+
+
+async def stop_backfill():
+    global _runner
+    if _runner is not None:
+        await _runner.stop()
+        _runner = None
+
+
+def get_backfill() -> Optional[BackfillRunner]:
+    return _runner
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+对比 INGEST_EMBED_MODE 三种方式（separate / paired / fused）的上游请求量、耗时和检索质量
+
+- 请求量：包一层 provider.embed，统计上游请求数和 content 数
+- 检索质量：以 separate 的排序为基准，计算每个查询 top-k 的重合率
+
+用法：
+    python benchmark_embed_modes.py --items items.json --queries "咖啡" "跑步鞋" --top-k 10
+    EMBED_PROVIDER=hashing python benchmark_embed_modes.py
+
+items.json 为 OpenGraph 条目列表（与 /api/v1/search/embedding 的 opengraph_items 相同）；
+不传时使用内置的示例条目。
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+MODES = ("separate", "paired", "fused")
+
+SAMPLE_ITEMS = [
+    {"url": "https://example.com/coffee", "title": "手冲咖啡入门", "description": "滤杯、研磨度和水温", "image": (120, 80, 40)},
+    {"url": "https://example.com/tea", "title": "乌龙茶冲泡指南", "description": "茶具与投茶量", "image": (90, 140, 60)},
+    {"url": "https://example.com/running", "title": "Running shoes review", "description": "Best road running shoes", "image": (220, 60, 60)},
+    {"url": "https://example.com/hiking", "title": "徒步装备清单", "description": "背包、登山鞋和雨衣", "image": (60, 110, 160)},
+    {"url": "https://example.com/design", "title": "UI design inspiration", "description": "Dashboard layouts and color palettes", "image": (240, 240, 250)},
+]
+SAMPLE_QUERIES = ["咖啡", "running", "登山", "design"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark separate / paired / fused ingest embedding modes")
+    parser.add_argument("--items", help="OpenGraph 条目 JSON 文件")
+    parser.add_argument("--queries", nargs="*", default=None)
+    parser.add_argument("--top-k", type=int, default=10)
+    return parser.parse_args()
+
+
+def _sample_image(color):
+    """示例条目的纯色图（Base64 Data URI），不依赖网络"""
+    import base64
+    import io
+    from PIL import Image
+    
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buf, format="JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def _load_items(path):
+    if not path:
+        return [dict(item, image=_sample_image(item["image"]), success=True) for item in SAMPLE_ITEMS]
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    items = data.get("opengraph_items", data) if isinstance(data, dict) else data
+    return [dict(item, success=item.get("success", True)) for item in items]
+
+
+def _overlap(baseline, ranked, top_k):
+    expected = {d["url"] for d in baseline[:top_k]}
+    if not expected:
+        return 1.0
+    return len(expected & {d["url"] for d in ranked[:top_k]}) / len(expected)
+
+
+async def main(args):
+    # 关闭缓存，保证每种方式都真实请求上游
+    os.environ["EMBED_CACHE_ENABLED"] = "false"
+    
+    from search import pipeline
+    from search.embed import embed_text, get_provider
+    from search.rank import sort_by_vector_similarity
+    
+    provider = get_provider()
+    stats = {"requests": 0, "contents": 0}
+    original_embed = provider.embed
+
+    async def counting_embed(contents, on_sent=None):
+        stats["requests"] += 1
+        stats["contents"] += len(contents)
+        return await original_embed(contents, on_sent=on_sent)
+    
+    provider.embed = counting_embed
+    
+    items = _load_items(args.items)
+    queries = args.queries or SAMPLE_QUERIES
+    print(f"[Benchmark] provider={provider.name}, items={len(items)}, queries={len(queries)}, top_k={args.top_k}")
+    
+    query_vecs = {q: await embed_text(q) for q in queries}
+    
+    rankings = {}
+    for mode in MODES:
+        pipeline.INGEST_EMBED_MODE = mode
+        stats["requests"] = stats["contents"] = 0
+        started = time.perf_counter()
+        enriched = await pipeline.process_opengraph_for_search([dict(item) for item in items])
+        elapsed = time.perf_counter() - started
+        
+        rankings[mode] = {
+            q: sort_by_vector_similarity(vec, [dict(d) for d in enriched])
+            for q, vec in query_vecs.items()
+        }
+        print(
+            f"[Benchmark] {mode:<8} requests={stats['requests']:<4} contents={stats['contents']:<5} "
+            f"time={elapsed:.2f}s ({elapsed / max(len(items), 1) * 1000:.1f} ms/item)"
+        )
+    
+    for mode in MODES[1:]:
+        overlaps = [
+            _overlap(rankings["separate"][q], rankings[mode][q], args.top_k)
+            for q in queries
+        ]
+        print(f"[Benchmark] {mode:<8} top-{args.top_k} overlap vs separate: {sum(overlaps) / len(overlaps):.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+对比图片预处理的旧实现（全尺寸解码、多次 LANCZOS、逐档重新编码）和当前的 process_image
+（JPEG draft / reduce、单次 thumbnail、预测质量档位、小 JPEG 透传）
+
+输入可以是本地图片（og:image、截图）目录 / 文件，也可以是 og:image URL 列表（先全部下载，不计入耗时）。
+输出每种实现的单张耗时 p50 / p95、输出大小，以及新旧输出之间的 PSNR（衡量画质差异）。
+
+用法：
+    python benchmark_preprocess.py --corpus ./og_images ./screenshots
+    python benchmark_preprocess.py --urls og_image_urls.txt --repeat 3
+"""
+import argparse
+import asyncio
+import base64
+import math
+import statistics
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageStat
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark legacy vs fast process_image")
+    parser.add_argument("--corpus", nargs="*", default=[], help="图片文件或目录（递归）")
+    parser.add_argument("--urls", help="每行一个图片 URL 的文本文件")
+    parser.add_argument("--repeat", type=int, default=1)
+    return parser.parse_args()
+
+
+def legacy_process_image(image_data, max_dimension=None):
+    """改造前的 process_image（仅用于对比）"""
+    from search.config import MIN_IMAGE_DIMENSION, TARGET_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION, MAX_IMAGE_SIZE
+    
+    max_dimension = max_dimension or TARGET_IMAGE_DIMENSION
+    try:
+        img = Image.open(BytesIO(image_data))
+        w, h = img.size
+        if w < MIN_IMAGE_DIMENSION or h < MIN_IMAGE_DIMENSION:
+            scale = max(MIN_IMAGE_DIMENSION / max(w, 1), MIN_IMAGE_DIMENSION / max(h, 1))
+            w, h = int(round(w * scale)), int(round(h * scale))
+            img = img.resize((w, h), Image.Resampling.LANCZOS)
+        if w > max_dimension or h > max_dimension:
+            if w > h:
+                nw, nh = max_dimension, int(h * (max_dimension / w))
+            else:
+                nh, nw = max_dimension, int(w * (max_dimension / h))
+            img = img.resize((nw, nh), Image.Resampling.LANCZOS)
+            w, h = nw, nh
+        if w > MAX_IMAGE_DIMENSION or h > MAX_IMAGE_DIMENSION:
+            scale = min(MAX_IMAGE_DIMENSION / w, MAX_IMAGE_DIMENSION / h)
+            w, h = int(w * scale), int(h * scale)
+            img = img.resize((w, h), Image.Resampling.LANCZOS)
+        if img.mode in ("RGBA", "LA", "P"):
+            bg = Image.new("RGB", img.size, (255, 255, 255))
+            if img.mode == "P":
+                img = img.convert("RGBA")
+            bg.paste(img, mask=img.split()[-1] if img.mode == "RGBA" else None)
+            img = bg
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        out = BytesIO()
+        img.save(out, format="JPEG", quality=85, optimize=True)
+        b = out.getvalue()
+        if len(b) > MAX_IMAGE_SIZE:
+            for q in (70, 60, 50, 40):
+                out = BytesIO()
+                img.save(out, format="JPEG", quality=q, optimize=True)
+                b = out.getvalue()
+                if len(b) <= MAX_IMAGE_SIZE:
+                    break
+        if len(b) > MAX_IMAGE_SIZE:
+            return None
+        return "data:image/jpeg;base64," + base64.b64encode(b).decode("utf-8")
+    except Exception:
+        return None
+
+
+def _load_corpus(paths):
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files += sorted(p for p in path.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+        elif path.is_file():
+            files.append(path)
+    return [(str(p), p.read_bytes()) for p in files]
+
+
+async def _download_corpus(url_file):
+    # 直接下载原图（download_image 启用图片缓存时返回的是处理后的 JPEG）
+    from search.downloader import fetch_image
+    from search.preprocess import IMAGE_REQUEST_HEADERS
+    
+    urls = [line.strip() for line in Path(url_file).read_text(encoding="utf-8").splitlines() if line.strip()]
+    data = await asyncio.gather(*[fetch_image(u, headers=IMAGE_REQUEST_HEADERS) for u in urls], return_exceptions=True)
+    return [(u, d) for u, d in zip(urls, data) if isinstance(d, bytes) and d]
+
+
+def _decode(data_uri):
+    return Image.open(BytesIO(base64.b64decode(data_uri.split(",", 1)[1]))).convert("RGB")
+
+
+def _psnr(a, b):
+    if a.size != b.size:
+        b = b.resize(a.size, Image.Resampling.LANCZOS)
+    mse = sum(v * v for v in ImageStat.Stat(ImageChops.difference(a, b)).rms) / 3
+    return float("inf") if mse == 0 else 20 * math.log10(255.0 / math.sqrt(mse))
+
+
+def _run(fn, corpus, repeat):
+    timings, sizes, outputs = [], [], {}
+    for name, data in corpus:
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            out = fn(data)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best * 1000.0)
+        outputs[name] = out
+        if out:
+            sizes.append(len(out))
+    return timings, sizes, outputs
+
+
+def _report(label, timings, sizes):
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"[Benchmark] {label:<7} total={sum(timings):8.1f} ms  p50={statistics.median(timings):7.2f} ms  "
+        f"p95={p95:7.2f} ms  mean_out={statistics.mean(sizes) / 1024 if sizes else 0:7.1f} KB"
+    )
+
+
+async def main(args):
+    from search.preprocess import process_image
+    
+    corpus = _load_corpus(args.corpus)
+    if args.urls:
+        corpus += await _download_corpus(args.urls)
+    if not corpus:
+        print("[Benchmark] ✗ No images, pass --corpus and/or --urls")
+        return
+    print(f"[Benchmark] {len(corpus)} image(s), {sum(len(d) for _, d in corpus) / 1024 / 1024:.1f} MB, repeat={args.repeat}")
+    
+    legacy = _run(legacy_process_image, corpus, args.repeat)
+    fast = _run(process_image, corpus, args.repeat)
+    _report("legacy", legacy[0], legacy[1])
+    _report("fast", fast[0], fast[1])
+    
+    passthrough = sum(1 for name, data in corpus if fast[2].get(name) and base64.b64decode(fast[2][name].split(",", 1)[1]) == data)
+    psnrs = [
+        _psnr(_decode(legacy[2][name]), _decode(fast[2][name]))
+        for name, _ in corpus
+        if legacy[2].get(name) and fast[2].get(name)
+    ]
+    finite = [p for p in psnrs if math.isfinite(p)]
+    print(f"[Benchmark] speedup={sum(legacy[0]) / max(sum(fast[0]), 1e-9):.2f}x  passthrough={passthrough}/{len(corpus)}")
+    if psnrs:
+        print(
+            f"[Benchmark] PSNR fast vs legacy: min={min(finite) if finite else float('inf'):.1f} dB  "
+            f"median={statistics.median(psnrs):.1f} dB"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
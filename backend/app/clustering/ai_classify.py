@@ -9,8 +9,9 @@ from datetime import datetime
 import numpy as np
 from .config import MAX_LABELS
 from .layout import calculate_cluster_layout
-from search.embed import embed_text
+from search.embed import embed_texts
 from search.fuse import cosine_similarity
+from search.vectors import as_vector
 
 
 async def classify_by_labels(
@@ -47,11 +48,11 @@ async def classify_by_labels(
     
     print(f"[AI Classify] Classifying {len(available_items)} items with {len(labels)} labels")
     
-    # 为每个标签生成 embedding
+    # 为每个标签生成 embedding（所有标签打包进一次批量请求）
     label_embeddings = {}
-    for label in labels:
-        label_vec = await embed_text(label)
-        if label_vec:
+    label_vecs = await embed_texts(labels)
+    for label, label_vec in zip(labels, label_vecs):
+        if label_vec is not None:
             label_embeddings[label] = label_vec
             print(f"[AI Classify] Generated embedding for label '{label}': {len(label_vec)} dims")
         else:
@@ -69,11 +70,12 @@ async def classify_by_labels(
         if not item_id:
             continue
         
-        text_emb = item.get("text_embedding")
-        image_emb = item.get("image_embedding")
+        # 前端传来的 list 只转换一次为 float32 数组，避免对每个标签重复转换
+        text_emb = as_vector(item.get("text_embedding"))
+        image_emb = as_vector(item.get("image_embedding"))
         
         # 如果既没有 text_embedding 也没有 image_embedding，跳过
-        if not text_emb and not image_emb:
+        if text_emb is None and image_emb is None:
             continue
         
         item_scores[item_id] = {}
@@ -83,22 +85,22 @@ async def classify_by_labels(
             image_sim = 0.0
             
             # 计算文本相似度
-            if text_emb and isinstance(text_emb, list) and len(text_emb) > 0:
+            if text_emb is not None:
                 if len(text_emb) == len(label_vec):
                     text_sim = cosine_similarity(label_vec, text_emb)
             
             # 计算图像相似度
-            if image_emb and isinstance(image_emb, list) and len(image_emb) > 0:
+            if image_emb is not None:
                 if len(image_emb) == len(label_vec):
                     image_sim = cosine_similarity(label_vec, image_emb)
             
             # 融合相似度（默认权重：文本 60%，图像 40%）
             # 如果只有一种 embedding，使用单一相似度
-            if text_emb and image_emb:
+            if text_emb is not None and image_emb is not None:
                 final_sim = 0.6 * text_sim + 0.4 * image_sim
-            elif text_emb:
+            elif text_emb is not None:
                 final_sim = text_sim
-            elif image_emb:
+            elif image_emb is not None:
                 final_sim = image_sim
             else:
                 final_sim = 0.0
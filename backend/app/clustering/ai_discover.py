@@ -18,6 +18,7 @@ from .config import (
     get_api_key,
 )
 from .layout import calculate_cluster_layout
+from search.vectors import as_vector
 
 
 def _extract_embeddings(items: List[Dict[str, Any]]) -> tuple[List[np.ndarray], List[str]]:
@@ -35,25 +36,25 @@ def _extract_embeddings(items: List[Dict[str, Any]]) -> tuple[List[np.ndarray],
         if not item_id:
             continue
         
-        text_emb = item.get("text_embedding")
-        image_emb = item.get("image_embedding")
+        text_emb = as_vector(item.get("text_embedding"))
+        image_emb = as_vector(item.get("image_embedding"))
         
         # 优先使用 text_embedding，如果没有则使用 image_embedding
         # 如果两者都有，融合（简单平均）
         emb = None
         
-        if text_emb and isinstance(text_emb, list) and len(text_emb) > 0:
-            if image_emb and isinstance(image_emb, list) and len(image_emb) > 0:
+        if text_emb is not None:
+            if image_emb is not None:
                 # 两者都有，融合（简单平均）
                 if len(text_emb) == len(image_emb):
-                    emb = np.array(text_emb) * 0.6 + np.array(image_emb) * 0.4
+                    emb = text_emb * 0.6 + image_emb * 0.4
                 else:
                     # 维度不匹配，使用 text_embedding
-                    emb = np.array(text_emb)
+                    emb = text_emb
             else:
-                emb = np.array(text_emb)
-        elif image_emb and isinstance(image_emb, list) and len(image_emb) > 0:
-            emb = np.array(image_emb)
+                emb = text_emb
+        elif image_emb is not None:
+            emb = image_emb
         
         if emb is not None and emb.size > 0:
             embeddings.append(emb)
@@ -0,0 +1,2 @@
+# 单元测试在 tests/ 下；以下是需要浏览器（Playwright）或访问真实网站的手动脚本（python test_xxx.py 运行），pytest 不收集
+collect_ignore = ["test_playwright.py", "test_screenshot.py"]
@@ -0,0 +1,375 @@
+"""
+后台 Embedding 任务队列
+ingest 接口只负责入队并立即返回 job_id，由进程内的异步 worker 池消费；
+任务和每个条目的进度持久化在本地 SQLite 中，进程重启后从未完成的条目继续，而不是从头开始
+
+注意：Serverless 环境（Vercel）在响应返回后不保证进程继续运行，后台任务需要部署在常驻进程（如 Railway）上
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from search.retry import backoff_delay
+
+# 任务数据库位置（默认系统临时目录，常驻部署建议指向持久化磁盘）
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(tempfile.gettempdir(), "tab-cleaner-jobs", "jobs.sqlite3"))
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))  # 同时处理的任务数
+JOBS_CHUNK_SIZE = int(os.getenv("JOBS_CHUNK_SIZE", "20"))  # 每次从任务中取出处理的条目数
+JOBS_POLL_INTERVAL_S = float(os.getenv("JOBS_POLL_INTERVAL_S", "2"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))  # 单个条目最多尝试次数（含重启后的重试）
+JOBS_RETRY_BASE_S = float(os.getenv("JOBS_RETRY_BASE_S", "5"))  # 失败条目重试前的退避（full jitter 指数退避，见 search/retry.py）
+JOBS_RETRY_MAX_S = float(os.getenv("JOBS_RETRY_MAX_S", "300"))
+JOBS_RETENTION_S = float(os.getenv("JOBS_RETENTION_S", str(7 * 24 * 3600)))  # 已完成任务的保留时间
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+
+# 条目状态
+PENDING = "pending"
+ITEM_DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+# 处理函数：接收一批条目，按完成顺序产出 (批内下标, 结果)，结果包含 has_embedding / saved / unchanged
+IngestHandler = Callable[[List[Dict[str, Any]]], AsyncIterator[Tuple[int, Dict[str, Any]]]]
+
+
+class JobStore:
+    """SQLite 任务存储（同步接口，由调用方放到线程池执行）"""
+
+    def __init__(self, db_path: Path):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                not_before REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                url TEXT,
+                payload TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                has_embedding INTEGER NOT NULL DEFAULT 0,
+                saved INTEGER NOT NULL DEFAULT 0,
+                unchanged INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                not_before REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (job_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+        """)
+        # 旧版本的数据库没有 not_before 列：补上（默认 0，立即可处理）
+        for table in ("jobs", "job_items"):
+            columns = {row["name"] for row in self._db.execute(f"PRAGMA table_info({table})")}
+            if "not_before" not in columns:
+                self._db.execute(f"ALTER TABLE {table} ADD COLUMN not_before REAL NOT NULL DEFAULT 0")
+        self._db.commit()
+        print(f"[Jobs] Store at {db_path}")
+
+    def create_job(self, items: List[Dict[str, Any]]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, len(items), now, now),
+            )
+            self._db.executemany(
+                "INSERT INTO job_items (job_id, idx, url, payload, status, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (job_id, idx, item.get("url"), json.dumps(item, ensure_ascii=False),
+                     PENDING if item.get("success", False) else SKIPPED, now)
+                    for idx, item in enumerate(items)
+                ],
+            )
+            self._db.commit()
+        return job_id
+
+    def recover(self) -> int:
+        """启动时把上次进程遗留的 running 任务重新放回队列"""
+        with self._lock:
+            cur = self._db.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?", (QUEUED, time.time(), RUNNING))
+            self._db.commit()
+            return cur.rowcount
+
+    def claim_job(self) -> Optional[str]:
+        """取出最早的排队任务并标记为 running（等待重试退避的任务到期后才会被取出）"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM jobs WHERE status = ? AND not_before <= ? ORDER BY created_at LIMIT 1",
+                (QUEUED, time.time()),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (RUNNING, time.time(), row["id"]))
+            self._db.commit()
+            return row["id"]
+
+    def next_items(self, job_id: str, limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """待处理的条目（跳过还在重试退避中的条目）"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT idx, payload FROM job_items WHERE job_id = ? AND status = ? AND not_before <= ? ORDER BY idx LIMIT ?",
+                (job_id, PENDING, time.time(), limit),
+            ).fetchall()
+        return [(row["idx"], json.loads(row["payload"])) for row in rows]
+
+    def complete_item(self, job_id: str, idx: int, result: Dict[str, Any]):
+        """检查点：条目完成后立即落盘，并释放请求体（截图 Base64 可能很大）"""
+        with self._lock:
+            self._db.execute(
+                """
+                UPDATE job_items
+                SET status = ?, payload = NULL, attempts = attempts + 1,
+                    has_embedding = ?, saved = ?, unchanged = ?, error = NULL, updated_at = ?
+                WHERE job_id = ? AND idx = ?
+                """,
+                (ITEM_DONE, int(bool(result.get("has_embedding"))), int(bool(result.get("saved"))),
+                 int(bool(result.get("unchanged"))), time.time(), job_id, idx),
+            )
+            self._db.commit()
+
+    def fail_items(self, job_id: str, indexes: List[int], error: str):
+        """
+        记一次失败；达到 JOBS_MAX_ATTEMPTS 的条目标记为 failed，
+        其余留在 pending，按已尝试次数退避（not_before）后再重试，而不是立即重试
+        """
+        now = time.time()
+        with self._lock:
+            placeholders = ",".join("?" * len(indexes))
+            attempts = dict(self._db.execute(
+                f"SELECT idx, attempts FROM job_items WHERE job_id = ? AND status = ? AND idx IN ({placeholders})",
+                (job_id, PENDING, *indexes),
+            ).fetchall())
+            self._db.executemany(
+                """
+                UPDATE job_items
+                SET attempts = attempts + 1, error = ?, updated_at = ?, not_before = ?,
+                    status = CASE WHEN attempts + 1 >= ? THEN ? ELSE status END,
+                    payload = CASE WHEN attempts + 1 >= ? THEN NULL ELSE payload END
+                WHERE job_id = ? AND idx = ? AND status = ?
+                """,
+                [(error[:500], now, now + backoff_delay(attempts[idx], JOBS_RETRY_BASE_S, JOBS_RETRY_MAX_S),
+                  JOBS_MAX_ATTEMPTS, FAILED, JOBS_MAX_ATTEMPTS, job_id, idx, PENDING)
+                 for idx in indexes if idx in attempts],
+            )
+            self._db.commit()
+
+    def defer_job(self, job_id: str) -> Optional[float]:
+        """
+        任务只剩退避中的条目时放回队列，到最早的重试时间后再被取出，不占用 worker；
+        返回重试时间，没有剩余条目时返回 None
+        """
+        with self._lock:
+            retry_at = self._db.execute(
+                "SELECT MIN(not_before) FROM job_items WHERE job_id = ? AND status = ?", (job_id, PENDING)
+            ).fetchone()[0]
+            if retry_at is None:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = ?, not_before = ?, updated_at = ? WHERE id = ?",
+                (QUEUED, retry_at, time.time(), job_id),
+            )
+            self._db.commit()
+            return retry_at
+
+    def finish_job(self, job_id: str):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (DONE, time.time(), job_id))
+            self._db.commit()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            items = self._db.execute(
+                """
+                SELECT idx, url, status, attempts, has_embedding, saved, unchanged, error
+                FROM job_items WHERE job_id = ? ORDER BY idx
+                """,
+                (job_id,),
+            ).fetchall()
+        counts = {PENDING: 0, ITEM_DONE: 0, FAILED: 0, SKIPPED: 0}
+        for item in items:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "total": job["total"],
+            "counts": counts,
+            "progress": (job["total"] - counts[PENDING]) / job["total"] if job["total"] else 1.0,
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "items": [
+                {
+                    "index": item["idx"],
+                    "url": item["url"],
+                    "status": item["status"],
+                    "attempts": item["attempts"],
+                    "has_embedding": bool(item["has_embedding"]),
+                    "saved": bool(item["saved"]),
+                    "unchanged": bool(item["unchanged"]),
+                    "error": item["error"],
+                }
+                for item in items
+            ],
+        }
+
+    def prune(self, older_than_s: float) -> int:
+        """删除超过保留时间的已完成任务"""
+        cutoff = time.time() - older_than_s
+        with self._lock:
+            ids = [row["id"] for row in self._db.execute(
+                "SELECT id FROM jobs WHERE status = ? AND updated_at < ?", (DONE, cutoff)
+            ).fetchall()]
+            for job_id in ids:
+                self._db.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+                self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._db.commit()
+        return len(ids)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class JobRunner:
+    """异步 worker 池：每个 worker 一次处理一个任务，按 JOBS_CHUNK_SIZE 分批处理条目"""
+
+    def __init__(self, store: JobStore, handler: IngestHandler, workers: int = JOBS_WORKERS):
+        self.store = store
+        self.handler = handler
+        self.workers = max(1, workers)
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        recovered = await asyncio.to_thread(self.store.recover)
+        if recovered:
+            print(f"[Jobs] Resuming {recovered} unfinished job(s)")
+        pruned = await asyncio.to_thread(self.store.prune, JOBS_RETENTION_S)
+        if pruned:
+            print(f"[Jobs] Pruned {pruned} expired job(s)")
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+
+    async def stop(self):
+        """停止 worker；正在处理的任务保持 running，下次启动时由 recover() 重新入队"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """有新任务入队，唤醒空闲的 worker"""
+        self._wakeup.set()
+
+    async def _worker(self, n: int):
+        while True:
+            # 先清除再查询，查询期间入队的任务会重新置位，不会被错过
+            self._wakeup.clear()
+            try:
+                job_id = await asyncio.to_thread(self.store.claim_job)
+            except Exception as e:
+                print(f"[Jobs] Worker {n} failed to claim job: {type(e).__name__}: {e}")
+                job_id = None
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=JOBS_POLL_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            print(f"[Jobs] Worker {n} started job {job_id}")
+            await self._run_job(job_id)
+
+    async def _run_job(self, job_id: str):
+        while True:
+            batch = await asyncio.to_thread(self.store.next_items, job_id, JOBS_CHUNK_SIZE)
+            if not batch:
+                break
+            indexes = [idx for idx, _ in batch]
+            reported = set()
+            error = "no result produced"
+            try:
+                async for pos, result in self.handler([item for _, item in batch]):
+                    await asyncio.to_thread(self.store.complete_item, job_id, indexes[pos], result)
+                    reported.add(indexes[pos])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                print(f"[Jobs] Job {job_id} chunk failed: {error}")
+            # 没有产出结果的条目记一次失败（超过尝试次数后不再重试，避免任务卡死）
+            missing = [idx for idx in indexes if idx not in reported]
+            if missing:
+                await asyncio.to_thread(self.store.fail_items, job_id, missing, error)
+        retry_at = await asyncio.to_thread(self.store.defer_job, job_id)
+        if retry_at is not None:
+            print(f"[Jobs] Job {job_id} has items backing off, requeued for retry in {max(0.0, retry_at - time.time()):.1f}s")
+            return
+        await asyncio.to_thread(self.store.finish_job, job_id)
+        print(f"[Jobs] Finished job {job_id}")
+
+
+# 进程级单例
+_store: Optional[JobStore] = None
+_runner: Optional[JobRunner] = None
+
+
+def get_job_store() -> JobStore:
+    global _store
+    if _store is None:
+        _store = JobStore(Path(JOBS_DB_PATH))
+    return _store
+
+
+async def start_job_runner(handler: IngestHandler) -> JobRunner:
+    global _runner
+    if _runner is None:
+        _runner = JobRunner(get_job_store(), handler)
+        await _runner.start()
+        print(f"[Jobs] Started {_runner.workers} worker(s)")
+    return _runner
+
+
+async def stop_job_runner():
+    global _runner, _store
+    if _runner is not None:
+        await _runner.stop()
+        _runner = None
+    if _store is not None:
+        _store.close()
+        _store = None
+
+
+async def enqueue_job(items: List[Dict[str, Any]]) -> str:
+    """持久化任务并唤醒 worker，返回 job_id"""
+    job_id = await asyncio.to_thread(get_job_store().create_job, items)
+    if _runner is not None:
+        _runner.notify()
+    return job_id
+
+
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return await asyncio.to_thread(get_job_store().get_job, job_id)
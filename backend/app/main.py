@@ -1,7 +1,7 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pathlib import Path
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
@@ -20,7 +20,14 @@ app = FastAPI(title="Tab Cleaner MVP", version="0.0.1")
 
 @app.on_event("startup")
 async def startup_event():
-    """应用启动时初始化向量数据库"""
+    """应用启动时初始化共享 HTTP 客户端和向量数据库"""
+    try:
+        from search.http_client import init_embed_client
+        await init_embed_client()
+        print("[Startup] ✓ Embedding HTTP client initialized")
+    except Exception as e:
+        print(f"[Startup] ⚠ Embedding HTTP client initialization failed: {e}")
+    
     try:
         # 检查是否配置了数据库连接
         db_host = os.getenv("ADBPG_HOST", "")
@@ -44,17 +51,82 @@ async def startup_event():
     except Exception as e:
         print(f"[Startup] ⚠ Startup event error (non-critical): {e}")
         # 不阻止应用启动
+    
+    try:
+        from jobs import start_job_runner
+        await start_job_runner(_ingest_job_handler)
+        print("[Startup] ✓ Embedding job workers started")
+    except Exception as e:
+        print(f"[Startup] ⚠ Embedding job workers failed to start: {e}")
+    
+    if os.getenv("ADBPG_HOST", ""):
+        try:
+            from backfill import start_backfill
+            await start_backfill()
+        except Exception as e:
+            print(f"[Startup] ⚠ Embedding backfill failed to start: {e}")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭时清理资源"""
+    try:
+        from backfill import stop_backfill
+        await stop_backfill()
+    except Exception as e:
+        print(f"[Shutdown] Error stopping embedding backfill: {e}")
+    
+    try:
+        from jobs import stop_job_runner
+        await stop_job_runner()
+        print("[Shutdown] Embedding job workers stopped")
+    except Exception as e:
+        print(f"[Shutdown] Error stopping embedding job workers: {e}")
+    
     try:
         from vector_db import close_pool
         await close_pool()
         print("[Shutdown] Vector database connection pool closed")
     except Exception as e:
         print(f"[Shutdown] Error closing vector database: {e}")
+    
+    try:
+        from search.embed import close_embed_batcher
+        await close_embed_batcher()
+    except Exception as e:
+        print(f"[Shutdown] Error draining embedding batcher: {e}")
+    
+    try:
+        from search.image_pool import close_image_pool
+        close_image_pool()
+    except Exception as e:
+        print(f"[Shutdown] Error closing image pool: {e}")
+    
+    try:
+        from search.embed_cache import close_embed_cache
+        close_embed_cache()
+    except Exception as e:
+        print(f"[Shutdown] Error closing embedding cache: {e}")
+    
+    try:
+        from search.image_cache import close_image_cache
+        close_image_cache()
+    except Exception as e:
+        print(f"[Shutdown] Error closing image cache: {e}")
+    
+    try:
+        from search.http_client import close_embed_client
+        await close_embed_client()
+        print("[Shutdown] Embedding HTTP client closed")
+    except Exception as e:
+        print(f"[Shutdown] Error closing embedding HTTP client: {e}")
+    
+    try:
+        from search.http_client import close_fetch_client
+        await close_fetch_client()
+        print("[Shutdown] Fetch HTTP client closed")
+    except Exception as e:
+        print(f"[Shutdown] Error closing fetch HTTP client: {e}")
 
 app.add_middleware(
     CORSMiddleware,
@@ -209,6 +281,113 @@ class SearchRequest(BaseModel):
     top_k: Optional[int] = 20
 
 
+async def _load_stored_embeddings(items: List[Dict[str, Any]]) -> Dict[str, Dict]:
+    """批量读取这批 URL 已存储的向量和内容指纹（未配置数据库时返回空）"""
+    if not os.getenv("ADBPG_HOST", "") or not items:
+        return {}
+    try:
+        from vector_db import get_stored_embeddings
+        return await get_stored_embeddings([item.get("url") for item in items])
+    except Exception as e:
+        print(f"[API] ⚠ Failed to look up stored embeddings: {e}")
+        return {}
+
+
+async def _ingest_items(normalized_items: List[Dict[str, Any]]):
+    """
+    逐条产出 (index, enriched_item, saved)：生成 embedding（内容未变化的复用已存储向量）并写入数据库
+    
+    流式接口和后台任务共用；index 为条目在 success=True 的条目中的下标
+    """
+    from search import iter_opengraph_for_search
+    
+    db_host = os.getenv("ADBPG_HOST", "")
+    stored = await _load_stored_embeddings(normalized_items)
+    async for idx, item in iter_opengraph_for_search(normalized_items, stored):
+        # 内容未变化的条目已在库中；批次内的重复条目与首个条目是同一行（规范化 URL 相同）
+        saved = bool(item.get("unchanged"))
+        if item.get("duplicate_of") is not None:
+            saved = False
+        elif db_host and not saved and _has_any_embedding(item):
+            try:
+                from vector_db import batch_upsert_items
+                saved = await batch_upsert_items([_to_store_item(item)]) > 0
+            except Exception as e:
+                print(f"[API] ⚠ Failed to store embedding for {item.get('url')}: {e}")
+        yield idx, item, saved
+
+
+async def _ingest_job_handler(items: List[Dict[str, Any]]):
+    """
+    后台任务的处理函数（见 jobs.IngestHandler），只返回状态，向量已写入数据库
+    
+    以 background 优先级请求 embedding，不挤占搜索查询和同步入库的上游名额
+    """
+    from search.priority import BACKGROUND, embed_priority
+    
+    with embed_priority(BACKGROUND):
+        async for idx, item, saved in _ingest_items(items):
+            yield idx, {
+                "has_embedding": _has_any_embedding(item),
+                "saved": saved,
+                "unchanged": bool(item.get("unchanged")),
+            }
+
+
+def _has_any_embedding(item: Dict[str, Any]) -> bool:
+    from search.vectors import has_vector
+    return has_vector(item.get("text_embedding")) or has_vector(item.get("image_embedding"))
+
+
+def _to_store_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """把 pipeline 产出的条目转换为 batch_upsert_items 的输入"""
+    # 确保 metadata 包含所有必要字段
+    metadata = item.get("metadata") or {}
+    if not isinstance(metadata, dict):
+        metadata = {}
+    
+    return {
+        "url": item.get("url"),
+        "title": item.get("title"),
+        "description": item.get("description"),
+        "image": item.get("image"),  # ✅ 已经是规范化后的字符串
+        "site_name": item.get("site_name"),
+        "tab_id": item.get("tab_id"),
+        "tab_title": item.get("tab_title"),
+        "text_embedding": item.get("text_embedding"),
+        "image_embedding": item.get("image_embedding"),
+        "embed_model": item.get("embed_model"),
+        "embed_version": item.get("embed_version"),
+        "metadata": {
+            **metadata,
+            "is_screenshot": item.get("is_screenshot", False),
+            "is_doc_card": item.get("is_doc_card", False),
+            "success": item.get("success", False),
+            # fused 模式：text_embedding 是文本 + 图像的融合向量（见 search.fuse.is_fused_item）
+            **({"embedding_mode": item["embedding_mode"]} if item.get("embedding_mode") else {}),
+        }
+    }
+
+
+def _format_embedding_result(item: Dict[str, Any]) -> Dict[str, Any]:
+    """格式化单条 embedding 结果（JSON 边界：float32 数组在这里转换为 list）"""
+    from search.vectors import vector_to_list
+    return {
+        "url": item.get("url"),
+        "title": item.get("title") or item.get("tab_title", ""),
+        "description": item.get("description", ""),
+        "image": item.get("image", ""),
+        "site_name": item.get("site_name", ""),
+        "tab_id": item.get("tab_id"),
+        "tab_title": item.get("tab_title"),
+        "embedding": None,  # 不再使用融合 embedding
+        "text_embedding": vector_to_list(item.get("text_embedding")),
+        "image_embedding": vector_to_list(item.get("image_embedding")),
+        "has_embedding": bool(item.get("has_embedding", False)) or _has_any_embedding(item),
+        "similarity": item.get("similarity")
+    }
+
+
 @app.post("/api/v1/search/embedding")
 async def generate_embeddings(request: EmbeddingRequest):
     """
@@ -248,37 +427,17 @@ async def generate_embeddings(request: EmbeddingRequest):
         normalized_items = normalize_opengraph_items(request.opengraph_items)
         print(f"[API] Normalized {len(normalized_items)} items from {len(request.opengraph_items)} input items")
         
-        # 1. 调用 process_opengraph_for_search() 生成 embedding
-        enriched_items = await process_opengraph_for_search(normalized_items)
-        print(f"[API] Generated embeddings for {len(enriched_items)} items")
-        
-        # 2. 准备批量存储的数据（使用规范化后的数据）
-        items_to_store = []
-        for item in enriched_items:
-            # 只存储有 embedding 的项
-            if item.get("text_embedding") or item.get("image_embedding"):
-                # 确保 metadata 包含所有必要字段
-                metadata = item.get("metadata") or {}
-                if not isinstance(metadata, dict):
-                    metadata = {}
-                
-                items_to_store.append({
-                    "url": item.get("url"),
-                    "title": item.get("title"),
-                    "description": item.get("description"),
-                    "image": item.get("image"),  # ✅ 已经是规范化后的字符串
-                    "site_name": item.get("site_name"),
-                    "tab_id": item.get("tab_id"),
-                    "tab_title": item.get("tab_title"),
-                    "text_embedding": item.get("text_embedding"),
-                    "image_embedding": item.get("image_embedding"),
-                    "metadata": {
-                        **metadata,
-                        "is_screenshot": item.get("is_screenshot", False),
-                        "is_doc_card": item.get("is_doc_card", False),
-                        "success": item.get("success", False),
-                    }
-                })
+        # 1. 一次查询取出已存储的向量，调用 process_opengraph_for_search() 只为新增 / 变化的条目生成 embedding
+        stored = await _load_stored_embeddings(normalized_items)
+        enriched_items = await process_opengraph_for_search(normalized_items, stored)
+        unchanged_count = sum(1 for item in enriched_items if item.get("unchanged"))
+        print(f"[API] Generated embeddings for {len(enriched_items)} items ({unchanged_count} unchanged, reused from DB)")
+        
+        # 2. 准备批量存储的数据（使用规范化后的数据，只存储有 embedding 且内容有变化的项）
+        items_to_store = [
+            _to_store_item(item) for item in enriched_items
+            if _has_any_embedding(item) and not item.get("unchanged") and item.get("duplicate_of") is None
+        ]
         
         # 3. 调用 batch_upsert_items() 存储到数据库
         saved_count = 0
@@ -298,37 +457,16 @@ async def generate_embeddings(request: EmbeddingRequest):
         elif not db_host:
             print(f"[API] ⚠ ADBPG_HOST not configured, skipping database storage")
         elif not items_to_store:
-            print(f"[API] ⚠ No items with embeddings to store")
-        
-        # 4. 格式化返回数据
-        result_data = []
-        for item in enriched_items:
-            has_text_emb = item.get("text_embedding") and len(item.get("text_embedding", [])) > 0
-            has_image_emb = item.get("image_embedding") and len(item.get("image_embedding", [])) > 0
-            has_emb_flag = item.get("has_embedding", False)
-            
-            if not has_emb_flag and (has_text_emb or has_image_emb):
-                has_emb_flag = True
-            
-            result_data.append({
-                "url": item.get("url"),
-                "title": item.get("title") or item.get("tab_title", ""),
-                "description": item.get("description", ""),
-                "image": item.get("image", ""),
-                "site_name": item.get("site_name", ""),
-                "tab_id": item.get("tab_id"),
-                "tab_title": item.get("tab_title"),
-                "embedding": None,  # 不再使用融合 embedding
-                "text_embedding": item.get("text_embedding"),
-                "image_embedding": item.get("image_embedding"),
-                "has_embedding": has_emb_flag,
-                "similarity": item.get("similarity")
-            })
+            print(f"[API] ⚠ No new or changed items with embeddings to store")
+        
+        # 4. 格式化返回数据（JSON 边界：float32 数组在这里转换为 list）
+        result_data = [_format_embedding_result(item) for item in enriched_items]
         
         # 5. 返回包含 saved 字段的响应
         return {
             "ok": True,
             "saved": saved_count,
+            "unchanged": unchanged_count,
             "data": result_data
         }
     except Exception as e:
@@ -339,6 +477,97 @@ async def generate_embeddings(request: EmbeddingRequest):
         raise HTTPException(status_code=500, detail=error_detail)
 
 
+@app.post("/api/v1/search/embedding/stream")
+async def generate_embeddings_stream(request: EmbeddingRequest):
+    """
+    /api/v1/search/embedding 的流式版本（NDJSON，每行一个 JSON 对象）
+    
+    每个条目处理完成（并写入数据库）后立即输出一行，顺序为完成顺序：
+        {"index": 3, "url": ..., "has_embedding": true, "saved": true, "unchanged": false, "duplicate_of": null, ...其余字段同 data[i]}
+    内容未变化的条目复用已存储向量，不再写库（saved 为 true、unchanged 为 true）。最后一行为汇总：
+        {"done": true, "total": N, "saved": M, "unchanged": K}
+    """
+    from search.normalize import normalize_opengraph_items
+    
+    normalized_items = normalize_opengraph_items(request.opengraph_items or [])
+    print(f"[API] 📥 Streaming embeddings for {len(normalized_items)} items")
+    if not os.getenv("ADBPG_HOST", ""):
+        print(f"[API] ⚠ ADBPG_HOST not configured, skipping database storage")
+
+    async def ndjson_lines():
+        total = 0
+        saved_count = 0
+        unchanged_count = 0
+        async for idx, item, saved in _ingest_items(normalized_items):
+            total += 1
+            if item.get("unchanged"):
+                unchanged_count += 1
+            else:
+                saved_count += int(saved)
+            yield json.dumps({
+                "index": idx,
+                **_format_embedding_result(item),
+                "saved": saved,
+                "unchanged": bool(item.get("unchanged")),
+                "duplicate_of": item.get("duplicate_of"),
+            }, ensure_ascii=False) + "\n"
+        print(f"[API] ✓ Streamed {total} items, stored {saved_count} to vector DB, {unchanged_count} unchanged")
+        yield json.dumps({"done": True, "total": total, "saved": saved_count, "unchanged": unchanged_count}) + "\n"
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
+@app.post("/api/v1/search/embedding/jobs")
+async def enqueue_embedding_job(request: EmbeddingRequest):
+    """
+    /api/v1/search/embedding 的后台任务版本：条目持久化后立即返回 job_id，
+    由后台 worker 生成 embedding 并写入数据库，进度通过 GET /api/v1/jobs/{job_id} 查询
+    """
+    from jobs import enqueue_job
+    from search.normalize import normalize_opengraph_items
+    
+    normalized_items = normalize_opengraph_items(request.opengraph_items or [])
+    # 客户端带来的向量不参与计算（pipeline 会重新生成或复用数据库中的向量），不写入任务存储
+    payload = [
+        {k: v for k, v in item.items() if k not in ("text_embedding", "image_embedding")}
+        for item in normalized_items
+    ]
+    try:
+        job_id = await enqueue_job(payload)
+    except Exception as e:
+        print(f"[API] ✗ Failed to enqueue embedding job: {e}")
+        raise HTTPException(status_code=503, detail=f"Job queue unavailable: {e}")
+    print(f"[API] 📥 Enqueued embedding job {job_id} with {len(payload)} items")
+    return {"ok": True, "job_id": job_id, "total": len(payload)}
+
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_embedding_job(job_id: str):
+    """查询后台任务状态和每个条目的进度"""
+    from jobs import get_job
+    
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return {"ok": True, **job}
+
+
+def _format_search_result(item: Dict[str, Any]) -> Dict[str, Any]:
+    """格式化单条搜索结果（保持与前端 useSearch 兼容）"""
+    # 数据库按规范化 URL 存储，返回最近一次入库时的原始 URL（与前端保存的标签页 URL 一致）
+    metadata = item.get("metadata") if isinstance(item.get("metadata"), dict) else {}
+    return {
+        "url": metadata.get("original_url") or item.get("url", ""),
+        "title": item.get("title") or item.get("tab_title", ""),
+        "description": item.get("description", ""),
+        "image": item.get("image", ""),
+        "site_name": item.get("site_name", ""),
+        "tab_id": item.get("tab_id"),
+        "tab_title": item.get("tab_title"),
+        "similarity": float(item.get("similarity", 0.0))
+    }
+
+
 @app.post("/api/v1/search/query")
 async def search_content(request: SearchRequest):
     """
@@ -368,9 +597,11 @@ async def search_content(request: SearchRequest):
         
         # 1. 查询增强：优化查询文本，提高检索准确度
         from search.query_enhance import enhance_query
-        from search.embed import embed_text
-        from vector_db import search_by_text_embedding
-        from search.rank import sort_by_vector_similarity
+        from search.embed import embed_text, embedding_available
+        from search.priority import INTERACTIVE, embed_priority
+        from search.config import EMBED_QUERY_DEADLINE_S
+        from vector_db import search_by_keyword
+        from search.rank import sort_by_fuzzy_score
         
         # 增强查询文本（设计师找图场景，默认偏向视觉查询）
         enhanced_query = enhance_query(
@@ -379,75 +610,71 @@ async def search_content(request: SearchRequest):
             default_to_visual=True  # 设计师找图场景，默认偏向视觉
         )
         
-        # 使用增强后的查询生成 embedding
-        query_embedding = await embed_text(enhanced_query)
-        if not query_embedding:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to generate query embedding"
-            )
+        # 使用增强后的查询生成 embedding（带截止时间，避免偶发的慢响应拖长尾延迟）
+        # 熔断打开时不再等待上游，直接走本地文本排序；查询按 interactive 优先级插到批量入库之前
+        query_embedding = None
+        if embedding_available():
+            with embed_priority(INTERACTIVE):
+                query_embedding = await embed_text(enhanced_query, timeout=EMBED_QUERY_DEADLINE_S)
+        
+        if query_embedding is None:
+            # 降级：关键词召回 + fuzzy_score 本地排序
+            print(f"[API] Query embedding unavailable, falling back to keyword search")
+            candidates = await search_by_keyword(request.query, limit=top_k * 3)
+            ranked = sort_by_fuzzy_score(request.query, candidates)[:top_k]
+            return {
+                "ok": True,
+                "degraded": True,
+                "results": [_format_search_result(item) for item in ranked]
+            }
         
         print(f"[API] Generated query embedding (dimension: {len(query_embedding)})")
         
-        # 2. 从数据库检索更多结果（包含 text_embedding 和 image_embedding）
-        # 设计师找图场景：同时检索文本和图像 embedding，扩大候选池
-        expanded_top_k = top_k * 3  # 获取 3 倍结果用于融合排序
+        # 2. 回填进行中时，旧模型的行需要用旧模型生成的查询向量检索，新旧结果按相似度合并
+        from backfill import get_backfill
+        from search.embed import embed_text_with_model, embedding_tag
+        from search.vectors import truncate_vector
         
-        # 同时检索文本和图像 embedding（图像优先）
-        from vector_db import search_by_text_embedding, search_by_image_embedding
-        
-        # 文本检索
-        text_db_results = await search_by_text_embedding(query_embedding, top_k=expanded_top_k)
-        # 图像检索（设计师找图场景，图像更重要）
-        image_db_results = await search_by_image_embedding(query_embedding, top_k=expanded_top_k)
-        
-        # 合并并去重（图像结果优先）
-        all_results_map = {}
-        # 先添加图像结果（优先级更高）
-        for item in image_db_results:
-            all_results_map[item["url"]] = item
-        # 再添加文本结果（如果图像结果中没有）
-        for item in text_db_results:
-            if item["url"] not in all_results_map:
-                all_results_map[item["url"]] = item
-        
-        db_results = list(all_results_map.values())
-        
-        if not db_results:
+        backfill = get_backfill()
+        stale_models = backfill.stale_models() if backfill is not None else {}
+        if not stale_models:
+            ranked_results = await _vector_search_candidates(query_embedding, top_k)
+        else:
+            current_model = embedding_tag()[0]
+            query_vecs = {current_model: query_embedding}
+            with embed_priority(INTERACTIVE):
+                for model, dim in stale_models.items():
+                    # 按旧行生成时的维度请求；旧行被 migrate_embedding_dim 截断过时，查询向量同样截断到列的维度
+                    vec = await embed_text_with_model(enhanced_query, model, dimensions=dim, timeout=EMBED_QUERY_DEADLINE_S)
+                    if vec is None:
+                        continue
+                    aligned = truncate_vector(vec, len(query_embedding))
+                    if aligned is None:
+                        print(f"[API] ⚠ {model} query embedding has {len(vec)} dims, expected {len(query_embedding)}, skipping")
+                        continue
+                    query_vecs[model] = aligned
+            print(f"[API] Backfill in progress, searching side by side: {list(query_vecs)}")
+            ranked_by_url = {}
+            for model, vec in query_vecs.items():
+                for item in await _vector_search_candidates(vec, top_k, embed_model=model):
+                    if item["url"] not in ranked_by_url:
+                        ranked_by_url[item["url"]] = item
+            ranked_results = sorted(ranked_by_url.values(), key=lambda d: d.get("similarity", 0.0), reverse=True)
+        
+        if not ranked_results:
             print(f"[API] No results found in database for query: '{request.query}'")
             return {
                 "ok": True,
                 "results": []
             }
         
-        print(f"[API] Found {len(db_results)} candidate results from vector DB (text embedding)")
-        
-        # 3. 使用 sort_by_vector_similarity 融合文本和图像相似度
-        # 这会同时考虑 text_embedding 和 image_embedding，并提高图像权重
-        ranked_results = sort_by_vector_similarity(
-            query_vec=query_embedding,
-            docs=db_results,
-            weights=None  # 使用自适应权重（会根据内容类型选择，默认已提高图像权重）
-        )
-        
-        # 4. 取前 top_k 个结果
+        # 3. 取前 top_k 个结果
         final_results = ranked_results[:top_k]
         
         print(f"[API] Ranked and selected top {len(final_results)} results (with image embedding fusion)")
         
         # 5. 格式化返回结果（保持与前端 useSearch 兼容）
-        results = []
-        for item in final_results:
-            results.append({
-                "url": item.get("url", ""),
-                "title": item.get("title") or item.get("tab_title", ""),
-                "description": item.get("description", ""),
-                "image": item.get("image", ""),
-                "site_name": item.get("site_name", ""),
-                "tab_id": item.get("tab_id"),
-                "tab_title": item.get("tab_title"),
-                "similarity": float(item.get("similarity", 0.0))
-            })
+        results = [_format_search_result(item) for item in final_results]
         
         # 打印相似度范围（用于调试）
         if results:
@@ -457,6 +684,7 @@ async def search_content(request: SearchRequest):
         # 4. 返回 JSON 响应
         return {
             "ok": True,
+            "degraded": False,
             "results": results
         }
     except Exception as e:
@@ -466,6 +694,70 @@ async def search_content(request: SearchRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _vector_search_candidates(query_embedding, top_k: int, embed_model: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    从数据库检索候选并按融合相似度排序（embed_model 不为空时只检索该模型生成的行）
+    """
+    from vector_db import search_by_text_embedding, search_by_image_embedding
+    from search.rank import sort_by_vector_similarity
+    
+    # 从数据库检索更多结果（包含 text_embedding 和 image_embedding）
+    # 设计师找图场景：同时检索文本和图像 embedding，扩大候选池
+    expanded_top_k = top_k * 3  # 获取 3 倍结果用于融合排序
+    
+    # 文本检索
+    text_db_results = await search_by_text_embedding(query_embedding, top_k=expanded_top_k, embed_model=embed_model)
+    # 图像检索（设计师找图场景，图像更重要）
+    image_db_results = await search_by_image_embedding(query_embedding, top_k=expanded_top_k, embed_model=embed_model)
+    
+    # 合并并去重（图像结果优先）
+    all_results_map = {}
+    # 先添加图像结果（优先级更高）
+    for item in image_db_results:
+        all_results_map[item["url"]] = item
+    # 再添加文本结果（如果图像结果中没有）
+    for item in text_db_results:
+        if item["url"] not in all_results_map:
+            all_results_map[item["url"]] = item
+    
+    db_results = list(all_results_map.values())
+    if not db_results:
+        return []
+    
+    print(f"[API] Found {len(db_results)} candidate results from vector DB (embed_model={embed_model or 'any'})")
+    
+    # 使用 sort_by_vector_similarity 融合文本和图像相似度
+    # 这会同时考虑 text_embedding 和 image_embedding，并提高图像权重
+    return sort_by_vector_similarity(
+        query_vec=query_embedding,
+        docs=db_results,
+        weights=None  # 使用自适应权重（会根据内容类型选择，默认已提高图像权重）
+    )
+
+
+@app.get("/api/v1/search/backfill")
+async def search_backfill_status():
+    """
+    向量回填进度：当前目标模型 / 版本、各旧版本剩余的行数、已回填和失败的行数
+    """
+    from backfill import get_backfill
+    backfill = get_backfill()
+    if backfill is None:
+        return {"ok": True, "enabled": False}
+    return {"ok": True, "enabled": True, **backfill.status()}
+
+
+@app.get("/api/v1/search/metrics")
+async def search_metrics():
+    """
+    搜索 / Embedding 子系统的进程内指标（批大小、排队耗时、队列深度等），
+    以及正在抓取或冷却中的 host
+    """
+    from search import metrics
+    from search.politeness import get_host_scheduler
+    return {"ok": True, "metrics": metrics.snapshot(), "fetch_hosts": get_host_scheduler().stats()}
+
+
 # 聚类 API
 class ManualClusterRequest(BaseModel):
     item_ids: List[str]
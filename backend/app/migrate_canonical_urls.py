@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+把 opengraph_items 中按原始 URL 存储的旧行改为按规范化 URL 存储（见 search/canonical.py）
+
+规范化后相同的多行会合并为一行（优先保留有向量、最近更新的），其余行被删除，
+所以不在启动时自动执行：升级后、或调整 CANONICAL_URL_RULES 后手动运行一次。
+先用 --dry-run 查看会影响多少行。
+
+用法：
+    python migrate_canonical_urls.py --dry-run
+    python migrate_canonical_urls.py
+"""
+import argparse
+import asyncio
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Re-key opengraph_items rows to canonical URLs")
+    parser.add_argument("--dry-run", action="store_true", help="只统计需要迁移的行，不修改数据")
+    return parser.parse_args()
+
+
+async def main(args):
+    from vector_db import NAMESPACE, close_pool, migrate_canonical_urls
+    
+    try:
+        rekeyed, merged = await migrate_canonical_urls(dry_run=args.dry_run)
+        if args.dry_run:
+            print(f"[MigrateURL] {NAMESPACE}.opengraph_items: {rekeyed} row(s) to re-key, {merged} duplicate row(s) to merge (dry run, nothing changed)")
+        elif rekeyed or merged:
+            print(f"[MigrateURL] ✓ Re-keyed {rekeyed} row(s) to canonical URLs, merged {merged} duplicate row(s)")
+        else:
+            print("[MigrateURL] ✓ All rows already use canonical URLs, nothing to do.")
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
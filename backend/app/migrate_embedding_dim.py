@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+迁移 opengraph_items 的向量维度（例如 1024 → 512）
+
+两种方式：
+- truncate：Matryoshka 截断，保留原向量前 N 维并重新归一化（无需调用 embedding API，只能降维）
+- reembed：按目标维度重新生成文本 / 图像向量（可升维，会消耗 API 配额）
+
+流程：添加 vector(N) 临时列 → 分批写入 → 删除旧索引和旧列、重命名临时列、重建索引。
+迁移完成后，用相同的 EMBED_COLLECTION_DIMS / MM_EMBED_DIM 配置重启后端。
+
+用法：
+    python migrate_embedding_dim.py --dim 512
+    python migrate_embedding_dim.py --dim 768 --mode reembed --batch-size 20
+"""
+import argparse
+import asyncio
+import json
+import os
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Migrate opengraph_items embeddings to a new dimension")
+    parser.add_argument("--dim", type=int, required=True, help="目标维度：2048 / 1024 / 768 / 512")
+    parser.add_argument("--mode", choices=("truncate", "reembed"), default="truncate")
+    parser.add_argument("--batch-size", type=int, default=100)
+    return parser.parse_args()
+
+
+async def main(args):
+    # 必须在导入 search / vector_db 之前设置，使 provider 按目标维度请求 embedding
+    namespace = os.getenv("ADBPG_NAMESPACE", "cleantab")
+    dims = json.loads(os.getenv("EMBED_COLLECTION_DIMS", "{}") or "{}")
+    dims[namespace] = args.dim
+    os.environ["EMBED_COLLECTION_DIMS"] = json.dumps(dims)
+    
+    from backfill import reembed_items
+    from search.config import SUPPORTED_EMBED_DIMS
+    from search.embed import embedding_tag
+    from search.vectors import truncate_vector
+    from vector_db import (
+        EMBEDDING_COLUMNS,
+        get_pool,
+        close_pool,
+        get_embedding_column_dim,
+        add_staging_embedding_columns,
+        fetch_items_for_migration,
+        write_staging_embeddings,
+        swap_staging_embedding_columns,
+    )
+    
+    if args.dim not in SUPPORTED_EMBED_DIMS:
+        print(f"[MigrateDim] ✗ Unsupported dimension {args.dim}, expected one of {SUPPORTED_EMBED_DIMS}")
+        return
+    
+    try:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            current = {column: await get_embedding_column_dim(conn, column) for column in EMBEDDING_COLUMNS}
+        print(f"[MigrateDim] {namespace}.opengraph_items: {current} → vector({args.dim}), mode={args.mode}")
+        
+        if all(dim == args.dim for dim in current.values()):
+            print("[MigrateDim] ✓ Already at target dimension, nothing to do.")
+            return
+        if args.mode == "truncate" and any(dim is not None and dim < args.dim for dim in current.values()):
+            print("[MigrateDim] ✗ Truncate can only reduce dimensions, use --mode reembed.")
+            return
+        
+        await add_staging_embedding_columns(args.dim)
+        
+        migrated = 0
+        after_url = None
+        while True:
+            items = await fetch_items_for_migration(after_url, args.batch_size)
+            if not items:
+                break
+            after_url = items[-1]["url"]
+            
+            if args.mode == "truncate":
+                text_vecs = [truncate_vector(item.get("text_embedding"), args.dim) for item in items]
+                image_vecs = [truncate_vector(item.get("image_embedding"), args.dim) for item in items]
+                # 截断不改变来源：embed_model / embed_version / embed_dim 保持生成时的值
+                embed_tag = None
+            else:
+                text_vecs, image_vecs = await reembed_items(items)
+                embed_tag = embedding_tag()
+            
+            migrated += await write_staging_embeddings(
+                args.dim,
+                [(item["url"], text_vec, image_vec) for item, text_vec, image_vec in zip(items, text_vecs, image_vecs)],
+                embed_tag=embed_tag,
+            )
+            print(f"[MigrateDim] Migrated {migrated} items...")
+        
+        await swap_staging_embedding_columns()
+        print(f"[MigrateDim] ✓ Done: {migrated} items now use vector({args.dim}).")
+        print(f"[MigrateDim] ✓ Restart the backend with EMBED_COLLECTION_DIMS='{{\"{namespace}\": {args.dim}}}'.")
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
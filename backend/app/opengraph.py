@@ -3,7 +3,6 @@ OpenGraph 抓取工具
 支持截图功能：当 OpenGraph 抓取失败或识别为文档类网页时，使用截图
 支持预取 Embedding：一旦 OpenGraph 数据解析完成，立即请求 embedding
 """
-import httpx
 from bs4 import BeautifulSoup
 from typing import Dict, List, Optional, Tuple
 import asyncio
@@ -213,7 +212,7 @@ async def fetch_opengraph(url: str, timeout: float = 10.0) -> Dict:
         "error": None,
         "needs_screenshot": False,  # 标记是否需要前端截图
     }
-
+    
     # 优先尝试抓取 OpenGraph（所有网页都先尝试 OpenGraph）
     # 只有 OpenGraph 失败且是文档类时，才使用截图/文档卡片
     try:
@@ -225,253 +224,258 @@ async def fetch_opengraph(url: str, timeout: float = 10.0) -> Dict:
             "Accept-Encoding": "gzip, deflate, br",
         }
         
-        # 小红书等需要 Referer
-        url_lower = url.lower()
-        if "xiaohongshu.com" in url_lower:
-            headers["Referer"] = "https://www.xiaohongshu.com/"
-            headers["Origin"] = "https://www.xiaohongshu.com"
+        # 共享连接池；按 host 限制并发和速率，并附加站点专用的 headers（见 politeness.py）
+        from search.http_client import get_fetch_client
+        from search.politeness import get_host_scheduler
         
-        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            
-            # 🔍 诊断日志：记录关键信息（用于定位环境/风控问题）
-            print(f"[OpenGraph] ====== 诊断信息开始 ======")
-            print(f"[OpenGraph] Request URL: {url}")
-            print(f"[OpenGraph] Final URL: {response.url}")
-            print(f"[OpenGraph] Status Code: {response.status_code}")
-            print(f"[OpenGraph] Response Length: {len(response.text)} bytes")
-            
-            # 记录请求 headers（用于对比本地和云端）
-            print(f"[OpenGraph] Request Headers:")
-            for k, v in headers.items():
+        scheduler = get_host_scheduler()
+        headers = scheduler.request_headers(url, headers)
+        async with scheduler.slot(url) as host:
+            response = await get_fetch_client().get(url, headers=headers, timeout=timeout)
+            host.record(response.status_code, response.headers.get("retry-after"))
+        response.raise_for_status()
+        
+        # 🔍 诊断日志：记录关键信息（用于定位环境/风控问题）
+        print(f"[OpenGraph] ====== 诊断信息开始 ======")
+        print(f"[OpenGraph] Request URL: {url}")
+        print(f"[OpenGraph] Final URL: {response.url}")
+        print(f"[OpenGraph] Status Code: {response.status_code}")
+        print(f"[OpenGraph] Response Length: {len(response.text)} bytes")
+        
+        # 记录请求 headers（用于对比本地和云端）
+        print(f"[OpenGraph] Request Headers:")
+        for k, v in headers.items():
+            print(f"[OpenGraph]   {k}: {v}")
+        
+        # 记录响应 headers（检查是否有重定向、限制等）
+        print(f"[OpenGraph] Response Headers (关键):")
+        important_headers = ['content-type', 'content-length', 'location', 'x-ratelimit', 'cf-ray', 'server']
+        for k, v in response.headers.items():
+            if any(h in k.lower() for h in important_headers):
                 print(f"[OpenGraph]   {k}: {v}")
-            
-            # 记录响应 headers（检查是否有重定向、限制等）
-            print(f"[OpenGraph] Response Headers (关键):")
-            important_headers = ['content-type', 'content-length', 'location', 'x-ratelimit', 'cf-ray', 'server']
-            for k, v in response.headers.items():
-                if any(h in k.lower() for h in important_headers):
-                    print(f"[OpenGraph]   {k}: {v}")
-            
-            # 检查响应内容（判断是否被拦截）
-            response_preview = response.text[:1000]
-            print(f"[OpenGraph] Response Preview (first 1000 chars):")
-            print(f"[OpenGraph] {response_preview}")
-            
-            # 检查是否被重定向到错误页面或拦截页面
-            if any(keyword in response_preview.lower() for keyword in ['access denied', 'blocked', 'captcha', '403', 'forbidden']):
-                print(f"[OpenGraph] ⚠️  警告：响应可能被拦截或限制")
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 检查是否有 OG 标签
-            og_title_tag = soup.find('meta', property='og:title')
-            og_image_tag = soup.find('meta', property='og:image')
-            og_description_tag = soup.find('meta', property='og:description')
-            
-            print(f"[OpenGraph] OG Tags Detection:")
-            print(f"[OpenGraph]   OG Title: {'✅ Found' if og_title_tag else '❌ Not Found'}")
-            if og_title_tag:
-                title_content = og_title_tag.get('content', '')[:100]
-                print(f"[OpenGraph]     Content: {title_content}")
-            print(f"[OpenGraph]   OG Image: {'✅ Found' if og_image_tag else '❌ Not Found'}")
-            if og_image_tag:
-                image_content = og_image_tag.get('content', '')[:100]
-                print(f"[OpenGraph]     Content: {image_content}")
-            print(f"[OpenGraph]   OG Description: {'✅ Found' if og_description_tag else '❌ Not Found'}")
-            
-            # 检查是否有 JSON-LD
-            jsonld_tags = soup.select('script[type="application/ld+json"]')
-            print(f"[OpenGraph] JSON-LD scripts: {len(jsonld_tags)} found")
-            if jsonld_tags:
-                for i, tag in enumerate(jsonld_tags[:2]):  # 只打印前2个
-                    try:
-                        jsonld_data = json.loads(tag.string or "{}")
-                        keys = list(jsonld_data.keys())[:10]
-                        print(f"[OpenGraph]   JSON-LD #{i+1} keys: {keys}")
-                        # 检查是否有图片或标题
-                        if 'image' in jsonld_data or 'name' in jsonld_data:
-                            print(f"[OpenGraph]     Contains image/name data: ✅")
-                    except Exception as e:
-                        print(f"[OpenGraph]     JSON-LD #{i+1} parse error: {e}")
-            
-            # Pinterest 特定检查
-            if "pinterest.com" in url.lower():
-                print(f"[OpenGraph] Pinterest-specific checks:")
-                pinimg_images = soup.select('img[src*="pinimg.com"], img[data-src*="pinimg.com"]')
-                print(f"[OpenGraph]   pinimg.com images: {len(pinimg_images)} found")
-                if pinimg_images:
-                    first_img = pinimg_images[0].get('src') or pinimg_images[0].get('data-src')
-                    print(f"[OpenGraph]     First image: {first_img[:80] if first_img else 'None'}")
-                
-                # 检查是否有 Pinterest 的 JavaScript 数据
-                scripts_with_pinterest = [s for s in soup.select('script') if s.string and ('pinimg' in s.string.lower() or 'pinterest' in s.string.lower())]
-                print(f"[OpenGraph]   Scripts with Pinterest data: {len(scripts_with_pinterest)}")
-            
-            print(f"[OpenGraph] ====== 诊断信息结束 ======")
-            
-            # 提取 OpenGraph 标签
-            og_title = soup.find('meta', property='og:title')
-            og_description = soup.find('meta', property='og:description')
-            og_image = soup.find('meta', property='og:image')
-            og_image_width = soup.find('meta', property='og:image:width')
-            og_image_height = soup.find('meta', property='og:image:height')
-            og_site_name = soup.find('meta', property='og:site_name')
-            
-            # 提取标准 meta 标签作为后备
-            meta_title = soup.find('meta', attrs={'name': 'title'}) or soup.find('title')
-            meta_description = soup.find('meta', attrs={'name': 'description'})
-            
-            result["title"] = (
-                og_title.get('content', '') if og_title else
-                (meta_title.string if meta_title and hasattr(meta_title, 'string') else meta_title.get('content', '')) if meta_title else
-                url
-            )
-            
-            result["description"] = (
-                og_description.get('content', '') if og_description else
-                meta_description.get('content', '') if meta_description else
-                ''
-            )
-            
-            # 使用多层取图策略
-            image_url, image_source = get_best_image_candidate(soup, response.url)
-            
-            if image_url:
-                # 找到了图片（首图或 OG/Twitter Card），不需要截图
-                result["image"] = image_url
-                result["needs_screenshot"] = False  # 明确设置为 False
-                print(f"[OpenGraph] Found image via {image_source}: {image_url[:80]}...")
-            else:
-                # 所有 HTML 层都没有找到图片，标记需要截图
-                result["image"] = ""
-                result["needs_screenshot"] = True
-                print(f"[OpenGraph] No image found in HTML, marking needs_screenshot=True")
-            
-            # 提取图片尺寸（如果 OpenGraph 提供了）
-            if og_image_width and og_image_width.get('content'):
+        
+        # 检查响应内容（判断是否被拦截）
+        response_preview = response.text[:1000]
+        print(f"[OpenGraph] Response Preview (first 1000 chars):")
+        print(f"[OpenGraph] {response_preview}")
+        
+        # 检查是否被重定向到错误页面或拦截页面
+        if any(keyword in response_preview.lower() for keyword in ['access denied', 'blocked', 'captcha', '403', 'forbidden']):
+            print(f"[OpenGraph] ⚠️  警告：响应可能被拦截或限制")
+        
+        soup = BeautifulSoup(response.text, 'html.parser')
+        
+        # 检查是否有 OG 标签
+        og_title_tag = soup.find('meta', property='og:title')
+        og_image_tag = soup.find('meta', property='og:image')
+        og_description_tag = soup.find('meta', property='og:description')
+        
+        print(f"[OpenGraph] OG Tags Detection:")
+        print(f"[OpenGraph]   OG Title: {'✅ Found' if og_title_tag else '❌ Not Found'}")
+        if og_title_tag:
+            title_content = og_title_tag.get('content', '')[:100]
+            print(f"[OpenGraph]     Content: {title_content}")
+        print(f"[OpenGraph]   OG Image: {'✅ Found' if og_image_tag else '❌ Not Found'}")
+        if og_image_tag:
+            image_content = og_image_tag.get('content', '')[:100]
+            print(f"[OpenGraph]     Content: {image_content}")
+        print(f"[OpenGraph]   OG Description: {'✅ Found' if og_description_tag else '❌ Not Found'}")
+        
+        # 检查是否有 JSON-LD
+        jsonld_tags = soup.select('script[type="application/ld+json"]')
+        print(f"[OpenGraph] JSON-LD scripts: {len(jsonld_tags)} found")
+        if jsonld_tags:
+            for i, tag in enumerate(jsonld_tags[:2]):  # 只打印前2个
                 try:
-                    result["image_width"] = int(og_image_width.get('content'))
-                except (ValueError, TypeError):
-                    result["image_width"] = None
-            else:
+                    jsonld_data = json.loads(tag.string or "{}")
+                    keys = list(jsonld_data.keys())[:10]
+                    print(f"[OpenGraph]   JSON-LD #{i+1} keys: {keys}")
+                    # 检查是否有图片或标题
+                    if 'image' in jsonld_data or 'name' in jsonld_data:
+                        print(f"[OpenGraph]     Contains image/name data: ✅")
+                except Exception as e:
+                    print(f"[OpenGraph]     JSON-LD #{i+1} parse error: {e}")
+        
+        # Pinterest 特定检查
+        if "pinterest.com" in url.lower():
+            print(f"[OpenGraph] Pinterest-specific checks:")
+            pinimg_images = soup.select('img[src*="pinimg.com"], img[data-src*="pinimg.com"]')
+            print(f"[OpenGraph]   pinimg.com images: {len(pinimg_images)} found")
+            if pinimg_images:
+                first_img = pinimg_images[0].get('src') or pinimg_images[0].get('data-src')
+                print(f"[OpenGraph]     First image: {first_img[:80] if first_img else 'None'}")
+            
+            # 检查是否有 Pinterest 的 JavaScript 数据
+            scripts_with_pinterest = [s for s in soup.select('script') if s.string and ('pinimg' in s.string.lower() or 'pinterest' in s.string.lower())]
+            print(f"[OpenGraph]   Scripts with Pinterest data: {len(scripts_with_pinterest)}")
+        
+        print(f"[OpenGraph] ====== 诊断信息结束 ======")
+        
+        # 提取 OpenGraph 标签
+        og_title = soup.find('meta', property='og:title')
+        og_description = soup.find('meta', property='og:description')
+        og_image = soup.find('meta', property='og:image')
+        og_image_width = soup.find('meta', property='og:image:width')
+        og_image_height = soup.find('meta', property='og:image:height')
+        og_site_name = soup.find('meta', property='og:site_name')
+        
+        # 提取标准 meta 标签作为后备
+        meta_title = soup.find('meta', attrs={'name': 'title'}) or soup.find('title')
+        meta_description = soup.find('meta', attrs={'name': 'description'})
+        
+        result["title"] = (
+            og_title.get('content', '') if og_title else
+            (meta_title.string if meta_title and hasattr(meta_title, 'string') else meta_title.get('content', '')) if meta_title else
+            url
+        )
+        
+        result["description"] = (
+            og_description.get('content', '') if og_description else
+            meta_description.get('content', '') if meta_description else
+            ''
+        )
+        
+        # 使用多层取图策略
+        image_url, image_source = get_best_image_candidate(soup, response.url)
+        
+        if image_url:
+            # 找到了图片（首图或 OG/Twitter Card），不需要截图
+            result["image"] = image_url
+            result["needs_screenshot"] = False  # 明确设置为 False
+            print(f"[OpenGraph] Found image via {image_source}: {image_url[:80]}...")
+        else:
+            # 所有 HTML 层都没有找到图片，标记需要截图
+            result["image"] = ""
+            result["needs_screenshot"] = True
+            print(f"[OpenGraph] No image found in HTML, marking needs_screenshot=True")
+        
+        # 提取图片尺寸（如果 OpenGraph 提供了）
+        if og_image_width and og_image_width.get('content'):
+            try:
+                result["image_width"] = int(og_image_width.get('content'))
+            except (ValueError, TypeError):
                 result["image_width"] = None
-                
-            if og_image_height and og_image_height.get('content'):
-                try:
-                    result["image_height"] = int(og_image_height.get('content'))
-                except (ValueError, TypeError):
-                    result["image_height"] = None
-            else:
+        else:
+            result["image_width"] = None
+        
+        if og_image_height and og_image_height.get('content'):
+            try:
+                result["image_height"] = int(og_image_height.get('content'))
+            except (ValueError, TypeError):
                 result["image_height"] = None
-            
-            # 如果 OpenGraph 没有提供尺寸，尝试从图片 URL 获取实际尺寸
-            # 注意：对于小红书、Pinterest 等需要特殊 headers 的网站，跳过验证，保留 URL 让前端浏览器加载
-            if result["image"] and result["image"].startswith(('http://', 'https://')) and (not result["image_width"] or not result["image_height"]):
-                # 检查是否为需要跳过验证的网站（这些网站的 CDN 可能对后端 IP 403，但浏览器可以正常加载）
-                image_url_lower = result["image"].lower()
-                url_lower = url.lower()
-                
-                is_xhs = ("xiaohongshu.com" in image_url_lower or 
-                         "picasso-static.xiaohongshu.com" in image_url_lower or
-                         "xhscdn.com" in image_url_lower or
-                         "sns-webpic-qc.xhscdn.com" in image_url_lower)
-                
-                is_pinterest = ("pinterest.com" in url_lower or 
-                               "pinimg.com" in image_url_lower or
-                               "pinterest" in image_url_lower)
-                
-                # 对于需要特殊处理的网站，跳过图片尺寸验证，保留 URL 让前端浏览器加载
-                if is_xhs:
-                    print(f"[OpenGraph] Skipping image size validation for XHS (preserving URL for frontend): {result['image'][:80]}...")
-                elif is_pinterest:
-                    print(f"[OpenGraph] Skipping image size validation for Pinterest (preserving URL for frontend): {result['image'][:80]}...")
-                else:
-                    # 其他网站，尝试获取图片尺寸
-                    try:
-                        from PIL import Image
-                        from io import BytesIO
-                        
-                        # 构建 headers（为 Pinterest 添加 Referer）
-                        headers = {
-                            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                            "Accept": "image/webp,image/apng,image/*,*/*;q=0.8",
-                            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-                            "Referer": url,  # 添加 Referer，帮助某些网站（如 Pinterest）正确加载图片
-                            "Origin": url.split('/')[0] + '//' + url.split('/')[2] if '/' in url else url,
-                        }
-                        
-                        async with httpx.AsyncClient(timeout=5.0) as img_client:
-                            img_response = await img_client.get(result["image"], headers=headers)
-                            if img_response.status_code == 200:
-                                img_data = BytesIO(img_response.content)
-                                img = Image.open(img_data)
-                                w, h = img.size
-                                result["image_width"] = w
-                                result["image_height"] = h
-                                print(f"[OpenGraph] Fetched image dimensions from URL: {w}x{h} for {url[:60]}...")
-                    except Exception as e:
-                        # 获取图片尺寸失败不影响主流程，只记录日志
-                        # 重要：不要清空 result["image"]，保留 URL 让前端浏览器加载
-                        print(f"[OpenGraph] Failed to fetch image dimensions from URL for {url[:60]}...: {str(e)} (preserving image URL)")
-            
-            result["site_name"] = og_site_name.get('content', '') if og_site_name else ''
-            
-            # 如果 OpenGraph 抓取成功且有图片，立即预取 embedding
-            if result["image"]:
-                result["success"] = True
-                # 立即预取 embedding（等待完成，确保返回时已有 embedding）
-                await _prefetch_embedding(result)
-                return result
-            
-            # 如果 OpenGraph 抓取成功但无图片，检查是否为文档类
-            # 只有文档类才使用文档卡片，普通网页即使没有图片也返回成功
-            is_doc_like = _is_doc_like_url(url)
-            if is_doc_like:
-                print(f"[OpenGraph] No og:image found for doc-like URL, generating doc card: {url[:60]}...")
+        else:
+            result["image_height"] = None
+        
+        # 如果 OpenGraph 没有提供尺寸，尝试从图片 URL 获取实际尺寸
+        # 注意：对于小红书、Pinterest 等需要特殊 headers 的网站，跳过验证，保留 URL 让前端浏览器加载
+        if result["image"] and result["image"].startswith(('http://', 'https://')) and (not result["image_width"] or not result["image_height"]):
+            # 检查是否为需要跳过验证的网站（这些网站的 CDN 可能对后端 IP 403，但浏览器可以正常加载）
+            image_url_lower = result["image"].lower()
+            url_lower = url.lower()
+            
+            is_xhs = ("xiaohongshu.com" in image_url_lower or 
+                     "picasso-static.xiaohongshu.com" in image_url_lower or
+                     "xhscdn.com" in image_url_lower or
+                     "sns-webpic-qc.xhscdn.com" in image_url_lower)
+            
+            is_pinterest = ("pinterest.com" in url_lower or 
+                           "pinimg.com" in image_url_lower or
+                           "pinterest" in image_url_lower)
+            
+            # 对于需要特殊处理的网站，跳过图片尺寸验证，保留 URL 让前端浏览器加载
+            if is_xhs:
+                print(f"[OpenGraph] Skipping image size validation for XHS (preserving URL for frontend): {result['image'][:80]}...")
+            elif is_pinterest:
+                print(f"[OpenGraph] Skipping image size validation for Pinterest (preserving URL for frontend): {result['image'][:80]}...")
+            else:
+                # 其他网站，尝试获取图片尺寸
                 try:
-                    from doc_card_generator import generate_doc_card_data_uri, detect_doc_type
-                    from urllib.parse import urlparse
-                    
-                    parsed = urlparse(url)
-                    site_name = result.get("site_name") or parsed.netloc or ""
-                    if site_name.startswith("www."):
-                        site_name = site_name[4:]
+                    from search.downloader import probe_image_size
+                    from search.image_cache import get_image_cache
+                    from search.preprocess import load_image
                     
-                    if not result.get("title") or result["title"] == url:
-                        path_parts = [p for p in parsed.path.split("/") if p]
-                        result["title"] = path_parts[-1] if path_parts else site_name or url
+                    # 构建 headers（为 Pinterest 添加 Referer）
+                    headers = {
+                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                        "Accept": "image/webp,image/apng,image/*,*/*;q=0.8",
+                        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+                        "Referer": url,  # 添加 Referer，帮助某些网站（如 Pinterest）正确加载图片
+                        "Origin": url.split('/')[0] + '//' + url.split('/')[2] if '/' in url else url,
+                    }
                     
-                    if not result.get("site_name"):
-                        result["site_name"] = site_name
-                    
-                    doc_card_data_uri = generate_doc_card_data_uri(
-                        title=result["title"],
-                        url=url,
-                        site_name=result["site_name"],
-                        description=result.get("description", ""),
-                    )
-                    
-                    result["image"] = doc_card_data_uri
-                    result["is_doc_card"] = True
-                    result["success"] = True
-                    result["doc_type"] = detect_doc_type(url, result["site_name"]).get("type", "网页")
-                    # 文档卡片使用固定尺寸（200x150）
-                    result["image_width"] = 200
-                    result["image_height"] = 150
-                    # 立即预取 embedding（等待完成，确保返回时已有 embedding）
-                    await _prefetch_embedding(result)
-                except Exception as card_error:
-                    result["error"] = f"OpenGraph 无图片，卡片生成失败: {str(card_error)}"
-                    result["success"] = False
-            else:
-                # 普通网页即使没有图片，也算成功（返回 OpenGraph 数据，前端可以显示标题等）
+                    if get_image_cache() is not None:
+                        # 完整下载并写入图片缓存（记录原图尺寸），随后的 embedding 预取直接命中缓存
+                        cached = await load_image(result["image"], headers=headers, timeout=5.0)
+                        size = (cached.width, cached.height) if cached else None
+                    else:
+                        # 共享连接池，只读取图片头部（解析出尺寸即断开）
+                        size = await probe_image_size(result["image"], headers=headers, timeout=5.0)
+                    if size:
+                        w, h = size
+                        result["image_width"] = w
+                        result["image_height"] = h
+                        print(f"[OpenGraph] Fetched image dimensions from URL: {w}x{h} for {url[:60]}...")
+                except Exception as e:
+                    # 获取图片尺寸失败不影响主流程，只记录日志
+                    # 重要：不要清空 result["image"]，保留 URL 让前端浏览器加载
+                    print(f"[OpenGraph] Failed to fetch image dimensions from URL for {url[:60]}...: {str(e)} (preserving image URL)")
+        
+        result["site_name"] = og_site_name.get('content', '') if og_site_name else ''
+        
+        # 如果 OpenGraph 抓取成功且有图片，立即预取 embedding
+        if result["image"]:
+            result["success"] = True
+            # 立即预取 embedding（等待完成，确保返回时已有 embedding）
+            await _prefetch_embedding(result)
+            return result
+        
+        # 如果 OpenGraph 抓取成功但无图片，检查是否为文档类
+        # 只有文档类才使用文档卡片，普通网页即使没有图片也返回成功
+        is_doc_like = _is_doc_like_url(url)
+        if is_doc_like:
+            print(f"[OpenGraph] No og:image found for doc-like URL, generating doc card: {url[:60]}...")
+            try:
+                from doc_card_generator import generate_doc_card_data_uri, detect_doc_type
+                from urllib.parse import urlparse
+                
+                parsed = urlparse(url)
+                site_name = result.get("site_name") or parsed.netloc or ""
+                if site_name.startswith("www."):
+                    site_name = site_name[4:]
+                
+                if not result.get("title") or result["title"] == url:
+                    path_parts = [p for p in parsed.path.split("/") if p]
+                    result["title"] = path_parts[-1] if path_parts else site_name or url
+                
+                if not result.get("site_name"):
+                    result["site_name"] = site_name
+                
+                doc_card_data_uri = generate_doc_card_data_uri(
+                    title=result["title"],
+                    url=url,
+                    site_name=result["site_name"],
+                    description=result.get("description", ""),
+                )
+                
+                result["image"] = doc_card_data_uri
+                result["is_doc_card"] = True
                 result["success"] = True
+                result["doc_type"] = detect_doc_type(url, result["site_name"]).get("type", "网页")
+                # 文档卡片使用固定尺寸（200x150）
+                result["image_width"] = 200
+                result["image_height"] = 150
                 # 立即预取 embedding（等待完成，确保返回时已有 embedding）
                 await _prefetch_embedding(result)
-                return result
-            
+            except Exception as card_error:
+                result["error"] = f"OpenGraph 无图片，卡片生成失败: {str(card_error)}"
+                result["success"] = False
+        else:
+            # 普通网页即使没有图片，也算成功（返回 OpenGraph 数据，前端可以显示标题等）
+            result["success"] = True
+            # 立即预取 embedding（等待完成，确保返回时已有 embedding）
+            await _prefetch_embedding(result)
+            return result
+    
     except Exception as e:
         result["error"] = str(e)
         result["success"] = False
@@ -526,101 +530,127 @@ async def _prefetch_embedding(result: Dict) -> None:
     Args:
         result: OpenGraph 结果字典（会被更新，添加 text_embedding 和 image_embedding）
     """
-    try:
-        # 延迟导入，避免循环依赖
-        from search.embed import embed_text, embed_image
-        from search.preprocess import download_image, process_image, extract_text_from_item
-        from vector_db import get_opengraph_item, upsert_opengraph_item
-        
-        url = result.get("url", "")
-        if not url:
-            return
-        
-        # 先检查数据库是否已有该 URL 的数据（包括 embedding）
-        existing_item = await get_opengraph_item(url)
-        if existing_item and (existing_item.get("text_embedding") or existing_item.get("image_embedding")):
-            # 数据库已有 embedding，直接使用
-            print(f"[OpenGraph] ✓ Found existing embeddings in DB for: {url[:60]}...")
-            result["text_embedding"] = existing_item.get("text_embedding")
-            result["image_embedding"] = existing_item.get("image_embedding")
-            return
-        
-        # 数据库没有，需要生成 embedding
-        title = result.get("title", "")
-        description = result.get("description", "")
-        image = result.get("image", "")
-        is_screenshot = result.get("is_screenshot", False)
-        
-        # 使用 pipeline 的文本提取逻辑
-        text_content = extract_text_from_item(result)
-        if not text_content:
-            text_content = url  # 如果没有标题和描述，使用 URL
-        
-        # 异步生成文本和图像 embedding
-        print(f"[OpenGraph] Generating embeddings for: {url[:60]}...")
-        
-        # 生成文本 embedding
-        text_emb = None
-        if text_content:
-            try:
-                text_emb = await embed_text(text_content)
-                if text_emb:
-                    result["text_embedding"] = text_emb
-                    print(f"[OpenGraph] ✓ Text embedding generated: {len(text_emb)} dims")
-            except Exception as e:
-                print(f"[OpenGraph] ⚠ Text embedding failed: {e}")
-        
-        # 生成图像 embedding
-        image_emb = None
-        if image:
-            try:
-                # 处理图像：如果是 URL 需要下载，如果是 Base64 直接使用
-                if isinstance(image, str) and image.startswith("data:image"):
-                    # 已经是 Base64 格式
-                    image_emb = await embed_image(image)
-                else:
-                    # 是 URL，需要下载并处理
-                    image_data = await download_image(image)
-                    if image_data:
-                        img_b64 = process_image(image_data)
-                        if img_b64:
-                            image_emb = await embed_image(img_b64)
+    from search.priority import BACKGROUND, embed_priority
+    
+    # 预取以 background 优先级请求 embedding，不挤占搜索查询的上游名额
+    with embed_priority(BACKGROUND):
+        try:
+            # 延迟导入，避免循环依赖
+            from search.config import INGEST_EMBED_MODE, INGEST_FUSED_TEXT_WEIGHT
+            from search.embed import embed_text, embed_image, embed_text_image, embedding_tag
+            from search.vectors import fuse_vectors
+            from search.fuse import FUSED_EMBEDDING_MODE
+            from search.preprocess import download_image, process_image_async, extract_text_from_item
+            from search.fingerprint import reusable_vectors
+            from vector_db import get_stored_embeddings, upsert_opengraph_item
+            
+            url = result.get("url", "")
+            if not url:
+                return
+            
+            # 先检查数据库是否已有该 URL 的 embedding，且内容指纹（标题 / 描述 / 图片）未变化
+            stored = await get_stored_embeddings([url])
+            reuse = reusable_vectors(result, stored.get(url))
+            if "text_embedding" in reuse and ("image_embedding" in reuse or not result.get("image")):
+                # 内容未变化，直接使用数据库中的 embedding
+                print(f"[OpenGraph] ✓ Found existing embeddings in DB for: {url[:60]}...")
+                result.update(reuse)
+                return
+            
+            # 数据库没有，需要生成 embedding
+            title = result.get("title", "")
+            description = result.get("description", "")
+            image = result.get("image", "")
+            is_screenshot = result.get("is_screenshot", False)
+            
+            # 使用 pipeline 的文本提取逻辑
+            text_content = extract_text_from_item(result)
+            if not text_content:
+                text_content = url  # 如果没有标题和描述，使用 URL
+            
+            # 异步生成文本和图像 embedding
+            print(f"[OpenGraph] Generating embeddings for: {url[:60]}...")
+            embed_model, embed_version = embedding_tag()
+            
+            # 处理图像：如果是 URL 需要下载，如果是 Base64 直接使用
+            image_input = None
+            if image:
+                try:
+                    if isinstance(image, str) and image.startswith("data:image"):
+                        image_input = image
+                    else:
+                        image_data = await download_image(image)
+                        if image_data:
+                            image_input = await process_image_async(image_data)
+                except Exception as e:
+                    print(f"[OpenGraph] ⚠ Image preprocessing failed: {e}")
+            
+            text_emb = None
+            image_emb = None
+            if INGEST_EMBED_MODE in ("paired", "fused") and text_content and image_input:
+                # 文本和图像合并为一次请求
+                try:
+                    text_emb, image_emb = await embed_text_image(text_content, image_input)
+                    if INGEST_EMBED_MODE == "fused" and text_emb is not None and image_emb is not None:
+                        # 融合向量只存一份（text_embedding），检索时按 embedding_mode 单独处理
+                        text_emb, image_emb = fuse_vectors(text_emb, image_emb, INGEST_FUSED_TEXT_WEIGHT), None
+                        result["embedding_mode"] = FUSED_EMBEDDING_MODE
+                except Exception as e:
+                    print(f"[OpenGraph] ⚠ Joint embedding failed: {e}")
+            else:
+                # 生成文本 embedding
+                if text_content:
+                    try:
+                        text_emb = await embed_text(text_content)
+                    except Exception as e:
+                        print(f"[OpenGraph] ⚠ Text embedding failed: {e}")
                 
-                if image_emb:
-                    result["image_embedding"] = image_emb
-                    print(f"[OpenGraph] ✓ Image embedding generated: {len(image_emb)} dims")
-            except Exception as e:
-                print(f"[OpenGraph] ⚠ Image embedding failed: {e}")
-        
-        # 存储到向量数据库
-        if text_emb or image_emb:
-            success = await upsert_opengraph_item(
-                url=url,
-                title=title,
-                description=description,
-                image=image,
-                site_name=result.get("site_name"),
-                tab_id=result.get("tab_id"),
-                tab_title=result.get("tab_title"),
-                text_embedding=text_emb,
-                image_embedding=image_emb,
-                metadata={
-                    "is_doc_card": result.get("is_doc_card", False),
-                    "success": result.get("success", False),
-                }
-            )
-            if success:
-                print(f"[OpenGraph] ✓ Stored embeddings to DB for: {url[:60]}...")
+                # 生成图像 embedding
+                if image_input:
+                    try:
+                        image_emb = await embed_image(image_input)
+                    except Exception as e:
+                        print(f"[OpenGraph] ⚠ Image embedding failed: {e}")
+            
+            if text_emb is not None:
+                result["text_embedding"] = text_emb
+                print(f"[OpenGraph] ✓ Text embedding generated: {len(text_emb)} dims")
+            if image_emb is not None:
+                result["image_embedding"] = image_emb
+                print(f"[OpenGraph] ✓ Image embedding generated: {len(image_emb)} dims")
+            
+            # 存储到向量数据库
+            if text_emb is not None or image_emb is not None:
+                success = await upsert_opengraph_item(
+                    url=url,
+                    title=title,
+                    description=description,
+                    image=image,
+                    site_name=result.get("site_name"),
+                    tab_id=result.get("tab_id"),
+                    tab_title=result.get("tab_title"),
+                    text_embedding=text_emb,
+                    image_embedding=image_emb,
+                    metadata={
+                        "is_doc_card": result.get("is_doc_card", False),
+                        "success": result.get("success", False),
+                        **({"embedding_mode": result["embedding_mode"]} if result.get("embedding_mode") else {}),
+                    },
+                    embed_model=embed_model,
+                    embed_version=embed_version,
+                )
+                if success:
+                    print(f"[OpenGraph] ✓ Stored embeddings to DB for: {url[:60]}...")
+                else:
+                    print(f"[OpenGraph] ⚠ Failed to store embeddings to DB for: {url[:60]}...")
             else:
-                print(f"[OpenGraph] ⚠ Failed to store embeddings to DB for: {url[:60]}...")
-        else:
-            print(f"[OpenGraph] ⚠ No embeddings generated for: {url[:60]}...")
-            
-    except Exception as e:
-        # 预取失败不影响主流程，只记录日志
-        print(f"[OpenGraph] ⚠ Failed to pre-fetch embeddings for {result.get('url', '')[:60]}...: {str(e)}")
-        import traceback
-        traceback.print_exc()
+                print(f"[OpenGraph] ⚠ No embeddings generated for: {url[:60]}...")
+        
+        except Exception as e:
+            # 预取失败不影响主流程，只记录日志
+            print(f"[OpenGraph] ⚠ Failed to pre-fetch embeddings for {result.get('url', '')[:60]}...: {str(e)}")
+            import traceback
+            traceback.print_exc()
 
 
 async def fetch_multiple_opengraph(urls: List[str]) -> List[Dict]:
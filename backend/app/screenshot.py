@@ -166,43 +166,18 @@ def process_screenshot_to_base64(screenshot_bytes: bytes, max_dimension: int = 1
     Returns:
         Base64 编码的图片字符串（data:image/jpeg;base64,xxx 格式），失败返回 None
     """
+    from search.config import IMAGE_REDUCING_GAP
+    from search.preprocess import encode_jpeg, to_rgb
+    
     try:
         img = Image.open(BytesIO(screenshot_bytes))
-        w, h = img.size
-        
-        # 如果太大，进行缩放
-        if w > max_dimension or h > max_dimension:
-            if w > h:
-                nw, nh = max_dimension, int(h * (max_dimension / w))
-            else:
-                nh, nw = max_dimension, int(w * (max_dimension / h))
-            img = img.resize((nw, nh), Image.Resampling.LANCZOS)
-            w, h = nw, nh
-        
-        # 转换为 RGB（PNG 可能是 RGBA）
-        if img.mode in ("RGBA", "LA", "P"):
-            bg = Image.new("RGB", img.size, (255, 255, 255))
-            if img.mode == "P":
-                img = img.convert("RGBA")
-            bg.paste(img, mask=img.split()[-1] if img.mode == "RGBA" else None)
-            img = bg
-        elif img.mode != "RGB":
-            img = img.convert("RGB")
         
-        # 压缩为 JPEG
-        out = BytesIO()
-        img.save(out, format="JPEG", quality=SCREENSHOT_QUALITY, optimize=True)
-        b = out.getvalue()
+        # 如果太大，一次缩放到目标尺寸（保持宽高比，先整数倍 reduce 再 LANCZOS）
+        img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS, reducing_gap=IMAGE_REDUCING_GAP)
         
-        # 如果还是太大，进一步降低质量
-        max_size = 5 * 1024 * 1024  # 5MB
-        if len(b) > max_size:
-            for q in (70, 60, 50, 40):
-                out = BytesIO()
-                img.save(out, format="JPEG", quality=q, optimize=True)
-                b = out.getvalue()
-                if len(b) <= max_size:
-                    break
+        # 转换为 RGB（PNG 可能是 RGBA）后压缩为 JPEG；超过 5MB 时按预测的质量档位重新编码，
+        # 最低质量仍超过 5MB 时照常返回（截图不丢弃）
+        b = encode_jpeg(to_rgb(img), 5 * 1024 * 1024, quality=SCREENSHOT_QUALITY, allow_oversize=True)
         
         # 转换为 Base64
         b64 = base64.b64encode(b).decode("utf-8")
@@ -236,5 +211,7 @@ async def get_screenshot_as_base64(url: str, wait_time: float = 2.0) -> Optional
     if not screenshot_bytes:
         return None
     
-    return process_screenshot_to_base64(screenshot_bytes)
+    # 解码、缩放和 JPEG 编码在图片执行池中进行，不阻塞事件循环
+    from search.image_pool import run_image_task
+    return await run_image_task(process_screenshot_to_base64, screenshot_bytes)
 
@@ -1,8 +1,9 @@
-from .pipeline import process_opengraph_for_search, search_relevant_items
+from .pipeline import process_opengraph_for_search, iter_opengraph_for_search, search_relevant_items
 from .config import DEFAULT_WEIGHTS
 
 __all__ = [
     "process_opengraph_for_search",
+    "iter_opengraph_for_search",
     "search_relevant_items",
     "DEFAULT_WEIGHTS",
 ]
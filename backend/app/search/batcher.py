@@ -0,0 +1,84 @@
+"""
+跨请求的 Embedding 微批处理模块
+把短时间窗口内（默认几毫秒）各个请求发起的单条 embedding 调用合并成一次上游请求，
+再把结果分发回每个调用方的 future
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from . import metrics
+
+SendBatch = Callable[[List[dict]], Awaitable[List[Optional[np.ndarray]]]]
+
+
+class MicroBatcher:
+    """
+    动态微批处理器
+    
+    - submit() 把单条 content 放入队列并等待结果
+    - 队列达到 max_items 时立即发送；否则等待 window_s 后发送
+    - 每次发送作为独立任务执行，多个批次可以并发在途
+    """
+
+    def __init__(self, send_batch: SendBatch, window_s: float, max_items: int, name: str = "embed"):
+        self._send_batch = send_batch
+        self._window_s = window_s
+        self._max_items = max(1, max_items)
+        self._name = name
+        self._queue: List[Tuple[dict, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: set = set()
+        self.loop = asyncio.get_running_loop()
+        metrics.register_gauge(f"{name}_batcher_queue_depth", lambda: len(self._queue))
+
+    async def submit(self, content: dict) -> Optional[np.ndarray]:
+        fut = self.loop.create_future()
+        self._queue.append((content, fut, time.monotonic()))
+        if len(self._queue) >= self._max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(self._window_s, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue:
+            batch = self._queue[:self._max_items]
+            del self._queue[:self._max_items]
+            task = self.loop.create_task(self._send(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, batch: List[Tuple[dict, asyncio.Future, float]]):
+        # 调用方已取消的条目不再发送
+        batch = [entry for entry in batch if not entry[1].done()]
+        if not batch:
+            return
+        now = time.monotonic()
+        metrics.inc(f"{self._name}_batches_total")
+        metrics.observe(f"{self._name}_batch_size", len(batch))
+        for _, _, enqueued_at in batch:
+            metrics.observe(f"{self._name}_queue_wait_ms", (now - enqueued_at) * 1000.0)
+        
+        try:
+            vectors = await self._send_batch([content for content, _, _ in batch])
+        except Exception as e:
+            print(f"[Batcher] ERROR sending batch of {len(batch)}: {type(e).__name__}: {str(e)}")
+            vectors = [None] * len(batch)
+        
+        for (_, fut, _), vec in zip(batch, vectors):
+            if not fut.done():
+                fut.set_result(vec)
+
+    async def drain(self):
+        """立即发送队列中剩余的条目，并等待在途批次完成（用于 shutdown）"""
+        self._flush()
+        if self._inflight:
+            await asyncio.gather(*list(self._inflight), return_exceptions=True)
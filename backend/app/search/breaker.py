@@ -0,0 +1,96 @@
+"""
+熔断器
+上游连续失败（或连续慢响应）达到阈值后打开熔断，期间直接快速失败；
+冷却时间过后进入半开状态，只放行少量探测请求，探测成功则恢复，失败则重新打开
+"""
+from __future__ import annotations
+
+import time
+
+from . import metrics
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# 指标中的状态编码
+_STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    三态熔断器（closed / open / half_open）
+    
+    Args:
+        failure_threshold: 连续失败多少次后打开
+        slow_call_s: 超过该耗时的成功调用也记为失败（<= 0 表示不按耗时熔断）
+        open_s: 打开后的冷却时间，之后进入半开状态
+        half_open_max_calls: 半开状态下同时放行的探测请求数
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        slow_call_s: float = 0.0,
+        open_s: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.slow_call_s = slow_call_s
+        self.open_s = open_s
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        metrics.register_gauge(f"breaker_{name}_state", lambda: _STATE_CODES[self.state])
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_s:
+            self._state = HALF_OPEN
+            self._probes = 0
+            print(f"[Breaker] {self.name}: open -> half_open")
+        return self._state
+
+    def allow(self) -> bool:
+        """是否放行本次调用；放行后调用方必须调用 record_success / record_failure / record_ignored"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._probes < self.half_open_max_calls:
+            self._probes += 1
+            return True
+        metrics.inc(f"breaker_{self.name}_rejected")
+        return False
+
+    def record_success(self, latency_s: float = 0.0):
+        if self.slow_call_s > 0 and latency_s > self.slow_call_s:
+            print(f"[Breaker] {self.name}: slow call ({latency_s:.2f}s > {self.slow_call_s}s)")
+            self.record_failure()
+            return
+        if self._state == HALF_OPEN:
+            print(f"[Breaker] {self.name}: half_open -> closed")
+        self._state = CLOSED
+        self._failures = 0
+        self._probes = 0
+
+    def record_failure(self):
+        self._failures += 1
+        if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+            self._open()
+
+    def record_ignored(self):
+        """调用结束但不计入统计（例如请求本身无效），释放半开状态的探测名额"""
+        if self._state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def _open(self):
+        if self._state != OPEN:
+            print(f"[Breaker] {self.name}: {self._state} -> open (failures={self._failures})")
+            metrics.inc(f"breaker_{self.name}_opened")
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probes = 0
@@ -0,0 +1,127 @@
+"""
+按字节的准入控制（admission control）
+ingest 中每张图片（截图 Base64、下载的原图、解码后的像素）在处理期间占用预算；
+预算用尽时新的图片按配置等待（block）或直接跳过图像 embedding（shed），避免突发的截图批次撑爆内存
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from . import metrics
+from .config import INGEST_MAX_INFLIGHT_BYTES, INGEST_BUDGET_MODE, INGEST_BUDGET_MAX_WAIT_S
+
+BLOCK = "block"
+SHED = "shed"
+
+
+class Reservation:
+    """一次预算占用；admitted=False 表示被拒绝（shed），此时不占用任何字节"""
+
+    def __init__(self, budget: "ByteBudget", nbytes: int, admitted: bool):
+        self.budget = budget
+        self.nbytes = nbytes if admitted else 0
+        self.admitted = admitted
+
+    async def grow(self, nbytes: int) -> bool:
+        """实际占用超过预估时追加预算（例如下载完成后按真实大小），被拒绝时返回 False"""
+        extra = nbytes - self.nbytes
+        if not self.admitted or extra <= 0:
+            return self.admitted
+        if self.budget.try_acquire(extra):
+            self.nbytes = nbytes
+            return True
+        # 放不下时先归还已占用的部分再整体申请，避免多个条目互相持有预算等待（hold-and-wait 死锁）
+        await self.budget.release(self.nbytes)
+        self.nbytes = 0
+        self.admitted = await self.budget.acquire(nbytes)
+        if self.admitted:
+            self.nbytes = nbytes
+        return self.admitted
+
+
+class ByteBudget:
+    """
+    进程内字节预算
+    
+    - block：等待其他图片释放预算，最多 max_wait_s 秒（0 表示一直等待），超时后拒绝
+    - shed：预算不足时立即拒绝
+    单个请求超过总预算时，只要当前没有其他占用就放行，避免永远无法准入
+    """
+
+    def __init__(self, name: str, capacity: int, mode: str = BLOCK, max_wait_s: float = 0.0):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.mode = mode if mode in (BLOCK, SHED) else BLOCK
+        self.max_wait_s = max_wait_s
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+        metrics.register_gauge(f"{name}_inflight_bytes", lambda: self.in_flight)
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.in_flight == 0 or self.in_flight + nbytes <= self.capacity
+
+    def try_acquire(self, nbytes: int) -> bool:
+        """不等待：放得下就占用并返回 True"""
+        if not self._fits(nbytes):
+            return False
+        self.in_flight += nbytes
+        return True
+
+    async def acquire(self, nbytes: int) -> bool:
+        async with self._cond:
+            if not self._fits(nbytes):
+                if self.mode == SHED:
+                    metrics.inc(f"{self.name}_shed_total")
+                    return False
+                started = time.monotonic()
+                try:
+                    await asyncio.wait_for(
+                        self._cond.wait_for(lambda: self._fits(nbytes)),
+                        timeout=self.max_wait_s or None,
+                    )
+                except asyncio.TimeoutError:
+                    metrics.inc(f"{self.name}_shed_total")
+                    return False
+                finally:
+                    metrics.observe(f"{self.name}_wait_seconds", time.monotonic() - started)
+            self.in_flight += nbytes
+            return True
+
+    async def release(self, nbytes: int):
+        if nbytes <= 0:
+            return
+        # 先同步扣减，即使唤醒过程被取消也不会泄漏预算
+        self.in_flight = max(0, self.in_flight - nbytes)
+        async with self._cond:
+            self._cond.notify_all()
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int) -> AsyncIterator[Reservation]:
+        """
+        占用 nbytes 字节，退出时释放（包括 grow 追加的部分）
+            
+            async with budget.reserve(n) as r:
+                if not r.admitted: ...
+        """
+        reservation = Reservation(self, nbytes, await self.acquire(nbytes))
+        try:
+            yield reservation
+        finally:
+            await self.release(reservation.nbytes)
+
+
+# 图片 ingest 的预算（同一事件循环内所有 ingest 请求和后台任务共享；asyncio.Condition 绑定事件循环，循环变化时重新创建）
+_image_budget: Optional[ByteBudget] = None
+_image_budget_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_image_budget() -> ByteBudget:
+    global _image_budget, _image_budget_loop
+    loop = asyncio.get_running_loop()
+    if _image_budget is None or _image_budget_loop is not loop:
+        _image_budget_loop = loop
+        _image_budget = ByteBudget("ingest_image_budget", INGEST_MAX_INFLIGHT_BYTES, INGEST_BUDGET_MODE, INGEST_BUDGET_MAX_WAIT_S)
+    return _image_budget
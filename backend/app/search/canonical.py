@@ -0,0 +1,84 @@
+"""
+URL 规范化
+只差跟踪参数（utm_* 等）、普通锚点 fragment、末尾斜杠或 www. 的标签页视为同一页面：
+同一批次内只生成一次 embedding，数据库按规范化后的 URL 存储一行（原始 URL 记录在 metadata.original_url）
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .config import CANONICAL_URL_ENABLED, CANONICAL_TRACKING_PARAMS, CANONICAL_URL_RULES
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_TRACKING = frozenset(CANONICAL_TRACKING_PARAMS)
+# 站点 → [(路径正则, 保留的查询参数)]
+_PATH_RULES: Dict[str, List[Tuple["re.Pattern[str]", Optional[frozenset]]]] = {
+    host: [
+        (re.compile(p["path"]), frozenset(p["keep_params"]) if p.get("keep_params") is not None else None)
+        for p in rule.get("paths") or []
+    ]
+    for host, rule in CANONICAL_URL_RULES.items()
+}
+
+
+def _site_rule(host: str) -> Optional[Dict]:
+    """按 host 后缀匹配站点规则（pinterest.com 同时匹配 cn.pinterest.com）"""
+    for suffix, rule in CANONICAL_URL_RULES.items():
+        if host == suffix or host.endswith("." + suffix):
+            return {**rule, "_suffix": suffix}
+    return None
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name.startswith("utm_") or name in _TRACKING
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    返回规范化后的 URL；非 http(s) URL（chrome://、data: 等）或无法解析时原样返回
+    
+    - scheme / host 小写，去掉 www. 和默认端口
+    - 去掉跟踪参数，其余查询参数按名称排序
+    - 去掉普通锚点 fragment；#/、#! 开头的（单页应用的哈希路由）保留
+    - 去掉路径末尾的斜杠（根路径保留为 /）
+    - 应用 CANONICAL_URL_RULES 中的站点规则（统一 host；匹配的路径截取前缀、只保留白名单参数）
+    """
+    if not url or not CANONICAL_URL_ENABLED:
+        return url
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return url
+    
+    host = parts.hostname.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking_param(k)]
+    
+    rule = _site_rule(host)
+    if rule is not None:
+        host = rule.get("host") or host
+        for pattern, keep in _PATH_RULES.get(rule["_suffix"], []):
+            match = pattern.match(path)
+            if match:
+                path = match.group(0)
+                if keep is not None:
+                    params = [(k, v) for k, v in params if k in keep]
+                break
+    
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+    netloc = host if port is None or port == _DEFAULT_PORTS[scheme] else f"{host}:{port}"
+    fragment = parts.fragment if parts.fragment.startswith(("/", "!")) else ""
+    
+    return urlunsplit((scheme, netloc, path, urlencode(sorted(params)), fragment))
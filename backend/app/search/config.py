@@ -1,15 +1,147 @@
+import json
 import os
+import tempfile
 
 # ---- Model & Endpoint ----
 DASHSCOPE_API_URL = "https://dashscope.aliyuncs.com/api/v1"
 
 # 统一使用 Qwen Multimodal-Embedding API 处理文本和图像
 # 根据文档：https://dashscope.aliyuncs.com/api/v1/services/embeddings/multimodal-embedding/multimodal-embedding
-MM_EMBED_MODEL = "qwen2.5-vl-embedding"  # 支持文本和图像的多模态模型
+MM_EMBED_MODEL = os.getenv("MM_EMBED_MODEL", "qwen2.5-vl-embedding")  # 支持文本和图像的多模态模型
+# 向量的生成版本：修改 process_image 等影响向量的预处理参数时递增。
+# 与模型名一起记录在每一行（embed_model / embed_version），不一致的行由后台回填重新生成（见 backfill.py）
+EMBED_VERSION = os.getenv("EMBED_VERSION", "v1")
 MM_EMBED_ENDPOINT = f"{DASHSCOPE_API_URL}/services/embeddings/multimodal-embedding/multimodal-embedding"
 # qwen2.5-vl-embedding 支持 dimensions 参数：2048, 1024, 768, 512
-# 设置为 1024 确保文本和图像向量在同一维度空间
-MM_EMBED_DIM = 1024  # 统一的向量维度（文本和图像都使用此维度）
+# 文本和图像使用同一维度，确保在同一向量空间
+SUPPORTED_EMBED_DIMS = (2048, 1024, 768, 512)
+DEFAULT_EMBED_DIM = 1024
+
+
+def _validate_dim(value, source: str) -> int:
+    try:
+        dim = int(value)
+    except (TypeError, ValueError):
+        dim = None
+    if dim not in SUPPORTED_EMBED_DIMS:
+        raise ValueError(f"{source}={value!r} is not supported, expected one of {SUPPORTED_EMBED_DIMS}")
+    return dim
+
+
+# 维度按集合（向量库 Namespace）配置：EMBED_COLLECTION_DIMS 为 JSON，例如 {"cleantab": 512}，
+# 未配置的集合使用 MM_EMBED_DIM。降到 768 / 512 可按比例减少 ANN 索引内存和距离计算开销
+EMBED_COLLECTION = os.getenv("ADBPG_NAMESPACE", "cleantab")
+EMBED_COLLECTION_DIMS = {
+    name: _validate_dim(dim, f"EMBED_COLLECTION_DIMS[{name}]")
+    for name, dim in json.loads(os.getenv("EMBED_COLLECTION_DIMS", "{}") or "{}").items()
+}
+_DEFAULT_DIM = _validate_dim(os.getenv("MM_EMBED_DIM", str(DEFAULT_EMBED_DIM)), "MM_EMBED_DIM")
+
+
+def get_collection_dim(collection: str = None) -> int:
+    """返回集合的向量维度（默认当前集合 EMBED_COLLECTION）"""
+    return EMBED_COLLECTION_DIMS.get(collection or EMBED_COLLECTION, _DEFAULT_DIM)
+
+
+MM_EMBED_DIM = get_collection_dim()  # 当前集合的向量维度（文本和图像都使用此维度）
+# Embedding 后端：dashscope（远端，默认）| hashing（本地 CPU 特征哈希，确定性、无网络）
+EMBED_PROVIDER = os.getenv("EMBED_PROVIDER", "dashscope").lower()
+
+# ---- HTTP client (Embedding) ----
+# 应用级共享连接池：keep-alive + HTTP/2，避免每次 embedding 都重新握手 TLS
+EMBED_HTTP_TIMEOUT_S = float(os.getenv("EMBED_HTTP_TIMEOUT_S", "60"))
+EMBED_HTTP_CONNECT_TIMEOUT_S = float(os.getenv("EMBED_HTTP_CONNECT_TIMEOUT_S", "10"))
+EMBED_HTTP_MAX_CONNECTIONS = int(os.getenv("EMBED_HTTP_MAX_CONNECTIONS", "32"))
+EMBED_HTTP_MAX_KEEPALIVE = int(os.getenv("EMBED_HTTP_MAX_KEEPALIVE", "16"))
+EMBED_HTTP_KEEPALIVE_EXPIRY_S = float(os.getenv("EMBED_HTTP_KEEPALIVE_EXPIRY_S", "30"))
+EMBED_HTTP_MAX_PER_HOST = int(os.getenv("EMBED_HTTP_MAX_PER_HOST", "16"))  # 单个 host 的最大并发请求数
+EMBED_HTTP2 = os.getenv("EMBED_HTTP2", "true").lower() == "true"
+
+# ---- HTTP client (image / page fetch) ----
+# 抓取 og:image、网页的共享连接池（按 host 复用 keep-alive 连接），与 Embedding 客户端分开
+FETCH_HTTP_TIMEOUT_S = float(os.getenv("FETCH_HTTP_TIMEOUT_S", "10"))
+FETCH_HTTP_CONNECT_TIMEOUT_S = float(os.getenv("FETCH_HTTP_CONNECT_TIMEOUT_S", "5"))
+FETCH_HTTP_MAX_CONNECTIONS = int(os.getenv("FETCH_HTTP_MAX_CONNECTIONS", "64"))
+FETCH_HTTP_MAX_KEEPALIVE = int(os.getenv("FETCH_HTTP_MAX_KEEPALIVE", "32"))
+FETCH_HTTP_KEEPALIVE_EXPIRY_S = float(os.getenv("FETCH_HTTP_KEEPALIVE_EXPIRY_S", "30"))
+# og:image 尺寸探测最多读取的字节数（通常图片头部几 KB 就足够）
+IMAGE_PROBE_MAX_BYTES = int(os.getenv("IMAGE_PROBE_MAX_BYTES", str(512 * 1024)))
+
+# ---- Outbound fetch politeness ----
+# 抓取图片 / 网页时按 host 调度（见 politeness.py）：并发上限 + 自适应令牌桶，429 / 403 后冷却该 host
+FETCH_HOST_CONCURRENCY = int(os.getenv("FETCH_HOST_CONCURRENCY", "6"))  # 单个 host 的最大并发请求数
+FETCH_HOST_RATE_DEFAULTS = {
+    "initial_rps": float(os.getenv("FETCH_HOST_INITIAL_RPS", "5")),
+    "min_rps": float(os.getenv("FETCH_HOST_MIN_RPS", "0.5")),
+    "max_rps": float(os.getenv("FETCH_HOST_MAX_RPS", "20")),
+    "burst": float(os.getenv("FETCH_HOST_BURST", "10")),
+    "increase_rps": float(os.getenv("FETCH_HOST_INCREASE_RPS", "0.5")),
+    "decrease_factor": float(os.getenv("FETCH_HOST_DECREASE_FACTOR", "0.5")),
+}
+# 429 / 403 后的冷却时间（没有 Retry-After 时使用），连续被拒绝时翻倍，最长 FETCH_HOST_COOLDOWN_MAX_S
+FETCH_HOST_COOLDOWN_S = float(os.getenv("FETCH_HOST_COOLDOWN_S", "30"))
+FETCH_HOST_COOLDOWN_MAX_S = float(os.getenv("FETCH_HOST_COOLDOWN_MAX_S", "600"))
+# 冷却剩余时间超过此值时直接失败，不让请求一直等待
+FETCH_HOST_MAX_WAIT_S = float(os.getenv("FETCH_HOST_MAX_WAIT_S", "5"))
+# 按站点（host 后缀匹配）的规则：
+# - headers: 附加到该站点请求上的 headers（例如小红书 CDN 需要 Referer）
+# - concurrency: 覆盖 FETCH_HOST_CONCURRENCY
+# - initial_rps / max_rps / burst 等: 覆盖 FETCH_HOST_RATE_DEFAULTS
+_XHS_HEADERS = {"Referer": "https://www.xiaohongshu.com/", "Origin": "https://www.xiaohongshu.com"}
+FETCH_HOST_RULES = {
+    "xiaohongshu.com": {"headers": _XHS_HEADERS, "concurrency": 2, "initial_rps": 2, "max_rps": 5},
+    "xhscdn.com": {"headers": _XHS_HEADERS, "concurrency": 4},
+    "pinterest.com": {"concurrency": 2, "initial_rps": 2, "max_rps": 5},
+    "pinimg.com": {"concurrency": 6},
+}
+# 覆盖 / 追加站点规则（JSON），例如 {"example.com": {"concurrency": 1}}
+FETCH_HOST_RULES.update(json.loads(os.getenv("FETCH_HOST_RULES", "{}") or "{}"))
+
+# ---- Embedding cache ----
+# 内容寻址缓存：内存 LRU（按字节限制）+ SQLite 磁盘层（重启后仍有效）
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+EMBED_CACHE_MEMORY_BYTES = int(os.getenv("EMBED_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+# Serverless 环境只有 /tmp 可写，默认放在系统临时目录；设为空字符串可关闭磁盘层
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tab-cleaner-cache"))
+EMBED_CACHE_DISK_MAX_BYTES = int(os.getenv("EMBED_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# ---- Image cache ----
+# 磁盘图片缓存：按 URL 索引，保存处理后的 JPEG（按内容哈希去重）及 ETag / Last-Modified，
+# 过期后用条件请求重新验证（304 时不重新下载）
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tab-cleaner-cache", "images"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+IMAGE_CACHE_FRESH_S = float(os.getenv("IMAGE_CACHE_FRESH_S", str(24 * 3600)))  # 在此时间内直接使用，不重新验证
+IMAGE_CACHE_TTL_S = float(os.getenv("IMAGE_CACHE_TTL_S", str(30 * 24 * 3600)))  # 超过此时间未验证的条目被淘汰
+
+# ---- URL canonicalization ----
+# 入库前把 URL 规范化（去掉跟踪参数、fragment、末尾斜杠和 www.），同一页面只生成、存储一次向量
+CANONICAL_URL_ENABLED = os.getenv("CANONICAL_URL_ENABLED", "true").lower() == "true"
+# 所有站点都会去掉的跟踪参数（utm_* 按前缀匹配）
+CANONICAL_TRACKING_PARAMS = (
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "_hsenc", "_hsmi", "mkt_tok", "spm", "ref", "ref_src", "share_source", "share_medium",
+    "share_from", "vd_source", "si",
+)
+# 按站点（host 后缀匹配）的规则：
+# - host: 统一改写为该 host（合并地区 / 移动端子域名，例如 cn.pinterest.com、m.youtube.com）
+# - paths: [{path, keep_params}]，按顺序取第一条匹配的路径规则：
+#   path 为正则，只保留路径中匹配的前缀（例如 Pinterest 只保留 /pin/<id>）；
+#   keep_params 为只保留的查询参数（[] 表示全部去掉）
+#   没有匹配的路径（搜索页等）保留除跟踪参数外的所有参数，不同的搜索词不会被合并
+CANONICAL_URL_RULES = {
+    "pinterest.com": {"host": "pinterest.com", "paths": [{"path": r"^/pin/[^/]+", "keep_params": []}]},
+    "youtube.com": {"host": "youtube.com", "paths": [
+        {"path": r"^/watch$", "keep_params": ["v", "list"]},
+        {"path": r"^/shorts/[^/]+", "keep_params": []},
+    ]},
+    "xiaohongshu.com": {"paths": [{"path": r"^/(explore|discovery/item)/[0-9a-zA-Z]+", "keep_params": []}]},
+    "bilibili.com": {"paths": [{"path": r"^/video/[0-9a-zA-Z]+", "keep_params": ["p"]}]},
+    "behance.net": {"paths": [{"path": r"^/gallery/[0-9]+", "keep_params": []}]},
+    "dribbble.com": {"paths": [{"path": r"^/shots/[^/]+", "keep_params": []}]},
+}
+# 覆盖 / 追加站点规则（JSON），例如 {"example.com": {"paths": [{"path": "^/item$", "keep_params": ["id"]}]}}
+CANONICAL_URL_RULES.update(json.loads(os.getenv("CANONICAL_URL_RULES", "{}") or "{}"))
 
 # ---- Pipeline switches ----
 USE_REMOTE_EMBEDDING = True
@@ -21,11 +153,84 @@ MIN_IMAGE_DIMENSION = 100
 TARGET_IMAGE_DIMENSION = 1024
 MAX_IMAGE_DIMENSION = 4096
 MAX_IMAGE_SIZE = 20 * 1024 * 1024
+# 缩放时先在解码阶段（JPEG draft）或用 reduce() 整数倍缩小到不小于目标尺寸的 IMAGE_REDUCING_GAP 倍，
+# 再用 LANCZOS 缩放到目标尺寸。1.5 可以让 4K 图片用上 1/2 的 JPEG draft（2.0 时 3840 / 2 < 2048，用不上）
+IMAGE_REDUCING_GAP = 1.5
+# 图片解码 / 缩放 / 编码的执行池（见 image_pool.py）：thread | process、worker 数、同时提交的任务上限
+IMAGE_POOL_KIND = os.getenv("IMAGE_POOL_KIND", "thread").lower()
+IMAGE_POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", str(os.cpu_count() or 2)))
+IMAGE_POOL_MAX_PENDING = int(os.getenv("IMAGE_POOL_MAX_PENDING", str(2 * IMAGE_POOL_WORKERS)))
 
 # ---- Throttle / Batch ----
 BATCH_SIZE = 10
-EMBED_SLEEP_S = 0.15
-QUERY_SLEEP_S = 0.05
+# 单次 multimodal-embedding 请求可携带的 contents 上限（以 DashScope 文档为准）
+MM_EMBED_MAX_BATCH = int(os.getenv("MM_EMBED_MAX_BATCH", "20"))
+MM_EMBED_MAX_BATCH_IMAGES = int(os.getenv("MM_EMBED_MAX_BATCH_IMAGES", "5"))
+MM_EMBED_MAX_BATCH_BYTES = int(os.getenv("MM_EMBED_MAX_BATCH_BYTES", str(6 * 1024 * 1024)))  # 单次请求体中图片 Base64 的总字节上限
+# 跨请求微批：在窗口期内到达的单条 embedding 调用合并成一次上游请求
+EMBED_MICROBATCH_ENABLED = os.getenv("EMBED_MICROBATCH_ENABLED", "true").lower() == "true"
+EMBED_MICROBATCH_WINDOW_MS = float(os.getenv("EMBED_MICROBATCH_WINDOW_MS", "8"))
+EMBED_MICROBATCH_MAX_ITEMS = int(os.getenv("EMBED_MICROBATCH_MAX_ITEMS", str(MM_EMBED_MAX_BATCH)))
+# 上游请求的优先级调度（见 priority.py）：总并发名额、只留给搜索查询的名额、后台任务最多占用的名额
+EMBED_DISPATCH_MAX_INFLIGHT = int(os.getenv("EMBED_DISPATCH_MAX_INFLIGHT", "8"))
+EMBED_DISPATCH_INTERACTIVE_RESERVED = int(os.getenv("EMBED_DISPATCH_INTERACTIVE_RESERVED", "2"))
+EMBED_DISPATCH_BACKGROUND_MAX = int(os.getenv("EMBED_DISPATCH_BACKGROUND_MAX", "4"))
+
+# ---- Ingest concurrency ----
+# process_opengraph_for_search 的并发 worker 数，以及各阶段（进程级共享）的并发上限
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "8"))
+INGEST_MAX_DOWNLOADS = int(os.getenv("INGEST_MAX_DOWNLOADS", "8"))  # 同时进行的图片下载
+INGEST_MAX_CPU = int(os.getenv("INGEST_MAX_CPU", str(os.cpu_count() or 2)))  # 同时进行的图片解码 / 缩放（线程池）
+# 同时在途的 embedding 调用；微批会把它们合并成少量上游请求，上游速率仍由令牌桶控制
+INGEST_MAX_EMBED_CALLS = int(os.getenv("INGEST_MAX_EMBED_CALLS", "16"))
+# 每个条目的 embedding 方式：
+# - separate：文本、图像分别调用（并发的调用由微批合并）
+# - paired：文本和图像放进同一个多 content 请求，返回两个向量
+# - fused：同 paired 一次请求，再按 INGEST_FUSED_TEXT_WEIGHT 融合成一个向量（只存在 text_embedding 列，
+#   metadata.embedding_mode = "fused"，排序时单独处理，见 search/fuse.py）
+INGEST_EMBED_MODE = os.getenv("INGEST_EMBED_MODE", "separate").lower()
+INGEST_FUSED_TEXT_WEIGHT = float(os.getenv("INGEST_FUSED_TEXT_WEIGHT", "0.5"))
+# 处理中图片的字节预算（每个 worker 进程一份）：Base64 截图、下载的原图和解码后的像素都计入
+INGEST_MAX_INFLIGHT_BYTES = int(os.getenv("INGEST_MAX_INFLIGHT_BYTES", str(256 * 1024 * 1024)))
+INGEST_BUDGET_MODE = os.getenv("INGEST_BUDGET_MODE", "block").lower()  # block：等待预算释放 | shed：直接跳过图像 embedding
+INGEST_BUDGET_MAX_WAIT_S = float(os.getenv("INGEST_BUDGET_MAX_WAIT_S", "30"))  # block 模式下的最长等待，超时后跳过（0 表示一直等待）
+INGEST_IMAGE_RESERVE_BYTES = int(os.getenv("INGEST_IMAGE_RESERVE_BYTES", str(4 * 1024 * 1024)))  # 图片 URL 下载前的预占额度
+
+# ---- Rate limit (AIMD token bucket) ----
+# 进程内全局令牌桶（不再每次调用后固定 sleep），按上游 429 / Retry-After 自适应调速
+EMBED_RATE_DEFAULTS = {
+    "initial_rps": float(os.getenv("EMBED_RATE_INITIAL_RPS", "10")),
+    "min_rps": float(os.getenv("EMBED_RATE_MIN_RPS", "0.5")),
+    "max_rps": float(os.getenv("EMBED_RATE_MAX_RPS", "50")),
+    "burst": float(os.getenv("EMBED_RATE_BURST", "10")),
+    "increase_rps": float(os.getenv("EMBED_RATE_INCREASE_RPS", "1")),  # 加性增长：约每秒 +1 rps
+    "decrease_factor": float(os.getenv("EMBED_RATE_DECREASE_FACTOR", "0.5")),  # 乘性下降
+}
+# 按模型覆盖（JSON），例如 {"qwen2.5-vl-embedding": {"max_rps": 20}}
+EMBED_RATE_LIMITS = json.loads(os.getenv("EMBED_RATE_LIMITS", "{}") or "{}")
+
+# ---- Retry / Hedging / Deadline ----
+# 暂时性错误（网络 / 429 / 5xx）的有界重试，带抖动的指数退避
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+EMBED_BACKOFF_BASE_S = float(os.getenv("EMBED_BACKOFF_BASE_S", "0.2"))
+EMBED_BACKOFF_MAX_S = float(os.getenv("EMBED_BACKOFF_MAX_S", "5"))
+# 单次上游请求（含所有重试）的总时间预算
+EMBED_REQUEST_DEADLINE_S = float(os.getenv("EMBED_REQUEST_DEADLINE_S", "45"))
+# 对冲请求：耗时超过近期 p95 时再发一个副本；只对小请求生效，避免大批图片请求翻倍
+EMBED_HEDGE_ENABLED = os.getenv("EMBED_HEDGE_ENABLED", "true").lower() == "true"
+EMBED_HEDGE_QUANTILE = float(os.getenv("EMBED_HEDGE_QUANTILE", "0.95"))
+EMBED_HEDGE_MIN_SAMPLES = int(os.getenv("EMBED_HEDGE_MIN_SAMPLES", "20"))  # 样本不足时不对冲
+EMBED_HEDGE_MIN_DELAY_MS = float(os.getenv("EMBED_HEDGE_MIN_DELAY_MS", "100"))
+EMBED_HEDGE_MAX_ITEMS = int(os.getenv("EMBED_HEDGE_MAX_ITEMS", "4"))
+# 搜索查询 embedding 的调用方截止时间（超时后按失败处理，不再等待慢响应）
+EMBED_QUERY_DEADLINE_S = float(os.getenv("EMBED_QUERY_DEADLINE_S", "8"))
+
+# ---- Circuit breaker ----
+# 连续失败或连续慢响应后熔断，期间搜索直接降级为本地文本排序
+EMBED_BREAKER_FAILURES = int(os.getenv("EMBED_BREAKER_FAILURES", "5"))
+EMBED_BREAKER_SLOW_CALL_S = float(os.getenv("EMBED_BREAKER_SLOW_CALL_S", "15"))  # 超过该耗时的成功请求也记为失败
+EMBED_BREAKER_OPEN_S = float(os.getenv("EMBED_BREAKER_OPEN_S", "30"))  # 熔断冷却时间，之后进入半开探测
+EMBED_BREAKER_HALF_OPEN_CALLS = int(os.getenv("EMBED_BREAKER_HALF_OPEN_CALLS", "1"))
 
 # ---- Fusion weights (text, image) ----
 # 用于融合文本相似度和图像相似度分数
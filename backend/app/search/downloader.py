@@ -0,0 +1,146 @@
+"""
+图片下载
+所有 og:image / 图片 URL 都通过共享的抓取客户端（http_client.get_fetch_client）下载，
+同一 host 复用 keep-alive 连接；并发、速率、冷却和站点专用 headers 由 politeness.get_host_scheduler() 按 host 调度。
+
+响应体以流的方式读取：
+- Content-Type 不是图片时，不读取响应体直接放弃
+- Content-Length 超过上限时直接放弃；没有 Content-Length 时，累计字节数超过上限立即中断
+"""
+from __future__ import annotations
+
+from io import BytesIO
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import httpx
+from PIL import Image
+
+from . import metrics
+from .config import MAX_IMAGE_SIZE, IMAGE_PROBE_MAX_BYTES
+from .http_client import get_fetch_client
+from .politeness import get_host_scheduler
+
+# 部分 CDN 不返回 Content-Type 或返回通用的二进制类型，这些也当作图片读取，由 PIL 判断
+_GENERIC_CONTENT_TYPES = ("", "application/octet-stream", "binary/octet-stream")
+
+
+class ImageRejected(Exception):
+    """响应不是图片或超过大小上限（无需重试）"""
+
+
+def _check_headers(resp: httpx.Response, max_bytes: Optional[int]):
+    """读取响应体之前检查 Content-Type 和 Content-Length（max_bytes 为 None 时不检查长度）"""
+    content_type = resp.headers.get("content-type", "").split(";")[0].strip().lower()
+    if not content_type.startswith("image/") and content_type not in _GENERIC_CONTENT_TYPES:
+        metrics.inc("image_download_rejected_type")
+        raise ImageRejected(f"not an image (content-type {content_type})")
+    
+    content_length = resp.headers.get("content-length")
+    if max_bytes is not None and content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        metrics.inc("image_download_rejected_size")
+        raise ImageRejected(f"too large (content-length {content_length} > {max_bytes})")
+
+
+class FetchedImage(NamedTuple):
+    """下载结果；not_modified=True（304）时 data 为空"""
+    data: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    not_modified: bool = False
+
+
+async def fetch_image_response(
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    max_bytes: int = MAX_IMAGE_SIZE,
+    timeout: Optional[float] = None,
+) -> FetchedImage:
+    """
+    流式下载图片，同时返回 ETag / Last-Modified
+    
+    headers 中带 If-None-Match / If-Modified-Since 时，304 返回 not_modified=True；
+    其他非 2xx 抛出 httpx.HTTPStatusError，不是图片或超过 max_bytes 抛出 ImageRejected，
+    host 冷却中抛出 politeness.HostCoolingDown
+    """
+    client = get_fetch_client()
+    scheduler = get_host_scheduler()
+    async with scheduler.slot(url) as host:
+        async with client.stream("GET", url, headers=scheduler.request_headers(url, headers), timeout=timeout or client.timeout) as resp:
+            host.record(resp.status_code, resp.headers.get("retry-after"))
+            etag = resp.headers.get("etag")
+            last_modified = resp.headers.get("last-modified")
+            if resp.status_code == 304:
+                metrics.inc("image_download_not_modified")
+                return FetchedImage(b"", etag, last_modified, not_modified=True)
+            resp.raise_for_status()
+            _check_headers(resp, max_bytes)
+            
+            buf = bytearray()
+            async for chunk in resp.aiter_bytes():
+                buf += chunk
+                if len(buf) > max_bytes:
+                    # 退出 stream 上下文时关闭连接，剩余的响应体不再下载
+                    metrics.inc("image_download_rejected_size")
+                    raise ImageRejected(f"too large (more than {max_bytes} bytes)")
+    
+    metrics.inc("image_download_bytes", len(buf))
+    return FetchedImage(bytes(buf), etag, last_modified)
+
+
+async def fetch_image(
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    max_bytes: int = MAX_IMAGE_SIZE,
+    timeout: Optional[float] = None,
+) -> bytes:
+    """
+    流式下载图片，返回完整字节
+    
+    非 2xx 抛出 httpx.HTTPStatusError，不是图片或超过 max_bytes 抛出 ImageRejected
+    """
+    return (await fetch_image_response(url, headers, max_bytes, timeout)).data
+
+
+def _parse_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """尝试从（可能不完整的）图片头部解析宽高"""
+    try:
+        return Image.open(BytesIO(data)).size
+    except Exception:
+        return None
+
+
+async def probe_image_size(
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    max_bytes: int = IMAGE_PROBE_MAX_BYTES,
+    timeout: Optional[float] = None,
+) -> Optional[Tuple[int, int]]:
+    """
+    只读取图片头部获取 (宽, 高)：边下载边解析，解析出尺寸后立即断开，最多读取 max_bytes
+    
+    不是图片、读到上限仍无法解析时返回 None；非 2xx 抛出 httpx.HTTPStatusError
+    """
+    client = get_fetch_client()
+    scheduler = get_host_scheduler()
+    async with scheduler.slot(url) as host:
+        async with client.stream("GET", url, headers=scheduler.request_headers(url, headers), timeout=timeout or client.timeout) as resp:
+            host.record(resp.status_code, resp.headers.get("retry-after"))
+            resp.raise_for_status()
+            try:
+                # 尺寸探测不限制图片本身的大小，只限制读取量
+                _check_headers(resp, None)
+            except ImageRejected:
+                return None
+            
+            buf = bytearray()
+            async for chunk in resp.aiter_bytes():
+                buf += chunk
+                size = _parse_size(bytes(buf))
+                if size is not None:
+                    metrics.inc("image_probe_bytes", len(buf))
+                    return size
+                if len(buf) >= max_bytes:
+                    break
+    
+    metrics.inc("image_probe_failed")
+    return None
@@ -1,17 +1,204 @@
 """
 统一的多模态 Embedding 模块
 使用 qwen2.5-vl-embedding 处理文本和图像，确保它们在同一个向量空间
+（具体后端由 EMBED_PROVIDER 选择，见 providers.py）
 """
 from __future__ import annotations
 
-import httpx
-from typing import Optional, List
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional, List, Tuple
 
-from .config import MM_EMBED_ENDPOINT, MM_EMBED_MODEL, MM_EMBED_DIM, get_api_key
-from .preprocess import download_image, process_image
+import numpy as np
 
+from .config import (
+    MM_EMBED_MAX_BATCH,
+    MM_EMBED_MAX_BATCH_IMAGES,
+    MM_EMBED_MAX_BATCH_BYTES,
+    EMBED_MICROBATCH_ENABLED,
+    EMBED_MICROBATCH_WINDOW_MS,
+    EMBED_MICROBATCH_MAX_ITEMS,
+    EMBED_MAX_RETRIES,
+    EMBED_BACKOFF_BASE_S,
+    EMBED_BACKOFF_MAX_S,
+    EMBED_REQUEST_DEADLINE_S,
+    EMBED_HEDGE_ENABLED,
+    EMBED_HEDGE_QUANTILE,
+    EMBED_HEDGE_MIN_DELAY_MS,
+    EMBED_HEDGE_MAX_ITEMS,
+    EMBED_BREAKER_FAILURES,
+    EMBED_BREAKER_SLOW_CALL_S,
+    EMBED_BREAKER_OPEN_S,
+    EMBED_BREAKER_HALF_OPEN_CALLS,
+    EMBED_VERSION,
+)
+from . import metrics
+from .batcher import MicroBatcher
+from .priority import PRIORITIES, current_priority, embed_priority, get_dispatcher
+from .breaker import CircuitBreaker, OPEN
+from .embed_cache import get_embed_cache, content_key
+from .preprocess import download_image, process_image_async
+from .providers import EmbedRequestError, EmbeddingProvider, get_provider, get_provider_for_model
+from .retry import call_with_retry, hedged
+from .singleflight import SingleFlight
 
-async def qwen_embed(input_data: dict) -> Optional[List[float]]:
+# 跨请求微批处理器（每个优先级一个，按事件循环懒加载）：不同优先级的调用不会拼进同一批
+_batchers: Dict[str, MicroBatcher] = {}
+# 相同内容的在途请求合并
+_embed_flight = SingleFlight("embed")
+# 上游熔断器
+_breaker = CircuitBreaker(
+    "embed",
+    failure_threshold=EMBED_BREAKER_FAILURES,
+    slow_call_s=EMBED_BREAKER_SLOW_CALL_S,
+    open_s=EMBED_BREAKER_OPEN_S,
+    half_open_max_calls=EMBED_BREAKER_HALF_OPEN_CALLS,
+)
+
+
+async def _with_deadline(coro, timeout: Optional[float], default: Any):
+    """
+    调用方截止时间：超过 timeout 秒后放弃等待并返回 default
+    
+    共享的在途请求（single-flight / 微批）不会因此被取消，其他调用方仍可拿到结果
+    """
+    if timeout is None:
+        return await coro
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        metrics.inc("embed_call_deadline_exceeded")
+        print(f"[Embed] WARNING: call deadline of {timeout}s exceeded")
+        return default
+
+
+def _hedge_delay(provider: EmbeddingProvider, contents: List[dict]) -> Optional[float]:
+    """对冲阈值：近期成功请求耗时的 p95；未开启、请求过大或样本不足时返回 None（不对冲）"""
+    if not EMBED_HEDGE_ENABLED or len(contents) > EMBED_HEDGE_MAX_ITEMS:
+        return None
+    p95 = provider.latency.quantile(EMBED_HEDGE_QUANTILE)
+    if p95 is None:
+        return None
+    return max(p95, EMBED_HEDGE_MIN_DELAY_MS / 1000.0)
+
+
+async def _dispatch(
+    provider: EmbeddingProvider,
+    contents: List[dict],
+    on_sent: Optional[Callable[[], None]] = None,
+    latencies: Optional[List[float]] = None,
+) -> List[Optional[np.ndarray]]:
+    """
+    按优先级占用一个上游并发名额后发送请求（请求发出时调用 on_sent）
+    
+    成功时把请求发出到返回的耗时追加到 latencies（不含调度、限流排队时间）
+    """
+    sent_at: Optional[float] = None
+    
+    def _sent():
+        nonlocal sent_at
+        sent_at = time.monotonic()
+        if on_sent is not None:
+            on_sent()
+    
+    async with get_dispatcher().slot():
+        vectors = await provider.embed(contents, on_sent=_sent)
+        if latencies is not None and sent_at is not None:
+            latencies.append(time.monotonic() - sent_at)
+        return vectors
+
+
+async def _post_embeddings(contents: List[dict]) -> List[Optional[np.ndarray]]:
+    """
+    调用当前 provider 生成一批 embedding
+    
+    本地 provider 直接计算；远端 provider 带重试、对冲和熔断：
+    
+    - 暂时性错误（网络 / 429 / 5xx）按带抖动的指数退避重试，最多 EMBED_MAX_RETRIES 次，
+      429 时至少等待 Retry-After
+    - 单次尝试发出后（排队等待调度名额和令牌的时间不计）耗时超过近期 p95 时发出一个副本请求，取先成功的结果
+    - 所有尝试共享 EMBED_REQUEST_DEADLINE_S 的时间预算
+    - 每次尝试先按当前上下文的优先级向调度器申请名额（见 priority.py）
+    
+    外层有熔断器：上游持续失败或持续慢响应（只按请求发出后的耗时计）时直接快速失败，不再等待超时
+    
+    Raises:
+        EmbedRequestError: 不可重试的错误、重试耗尽、超过截止时间或熔断打开
+    """
+    provider = get_provider()
+    if not provider.remote:
+        return await provider.embed(contents)
+    
+    if not _breaker.allow():
+        raise EmbedRequestError("Circuit breaker open")
+    
+    # 成功的那次尝试在上游的耗时：慢调用熔断只看上游响应速度，
+    # 调度排队、限流等待、退避和 Retry-After 不算（否则积压或 429 时健康的上游也会被熔断）
+    latencies: List[float] = []
+    try:
+        vectors = await call_with_retry(
+            lambda: hedged(lambda on_sent: _dispatch(provider, contents, on_sent, latencies), _hedge_delay(provider, contents), name="embed"),
+            max_retries=EMBED_MAX_RETRIES,
+            base_s=EMBED_BACKOFF_BASE_S,
+            max_s=EMBED_BACKOFF_MAX_S,
+            deadline=time.monotonic() + EMBED_REQUEST_DEADLINE_S,
+            is_retryable=lambda e: isinstance(e, EmbedRequestError) and e.retryable,
+            retry_after=lambda e: getattr(e, "retry_after", None),
+            name="embed",
+        )
+    except asyncio.TimeoutError as e:
+        _breaker.record_failure()
+        print(f"[Embed] ERROR: deadline of {EMBED_REQUEST_DEADLINE_S}s exceeded")
+        raise EmbedRequestError("Deadline exceeded") from e
+    except EmbedRequestError as e:
+        # 不可重试的 4xx 说明上游是健康的，只是输入有问题，不计入熔断统计
+        if e.retryable:
+            _breaker.record_failure()
+        else:
+            _breaker.record_ignored()
+        raise
+    except BaseException:
+        _breaker.record_ignored()
+        raise
+    _breaker.record_success(latencies[0] if latencies else 0.0)
+    return vectors
+
+
+def embedding_available() -> bool:
+    """embedding 是否可用（远端 provider 熔断打开时返回 False，调用方可直接走降级路径）"""
+    return not get_provider().remote or _breaker.state != OPEN
+
+
+def embedding_tag() -> Tuple[str, str]:
+    """当前生成向量的来源标记 (embed_model, embed_version)，随向量一起入库"""
+    return get_provider().model, EMBED_VERSION
+
+
+async def qwen_embed_batch(contents: List[dict]) -> Optional[List[Optional[np.ndarray]]]:
+    """
+    一次 HTTP 请求调用 Qwen Multimodal-Embedding API，支持多个 contents
+    
+    Args:
+        contents: contents 列表，例如 [{"text": "hello"}, {"image": "data:image/jpeg;base64,..."}]
+    
+    Returns:
+        与 contents 按下标一一对应的向量列表（某一项缺失时为 None）；整个请求失败返回 None
+    """
+    if not contents:
+        return []
+    
+    try:
+        return await _post_embeddings(contents)
+    except EmbedRequestError:
+        return None
+    except Exception as e:
+        print(f"[Embed] EXCEPTION: {type(e).__name__}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+async def qwen_embed(input_data: dict) -> Optional[np.ndarray]:
     """
     统一的 Qwen Multimodal-Embedding API 调用
     
@@ -22,69 +209,219 @@ async def qwen_embed(input_data: dict) -> Optional[List[float]]:
             {"input": {"contents": [{"image": "base64..."}]}}
     
     Returns:
-        Embedding向量，失败返回None
+        Embedding向量（第一个 content 的向量），失败返回None
     """
-    api_key = get_api_key()
-    if not api_key:
-        print(f"[Embed] ERROR: API key not found")
+    contents = (input_data.get("input") or {}).get("contents") or []
+    vectors = await qwen_embed_batch(contents)
+    if not vectors:
         return None
+    return vectors[0]
+
+
+def _content_size(content: dict) -> int:
+    """估算单个 content 在请求体中的大小（主要是图片 Base64）"""
+    return sum(len(v) for v in content.values() if isinstance(v, str))
+
+
+def _split_batches(contents: List[dict]) -> List[List[int]]:
+    """
+    按 provider 限制把 contents 切分成多个请求（返回下标分组）
     
+    限制：每批最多 MM_EMBED_MAX_BATCH 条、其中图片最多 MM_EMBED_MAX_BATCH_IMAGES 张、
+    图片 Base64 总大小不超过 MM_EMBED_MAX_BATCH_BYTES（单张超限的图片单独成批）
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    n_images = 0
+    n_bytes = 0
+    for i, content in enumerate(contents):
+        is_image = "image" in content
+        size = _content_size(content) if is_image else 0
+        if current and (
+            len(current) >= MM_EMBED_MAX_BATCH
+            or (is_image and n_images >= MM_EMBED_MAX_BATCH_IMAGES)
+            or (is_image and n_bytes + size > MM_EMBED_MAX_BATCH_BYTES)
+        ):
+            batches.append(current)
+            current, n_images, n_bytes = [], 0, 0
+        current.append(i)
+        if is_image:
+            n_images += 1
+            n_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def _embed_batch_isolating(contents: List[dict]) -> List[Optional[np.ndarray]]:
+    """
+    发送一批 contents；整批失败时二分重试，把失败隔离到具体的条目上
+    （例如一张损坏的图片不会拖垮同批的其他条目）
+    """
     try:
-        payload = {
-            "model": MM_EMBED_MODEL,
-            **input_data
-        }
-        
-        # qwen2.5-vl-embedding 支持 dimensions 参数
-        if MM_EMBED_MODEL == "qwen2.5-vl-embedding":
-            payload["parameters"] = {
-                "dimensions": MM_EMBED_DIM
-            }
-        
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            resp = await client.post(
-                MM_EMBED_ENDPOINT,
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json",
-                },
-                json=payload,
-            )
-            
-            if resp.status_code != 200:
-                error_text = resp.text[:500]
-                print(f"[Embed] ERROR: HTTP {resp.status_code}, response: {error_text}")
-                return None
-            
-            data = resp.json()
-            embs = data.get("output", {}).get("embeddings") or []
-            
-            if not embs:
-                print(f"[Embed] ERROR: No embeddings in response. Response keys: {list(data.keys())}")
-                return None
-            
-            # 取第一个 embedding（响应格式：output.embeddings[0].embedding）
-            if embs and isinstance(embs[0].get("embedding"), list):
-                emb = embs[0]["embedding"]
-                print(f"[Embed] SUCCESS: Generated {len(emb)}-dim vector")
-                return emb
-            
-            print(f"[Embed] ERROR: Invalid embedding format")
-            return None
-            
+        return await _post_embeddings(contents)
+    except EmbedRequestError as e:
+        # 暂时性错误（限流 / 5xx / 网络）与条目内容无关，二分只会放大请求量
+        if e.retryable or len(contents) == 1:
+            return [None] * len(contents)
     except Exception as e:
         print(f"[Embed] EXCEPTION: {type(e).__name__}: {str(e)}")
         import traceback
         traceback.print_exc()
+        return [None] * len(contents)
+    
+    mid = len(contents) // 2
+    print(f"[Embed] Batch of {len(contents)} failed, splitting into {mid} + {len(contents) - mid}")
+    left = await _embed_batch_isolating(contents[:mid])
+    right = await _embed_batch_isolating(contents[mid:])
+    return left + right
+
+
+async def embed_contents(contents: List[Optional[dict]]) -> List[Optional[np.ndarray]]:
+    """
+    批量生成 embedding：自动按 provider 限制分批，并把结果按输入下标对齐
+    
+    Args:
+        contents: contents 列表，值为 None 的位置直接返回 None
+    
+    Returns:
+        与输入一一对应的向量列表，失败的条目为 None
+    """
+    results: List[Optional[np.ndarray]] = [None] * len(contents)
+    valid = [i for i, c in enumerate(contents) if c]
+    if not valid:
+        return results
+    if not get_provider().available():
+        print(f"[Embed] ERROR: provider {get_provider().name} not configured (API key not found)")
+        return results
+    
+    batches = _split_batches([contents[i] for i in valid])
+    print(f"[Embed] Embedding {len(valid)} contents in {len(batches)} request(s)")
+    # 各批次并发发送，节奏由全局限流器控制
+    batch_vectors = await asyncio.gather(*[
+        _embed_batch_isolating([contents[valid[j]] for j in batch])
+        for batch in batches
+    ])
+    for batch, vectors in zip(batches, batch_vectors):
+        for j, vec in zip(batch, vectors):
+            results[valid[j]] = vec
+    return results
+
+
+def _get_batcher(priority: str) -> MicroBatcher:
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(priority)
+    if batcher is None or batcher.loop is not loop:
+        async def send_batch(contents: List[dict]) -> List[Optional[np.ndarray]]:
+            # 批次在独立任务中发送，按批次所属的优先级（而不是触发 flush 的调用方）申请名额
+            with embed_priority(priority):
+                return await embed_contents(contents)
+        
+        batcher = MicroBatcher(
+            send_batch,
+            window_s=EMBED_MICROBATCH_WINDOW_MS / 1000.0,
+            max_items=EMBED_MICROBATCH_MAX_ITEMS,
+            name=f"embed_{priority}",
+        )
+        _batchers[priority] = batcher
+    return batcher
+
+
+async def close_embed_batcher():
+    """发送各优先级微批队列中剩余的请求并等待完成（shutdown 时调用）"""
+    for priority in PRIORITIES:
+        batcher = _batchers.pop(priority, None)
+        if batcher is not None:
+            await batcher.drain()
+
+
+async def _embed_uncached(key: str, content: dict) -> Optional[np.ndarray]:
+    """缓存未命中时真正发起请求，并把结果写回缓存"""
+    # 微批只对远端 provider 有意义（合并网络请求）；本地 provider 直接计算
+    if EMBED_MICROBATCH_ENABLED and get_provider().remote:
+        vec = await _get_batcher(current_priority()).submit(content)
+    else:
+        vec = await qwen_embed({"input": {"contents": [content]}})
+    
+    cache = get_embed_cache()
+    if cache is not None and vec is not None:
+        await cache.put_many([(key, vec)])
+    return vec
+
+
+async def _embed_one(content: dict) -> Optional[np.ndarray]:
+    """
+    单条 embedding：
+    1. 先查缓存
+    2. 未命中时按内容 key 做 single-flight：相同内容的并发调用只发一次上游请求
+    3. 开启微批时交给 MicroBatcher，与同一窗口内其他请求的调用合并发送
+    """
+    provider = get_provider()
+    key = content_key(content, provider.model, provider.dimensions)
+    if key is None:
         return None
+    
+    cache = get_embed_cache()
+    if cache is not None:
+        found = await cache.get_many([key])
+        if key in found:
+            return found[key]
+    
+    return await _embed_flight.do(key, lambda: _embed_uncached(key, content))
 
 
-async def embed_text(text: str) -> Optional[List[float]]:
+async def _embed_many(contents: List[Optional[dict]]) -> List[Optional[np.ndarray]]:
+    """
+    批量 embedding：
+    - 先批量查缓存
+    - 未命中的条目按内容 key 去重，并与其他调用方在途的相同请求合并（single-flight）
+    - 只把本次认领的条目交给 embed_contents
+    """
+    provider = get_provider()
+    keys = [content_key(c, provider.model, provider.dimensions) if c else None for c in contents]
+    cache = get_embed_cache()
+    found = await cache.get_many(keys) if cache is not None else {}
+    
+    missing_keys = [k for k in keys if k is not None and k not in found]
+    if missing_keys:
+        owned, shared = _embed_flight.claim_many(missing_keys)
+        if owned:
+            first_index = {}
+            for i, k in enumerate(keys):
+                if k in owned:
+                    first_index.setdefault(k, i)
+            owned_keys = list(first_index)
+            try:
+                vectors = await embed_contents([contents[first_index[k]] for k in owned_keys])
+            except BaseException as e:
+                # 认领方被取消（例如调用方超时）时，等待同一结果的其他调用方按失败处理，而不是被一起取消
+                if not isinstance(e, Exception):
+                    SingleFlight.resolve(owned, {}, error=EmbedRequestError("In-flight request cancelled"))
+                else:
+                    SingleFlight.resolve(owned, {}, error=e)
+                raise
+            computed = dict(zip(owned_keys, vectors))
+            SingleFlight.resolve(owned, computed)
+            found.update(computed)
+            if cache is not None:
+                await cache.put_many(computed.items())
+        for k, fut in shared.items():
+            try:
+                found[k] = await asyncio.shield(fut)
+            except Exception as e:
+                print(f"[Embed] Shared in-flight request failed: {type(e).__name__}: {str(e)}")
+                found[k] = None
+    
+    return [found.get(k) if k is not None else None for k in keys]
+
+
+async def embed_text(text: str, timeout: Optional[float] = None) -> Optional[np.ndarray]:
     """
     生成文本的 Embedding 向量
     
     Args:
         text: 文本内容
+        timeout: 调用方截止时间（秒），超时返回 None；None 表示不限制
     
     Returns:
         Embedding向量，失败返回None
@@ -93,41 +430,96 @@ async def embed_text(text: str) -> Optional[List[float]]:
         print(f"[Embed] WARNING: Empty text provided")
         return None
     
-    input_data = {
-        "input": {
-            "contents": [
-                {"text": text}
-            ]
-        }
-    }
-    
-    return await qwen_embed(input_data)
+    return await _with_deadline(_embed_one({"text": text}), timeout, None)
 
 
-async def embed_image(image_base64_or_url: str) -> Optional[List[float]]:
+async def embed_text_with_model(
+    text: str,
+    model: str,
+    dimensions: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Optional[np.ndarray]:
     """
-    生成图像的 Embedding 向量
-    
-    注意：
-    - 如果输入是 URL，会先下载并转换为 Base64，避免 API "download form url error" 错误
-    - 如果输入是 Base64（data:image/jpeg;base64,xxx 格式），直接使用
+    用指定模型和维度（None 表示当前维度）生成文本向量：与当前 provider 相同时走 embed_text；
+    其他模型（回填期间旧模型的行，按这些行入库时的 embed_dim 请求）直接发送一次请求，不经过缓存和微批
+    """
+    provider = get_provider_for_model(model, dimensions)
+    if provider is None:
+        return None
+    if provider is get_provider():
+        return await embed_text(text, timeout=timeout)
+    if not text or not text.strip() or not provider.available():
+        return None
+
+    async def run():
+        try:
+            vectors = await _dispatch(provider, [{"text": text}])
+        except EmbedRequestError as e:
+            print(f"[Embed] ERROR embedding with {model}: {str(e)}")
+            return None
+        return vectors[0]
     
-    通常从 pipeline.py 调用时，传入的应该是 Base64（因为 pipeline 已经下载并处理了）
-    但如果直接传入 URL，此函数也会处理
+    return await _with_deadline(run(), timeout, None)
+
+
+async def embed_texts(texts: List[str], timeout: Optional[float] = None) -> List[Optional[np.ndarray]]:
+    """
+    批量生成文本 Embedding 向量（多个文本打包进同一个请求）
     
     Args:
-        image_base64_or_url: Base64编码的图片（data:image/jpeg;base64,xxx 格式）或图片URL
+        texts: 文本列表
+        timeout: 调用方截止时间（秒），超时所有条目返回 None
     
     Returns:
-        Embedding向量，失败返回None
+        与 texts 一一对应的向量列表，空文本或失败的条目为 None
+    """
+    contents = [{"text": t} if t and t.strip() else None for t in (texts or [])]
+    return await _with_deadline(_embed_many(contents), timeout, [None] * len(contents))
+
+
+async def embed_text_image(
+    text: str,
+    image_base64_or_url: str,
+    timeout: Optional[float] = None,
+) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    一个条目的文本和图像放进同一个多 content 请求，返回 (text_vec, image_vec)
+    
+    开启微批时两个 content 同时提交给 MicroBatcher：落在同一窗口内，并与其他条目的请求合并发送，
+    而不是每个条目单独一次上游请求；未开启时两者作为一个请求发送。
+    缓存命中的那一路不再请求；图片无法处理时只生成文本向量
+    """
+    async def one(content: Optional[dict]) -> Optional[np.ndarray]:
+        return await _embed_one(content) if content else None
+
+    async def run():
+        image_uri = await _image_to_data_uri(image_base64_or_url) if image_base64_or_url else None
+        contents = [
+            {"text": text} if text and text.strip() else None,
+            {"image": image_uri} if image_uri else None,
+        ]
+        if EMBED_MICROBATCH_ENABLED and get_provider().remote:
+            text_vec, image_vec = await asyncio.gather(*[one(c) for c in contents])
+        else:
+            text_vec, image_vec = await _embed_many(contents)
+        return text_vec, image_vec
+    
+    return await _with_deadline(run(), timeout, (None, None))
+
+
+async def _image_to_data_uri(image_base64_or_url: str) -> Optional[str]:
+    """
+    把图片输入统一转换为 API 需要的完整 Data URI（data:image/jpeg;base64,xxx）
+    
+    - URL：先下载并处理为 Base64（避免 API "download form url error" 错误）
+    - Data URI：直接使用
+    - 纯 Base64：补上 Data URI 前缀
     """
     if not image_base64_or_url:
         print(f"[Embed] WARNING: Empty image data provided")
         return None
     
-    # 检查输入类型
     is_url = image_base64_or_url.startswith("http://") or image_base64_or_url.startswith("https://")
-    is_data_uri = image_base64_or_url.startswith("data:image")
     
     # 如果输入是 URL，先下载并转换为 Base64（避免 API 无法访问 URL 的问题）
     # 注意：通常 pipeline.py 已经下载并转换了，这里作为兜底处理
@@ -135,32 +527,18 @@ async def embed_image(image_base64_or_url: str) -> Optional[List[float]]:
         print(f"[Embed] URL detected (fallback), downloading: {image_base64_or_url[:50]}...")
         try:
             image_data = await download_image(image_base64_or_url)
-            if image_data:
-                print(f"[Embed] Downloaded {len(image_data)} bytes, processing...")
-                img_b64 = process_image(image_data)
-                if img_b64:
-                    # 重要：process_image 返回的是完整的 Data URI 格式（data:image/jpeg;base64,xxx）
-                    # API 要求使用完整的 Data URI 格式，不要去掉前缀！
-                    print(f"[Embed] Processed to Base64 Data URI (length: {len(img_b64)})")
-                    
-                    # 直接使用完整的 Data URI 格式
-                    input_data = {
-                        "input": {
-                            "contents": [
-                                {
-                                    "image": img_b64  # 使用完整的 data:image/jpeg;base64,{data} 格式
-                                }
-                            ]
-                        }
-                    }
-                    print(f"[Embed] Calling API with Base64 Data URI (total length: {len(img_b64)})")
-                    return await qwen_embed(input_data)
-                else:
-                    print(f"[Embed] ERROR: process_image returned None")
-                    return None
-            else:
+            if not image_data:
                 print(f"[Embed] ERROR: download_image returned None")
                 return None
+            print(f"[Embed] Downloaded {len(image_data)} bytes, processing...")
+            img_b64 = await process_image_async(image_data)
+            if not img_b64:
+                print(f"[Embed] ERROR: process_image returned None")
+                return None
+            # 重要：process_image 返回的是完整的 Data URI 格式（data:image/jpeg;base64,xxx）
+            # API 要求使用完整的 Data URI 格式，不要去掉前缀！
+            print(f"[Embed] Processed to Base64 Data URI (length: {len(img_b64)})")
+            return img_b64
         except Exception as e:
             print(f"[Embed] EXCEPTION downloading/processing image: {type(e).__name__}: {str(e)}")
             import traceback
@@ -170,27 +548,68 @@ async def embed_image(image_base64_or_url: str) -> Optional[List[float]]:
     # 处理 base64 格式（通常是这种情况，因为 pipeline.py 已经下载并转换了）
     # 重要：API 要求 Base64 格式必须是完整的 Data URI：data:image/{format};base64,{data}
     # 不要去掉前缀！直接使用 process_image 返回的完整格式
-    image_data_for_api = image_base64_or_url
-    
-    # 如果已经是 Data URI 格式（data:image/jpeg;base64,xxx），直接使用
     if image_base64_or_url.startswith("data:image"):
-        print(f"[Embed] Using Base64 Data URI format (length: {len(image_data_for_api)})")
-    else:
-        # 如果是纯 base64 字符串（理论上不应该发生，因为 process_image 总是返回 Data URI）
-        # 但为了兼容性，我们添加前缀
-        print(f"[Embed] WARNING: Raw Base64 detected, adding Data URI prefix")
-        image_data_for_api = f"data:image/jpeg;base64,{image_base64_or_url}"
-    
-    input_data = {
-        "input": {
-            "contents": [
-                {
-                    "image": image_data_for_api  # 使用完整的 Data URI 格式
-                }
-            ]
-        }
-    }
+        return image_base64_or_url
+    
+    # 如果是纯 base64 字符串（理论上不应该发生，因为 process_image 总是返回 Data URI）
+    # 但为了兼容性，我们添加前缀
+    print(f"[Embed] WARNING: Raw Base64 detected, adding Data URI prefix")
+    return f"data:image/jpeg;base64,{image_base64_or_url}"
+
+
+async def embed_image(image_base64_or_url: str, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+    """
+    生成图像的 Embedding 向量
+    
+    注意：
+    - 如果输入是 URL，会先下载并转换为 Base64，避免 API "download form url error" 错误
+    - 如果输入是 Base64（data:image/jpeg;base64,xxx 格式），直接使用
+    
+    通常从 pipeline.py 调用时，传入的应该是 Base64（因为 pipeline 已经下载并处理了）
+    但如果直接传入 URL，此函数也会处理
+    
+    Args:
+        image_base64_or_url: Base64编码的图片（data:image/jpeg;base64,xxx 格式）或图片URL
+        timeout: 调用方截止时间（秒，包含下载时间），超时返回 None
+    
+    Returns:
+        Embedding向量，失败返回None
+    """
+    return await _with_deadline(_embed_image(image_base64_or_url), timeout, None)
+
+
+async def _embed_image(image_base64_or_url: str) -> Optional[np.ndarray]:
+    image_data_for_api = await _image_to_data_uri(image_base64_or_url)
+    if not image_data_for_api:
+        return None
     
     print(f"[Embed] Calling API with Base64 Data URI (total length: {len(image_data_for_api)})")
-    return await qwen_embed(input_data)
+    # 使用完整的 data:image/jpeg;base64,{data} 格式
+    return await _embed_one({"image": image_data_for_api})
+
+
+async def embed_images(images: List[str], timeout: Optional[float] = None) -> List[Optional[np.ndarray]]:
+    """
+    批量生成图像 Embedding 向量
+    
+    输入可以是 Data URI 或 URL（URL 会先并发下载并处理），随后按 provider 限制
+    （条数 / 图片张数 / 请求体大小）打包成尽量少的请求
+    
+    Args:
+        images: Base64 Data URI 或图片 URL 列表
+        timeout: 调用方截止时间（秒，包含下载时间），超时所有条目返回 None
+    
+    Returns:
+        与 images 一一对应的向量列表，下载/处理/embedding 失败的条目为 None
+    """
+    images = images or []
+    return await _with_deadline(_embed_images(images), timeout, [None] * len(images))
+
 
+async def _embed_images(images: List[str]) -> List[Optional[np.ndarray]]:
+    data_uris = await asyncio.gather(*[
+        _image_to_data_uri(img) if img else asyncio.sleep(0, result=None)
+        for img in images
+    ])
+    contents = [{"image": uri} if uri else None for uri in data_uris]
+    return await _embed_many(contents)
@@ -0,0 +1,248 @@
+"""
+Embedding 内容寻址缓存
+key = hash(model, dimensions, modality, 规范化后的内容)
+
+两级缓存：
+- 内存：按字节数限制的 LRU
+- 磁盘：SQLite，进程重启后仍然有效
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from . import metrics
+from .config import (
+    MM_EMBED_MODEL,
+    MM_EMBED_DIM,
+    EMBED_CACHE_ENABLED,
+    EMBED_CACHE_MEMORY_BYTES,
+    EMBED_CACHE_DIR,
+    EMBED_CACHE_DISK_MAX_BYTES,
+)
+
+# 每写入多少条检查一次磁盘容量
+_DISK_PRUNE_EVERY = 256
+
+
+def normalize_content(modality: str, value: str) -> str:
+    """
+    规范化内容，使语义相同的输入得到相同的 key
+    
+    - 文本：Unicode NFC + 合并连续空白
+    - 图片：Data URI / Base64 去掉空白字符（URL 原样保留）
+    """
+    if modality == "text":
+        return " ".join(unicodedata.normalize("NFC", value).split())
+    return "".join(value.split())
+
+
+def make_key(modality: str, value: str, model: str = MM_EMBED_MODEL, dimensions: int = MM_EMBED_DIM) -> str:
+    h = hashlib.sha256()
+    h.update(f"{model}\x00{dimensions}\x00{modality}\x00".encode("utf-8"))
+    h.update(normalize_content(modality, value).encode("utf-8"))
+    return h.hexdigest()
+
+
+def content_key(content: dict, model: str = MM_EMBED_MODEL, dimensions: int = MM_EMBED_DIM) -> Optional[str]:
+    """为单个 API content（{"text": ...} 或 {"image": ...}）计算缓存 key（区分 provider 模型与维度）"""
+    if content.get("text"):
+        return make_key("text", content["text"], model, dimensions)
+    if content.get("image"):
+        return make_key("image", content["image"], model, dimensions)
+    return None
+
+
+class EmbeddingCache:
+    """内存 LRU（按字节）+ SQLite 磁盘两级缓存"""
+
+    def __init__(self, memory_bytes: int, db_path: Optional[Path], disk_max_bytes: int):
+        self._memory_limit = max(0, memory_bytes)
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_max_bytes = disk_max_bytes
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes_since_prune = 0
+        if db_path is not None:
+            try:
+                db_path.parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute("""
+                    CREATE TABLE IF NOT EXISTS embeddings (
+                        key TEXT PRIMARY KEY,
+                        vec BLOB NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                """)
+                self._db.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_accessed ON embeddings(accessed_at)")
+                self._db.commit()
+                print(f"[EmbedCache] Disk tier at {db_path}")
+            except Exception as e:
+                print(f"[EmbedCache] WARNING: disk tier disabled ({type(e).__name__}: {e})")
+                self._db = None
+        metrics.register_gauge("embed_cache_memory_bytes", lambda: self._memory_bytes)
+        metrics.register_gauge("embed_cache_memory_entries", lambda: len(self._memory))
+    
+    # ---- 内存层 ----
+
+    def _memory_get(self, key: str) -> Optional[np.ndarray]:
+        vec = self._memory.get(key)
+        if vec is not None:
+            self._memory.move_to_end(key)
+        return vec
+
+    def _memory_put(self, key: str, vec: np.ndarray):
+        if vec.nbytes > self._memory_limit:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old.nbytes
+        self._memory[key] = vec
+        self._memory_bytes += vec.nbytes
+        while self._memory_bytes > self._memory_limit and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+            metrics.inc("embed_cache_evictions_memory")
+    
+    # ---- 磁盘层（在线程池中执行，避免阻塞事件循环）----
+
+    def _disk_get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        if self._db is None or not keys:
+            return {}
+        found: Dict[str, np.ndarray] = {}
+        with self._db_lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).copy()
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE embeddings SET accessed_at = ? WHERE key = ?",
+                    [(now, k) for k in found],
+                )
+                self._db.commit()
+        return found
+
+    def _disk_put_many(self, entries: List[Tuple[str, np.ndarray]]):
+        if self._db is None or not entries:
+            return
+        now = time.time()
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec, accessed_at) VALUES (?, ?, ?)",
+                [(k, v.tobytes(), now) for k, v in entries],
+            )
+            self._db.commit()
+            self._writes_since_prune += len(entries)
+            if self._writes_since_prune >= _DISK_PRUNE_EVERY:
+                self._writes_since_prune = 0
+                self._disk_prune()
+
+    def _disk_prune(self):
+        """磁盘超出容量时，按最近访问时间淘汰最旧的条目（调用方持有锁）"""
+        total = self._db.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()[0]
+        if total <= self._disk_max_bytes:
+            return
+        target = int(self._disk_max_bytes * 0.9)
+        removed = 0
+        for key, size in self._db.execute(
+            "SELECT key, LENGTH(vec) FROM embeddings ORDER BY accessed_at ASC"
+        ).fetchall():
+            if total <= target:
+                break
+            self._db.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+            total -= size
+            removed += 1
+        self._db.commit()
+        metrics.inc("embed_cache_evictions_disk", removed)
+        print(f"[EmbedCache] Pruned {removed} disk entries (now {total} bytes)")
+    
+    # ---- 对外接口 ----
+
+    async def get_many(self, keys: Iterable[Optional[str]]) -> Dict[str, np.ndarray]:
+        """批量查询，返回命中的 {key: vector}"""
+        found: Dict[str, np.ndarray] = {}
+        disk_keys: List[str] = []
+        for key in dict.fromkeys(keys):
+            if key is None:
+                continue
+            vec = self._memory_get(key)
+            if vec is not None:
+                found[key] = vec
+                metrics.inc("embed_cache_hits_memory")
+            else:
+                disk_keys.append(key)
+        if disk_keys and self._db is not None:
+            try:
+                disk_found = await asyncio.to_thread(self._disk_get_many, disk_keys)
+            except Exception as e:
+                print(f"[EmbedCache] Disk read failed: {type(e).__name__}: {e}")
+                disk_found = {}
+            for key, vec in disk_found.items():
+                self._memory_put(key, vec)
+                found[key] = vec
+            metrics.inc("embed_cache_hits_disk", len(disk_found))
+            metrics.inc("embed_cache_misses", len(disk_keys) - len(disk_found))
+        else:
+            metrics.inc("embed_cache_misses", len(disk_keys))
+        return found
+
+    async def put_many(self, entries: Iterable[Tuple[Optional[str], Optional[np.ndarray]]]):
+        """批量写入（key 或向量为 None 的条目会被忽略）"""
+        arrays: List[Tuple[str, np.ndarray]] = []
+        for key, vec in entries:
+            if key is None or vec is None:
+                continue
+            arr = np.ascontiguousarray(vec, dtype=np.float32)
+            self._memory_put(key, arr)
+            arrays.append((key, arr))
+        if arrays and self._db is not None:
+            try:
+                await asyncio.to_thread(self._disk_put_many, arrays)
+            except Exception as e:
+                print(f"[EmbedCache] Disk write failed: {type(e).__name__}: {e}")
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+
+# 缓存（单例）
+_cache: Optional[EmbeddingCache] = None
+
+
+def get_embed_cache() -> Optional[EmbeddingCache]:
+    """获取 Embedding 缓存；EMBED_CACHE_ENABLED=false 时返回 None"""
+    global _cache
+    if not EMBED_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        db_path = Path(EMBED_CACHE_DIR) / "embeddings.sqlite3" if EMBED_CACHE_DIR else None
+        _cache = EmbeddingCache(EMBED_CACHE_MEMORY_BYTES, db_path, EMBED_CACHE_DISK_MAX_BYTES)
+    return _cache
+
+
+def close_embed_cache():
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
@@ -0,0 +1,55 @@
+"""
+内容指纹：title / description / image 规范化后的哈希
+
+随向量一起存入数据库（content_fingerprint 列）。再次 ingest 时指纹不变的条目直接复用已存储的向量，
+只对新增或内容变化的条目调用 embedding（已存储向量的模型 / 版本过期时同样重新生成）
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Dict, Optional
+
+from .embed import embedding_tag
+from .embed_cache import normalize_content
+from .fuse import FUSED_EMBEDDING_MODE, is_fused_item
+
+# 指纹格式版本：规范化规则变化时递增，旧指纹自然失配
+_FINGERPRINT_VERSION = "v1"
+
+
+def content_fingerprint(title: Optional[str], description: Optional[str], image: Optional[str]) -> str:
+    h = hashlib.sha256()
+    h.update(f"{_FINGERPRINT_VERSION}\x00".encode("utf-8"))
+    for modality, value in (("text", title), ("text", description), ("image", image)):
+        h.update(normalize_content(modality, value or "").encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def item_fingerprint(item: Dict[str, Any]) -> str:
+    """按 OpenGraph 条目计算指纹（标题缺失时与 extract_text_from_item 一样退回 tab_title）"""
+    return content_fingerprint(item.get("title") or item.get("tab_title"), item.get("description"), item.get("image"))
+
+
+def reusable_vectors(item: Dict[str, Any], stored: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    指纹一致且向量由当前模型 / 版本生成时，返回可复用的已存储向量
+    {"text_embedding": ..., "image_embedding": ...}，否则返回 {}
+    
+    只返回非空的向量：上次某一路生成失败时，这一路仍会重新生成。
+    fused 模式存储的行返回 {"text_embedding": 融合向量, "image_embedding": None, "embedding_mode": "fused"}：
+    融合向量已经包含图像，图像这一路不需要再生成
+    """
+    if not stored or stored.get("content_fingerprint") != item_fingerprint(item):
+        return {}
+    if (stored.get("embed_model"), stored.get("embed_version")) != embedding_tag():
+        return {}
+    if is_fused_item(stored):
+        if stored.get("text_embedding") is None:
+            return {}
+        return {"text_embedding": stored["text_embedding"], "image_embedding": None, "embedding_mode": FUSED_EMBEDDING_MODE}
+    return {
+        key: stored[key]
+        for key in ("text_embedding", "image_embedding")
+        if stored.get(key) is not None
+    }
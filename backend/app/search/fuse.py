@@ -4,9 +4,21 @@
 """
 from __future__ import annotations
 
-from typing import List, Tuple
+from typing import Any, Dict, List, Tuple
 import numpy as np
 
+# INGEST_EMBED_MODE=fused 生成的条目：文本 + 图像的融合向量只存在 text_embedding 一列（image_embedding 为空），
+# 条目上（入库后在 metadata 中）标记 embedding_mode = "fused"
+FUSED_EMBEDDING_MODE = "fused"
+
+
+def is_fused_item(item: Dict[str, Any]) -> bool:
+    """条目的 text_embedding 是否为文本 + 图像的融合向量"""
+    metadata = item.get("metadata")
+    return item.get("embedding_mode") == FUSED_EMBEDDING_MODE or (
+        isinstance(metadata, dict) and metadata.get("embedding_mode") == FUSED_EMBEDDING_MODE
+    )
+
 
 def normalize_scores(scores: List[float], method: str = "minmax") -> List[float]:
     """
@@ -59,6 +71,7 @@ def fuse_similarity_scores(
     weights: Tuple[float, float] = (0.6, 0.4),
     has_text: bool = True,
     has_image: bool = True,
+    fused: bool = False,
 ) -> float:
     """
     融合文本和图像相似度分数
@@ -69,10 +82,15 @@ def fuse_similarity_scores(
         weights: 融合权重 (text_weight, image_weight)
         has_text: 是否有文本向量
         has_image: 是否有图像向量
+        fused: 文本向量是入库时已经融合的文本 + 图像向量（见 is_fused_item）：
+            text_sim 就是整个条目的相似度，不再按权重拆分，也不与 image_sim 叠加
     
     Returns:
         融合后的相似度分数
     """
+    if fused:
+        return text_sim if has_text else 0.0
+    
     # 如果只有文本或只有图像，使用单一相似度
     if has_text and not has_image:
         return text_sim
@@ -86,19 +104,20 @@ def fuse_similarity_scores(
     return wt * text_sim + wi * image_sim
 
 
-def cosine_similarity(a: List[float], b: List[float], verbose: bool = False) -> float:
+def cosine_similarity(a: np.ndarray, b: np.ndarray, verbose: bool = False) -> float:
     """
     计算两个向量的余弦相似度
     
     Args:
-        a: 向量A
+        a: 向量A（float32 数组；list 也可以，会被转换）
         b: 向量B
         verbose: 是否打印详细日志
     
     Returns:
         余弦相似度分数 [0, 1]
     """
-    va, vb = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    # 已经是 float32 数组时不复制
+    va, vb = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
     
     # 检查维度是否匹配
     if len(va) != len(vb):
@@ -112,8 +131,8 @@ def cosine_similarity(a: List[float], b: List[float], verbose: bool = False) ->
             print(f"[Cosine] Zero norm detected: na={na:.10f}, nb={nb:.10f}")
         return 0.0
     
-    dot_product = np.dot(va, vb)
-    similarity = float(dot_product / (na * nb))
+    dot_product = float(np.dot(va, vb))
+    similarity = float(dot_product / (float(na) * float(nb)))
     
     if verbose:
         print(f"[Cosine] Similarity: {similarity:.10f} (dot={dot_product:.6f}, na={na:.6f}, nb={nb:.6f})")
@@ -0,0 +1,137 @@
+"""
+共享 HTTP 客户端模块
+为 DashScope Embedding 调用，以及抓取网页 / og:image 提供应用级连接池（keep-alive），
+由 FastAPI 的 startup / shutdown 钩子负责创建和关闭
+"""
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from .config import (
+    EMBED_HTTP_TIMEOUT_S,
+    EMBED_HTTP_CONNECT_TIMEOUT_S,
+    EMBED_HTTP_MAX_CONNECTIONS,
+    EMBED_HTTP_MAX_KEEPALIVE,
+    EMBED_HTTP_KEEPALIVE_EXPIRY_S,
+    EMBED_HTTP_MAX_PER_HOST,
+    EMBED_HTTP2,
+    FETCH_HTTP_TIMEOUT_S,
+    FETCH_HTTP_CONNECT_TIMEOUT_S,
+    FETCH_HTTP_MAX_CONNECTIONS,
+    FETCH_HTTP_MAX_KEEPALIVE,
+    FETCH_HTTP_KEEPALIVE_EXPIRY_S,
+)
+
+# HTTP/2 需要可选依赖 h2（pip install "httpx[http2]"），缺失时退回 HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 连接池（单例）
+_embed_client: Optional[httpx.AsyncClient] = None
+_fetch_client: Optional[httpx.AsyncClient] = None
+# 每个 host 的并发限制（按事件循环懒加载：换了事件循环时重新创建）
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+_host_semaphores_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _create_embed_client() -> httpx.AsyncClient:
+    http2 = EMBED_HTTP2 and HTTP2_AVAILABLE
+    if EMBED_HTTP2 and not HTTP2_AVAILABLE:
+        print("[HTTP] WARNING: h2 not installed, embedding client falls back to HTTP/1.1")
+    client = httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(EMBED_HTTP_TIMEOUT_S, connect=EMBED_HTTP_CONNECT_TIMEOUT_S),
+        limits=httpx.Limits(
+            max_connections=EMBED_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=EMBED_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=EMBED_HTTP_KEEPALIVE_EXPIRY_S,
+        ),
+    )
+    print(
+        f"[HTTP] Embedding client created (http2={http2}, max_connections={EMBED_HTTP_MAX_CONNECTIONS}, "
+        f"max_keepalive={EMBED_HTTP_MAX_KEEPALIVE}, max_per_host={EMBED_HTTP_MAX_PER_HOST})"
+    )
+    return client
+
+
+async def init_embed_client() -> httpx.AsyncClient:
+    """应用启动时创建共享的 Embedding 客户端"""
+    return get_embed_client()
+
+
+def get_embed_client() -> httpx.AsyncClient:
+    """
+    获取共享的 Embedding 客户端（单例）
+    
+    正常情况下由 startup 钩子创建；脚本等未经过 FastAPI 启动流程的场景会在首次调用时懒加载
+    """
+    global _embed_client
+    if _embed_client is None or _embed_client.is_closed:
+        _embed_client = _create_embed_client()
+    return _embed_client
+
+
+async def close_embed_client():
+    """关闭共享的 Embedding 客户端"""
+    global _embed_client
+    if _embed_client is not None:
+        await _embed_client.aclose()
+        _embed_client = None
+    _host_semaphores.clear()
+
+
+def get_fetch_client() -> httpx.AsyncClient:
+    """
+    获取抓取网页 / 图片用的共享客户端（单例，首次调用时创建）
+    
+    跟随重定向；同一 host 的请求复用 keep-alive 连接，不再每张图片新建 AsyncClient
+    """
+    global _fetch_client
+    if _fetch_client is None or _fetch_client.is_closed:
+        _fetch_client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(FETCH_HTTP_TIMEOUT_S, connect=FETCH_HTTP_CONNECT_TIMEOUT_S),
+            limits=httpx.Limits(
+                max_connections=FETCH_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=FETCH_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=FETCH_HTTP_KEEPALIVE_EXPIRY_S,
+            ),
+        )
+    return _fetch_client
+
+
+async def close_fetch_client():
+    """关闭抓取用的共享客户端"""
+    global _fetch_client
+    if _fetch_client is not None:
+        await _fetch_client.aclose()
+        _fetch_client = None
+
+
+@asynccontextmanager
+async def host_slot(url: str, limit: int = EMBED_HTTP_MAX_PER_HOST):
+    """
+    按 host 限制并发请求数
+    
+    httpx.Limits 只能限制整个连接池，这里额外为每个 host 加一个信号量
+    """
+    global _host_semaphores_loop
+    loop = asyncio.get_running_loop()
+    if _host_semaphores_loop is not loop:
+        _host_semaphores.clear()
+        _host_semaphores_loop = loop
+    host = urlparse(url).netloc.lower()
+    sem = _host_semaphores.get(host)
+    if sem is None:
+        sem = asyncio.Semaphore(max(1, limit))
+        _host_semaphores[host] = sem
+    async with sem:
+        yield
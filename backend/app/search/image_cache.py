@@ -0,0 +1,267 @@
+"""
+磁盘图片缓存
+同一张 CDN 图片（xhscdn、pinimg 等）会被不同用户、每次重新整理时反复下载。
+这里按 URL 缓存处理后的 JPEG（process_image 的输出），重启后仍然有效：
+
+- 图片文件按内容哈希存放（blobs/ab/abcdef....jpg），不同 URL 指向同一张图片时只存一份
+- SQLite 索引保存 URL → 内容哈希、原图尺寸、ETag / Last-Modified、最近验证时间和预处理版本；
+  预处理参数变化后（preprocess.PREPROCESS_VERSION 不同）旧条目视为未命中，重新下载处理
+- IMAGE_CACHE_FRESH_S 内直接使用；之后用 If-None-Match / If-Modified-Since 条件请求重新验证
+- 超过 IMAGE_CACHE_TTL_S 未验证的条目、以及超出 IMAGE_CACHE_MAX_BYTES 时最久未访问的条目被淘汰
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from . import metrics
+from .config import (
+    IMAGE_CACHE_ENABLED,
+    IMAGE_CACHE_DIR,
+    IMAGE_CACHE_MAX_BYTES,
+    IMAGE_CACHE_FRESH_S,
+    IMAGE_CACHE_TTL_S,
+)
+
+# 每写入多少张图片检查一次磁盘容量
+_PRUNE_EVERY = 64
+
+
+class CachedImage(NamedTuple):
+    """缓存条目：处理后的 JPEG 字节 + 原图尺寸 + 重新验证用的元数据"""
+    data: bytes
+    width: int
+    height: int
+    content_hash: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    validated_at: float
+
+    def is_fresh(self) -> bool:
+        return time.time() - self.validated_at < IMAGE_CACHE_FRESH_S
+
+    def revalidation_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ImageCache:
+    """SQLite 索引 + 内容寻址的图片文件"""
+
+    def __init__(self, root: Path, max_bytes: int, ttl_s: float):
+        self.root = root
+        self._blob_dir = root / "blobs"
+        self._max_bytes = max_bytes
+        self._ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._blob_dir.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(root / "index.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                validated_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                version TEXT NOT NULL DEFAULT ''
+            )
+        """)
+        # 旧版本的索引没有 version 列：补上（旧条目版本为空，读取时视为未命中）
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(images)")}
+        if "version" not in columns:
+            self._db.execute("ALTER TABLE images ADD COLUMN version TEXT NOT NULL DEFAULT ''")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                content_hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_images_accessed ON images(accessed_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_images_hash ON images(content_hash)")
+        self._db.commit()
+        metrics.register_gauge("image_cache_bytes", self._total_bytes)
+        print(f"[ImageCache] Disk cache at {root}")
+
+    def _blob_path(self, content_hash: str) -> Path:
+        return self._blob_dir / content_hash[:2] / f"{content_hash}.jpg"
+
+    def _total_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+    
+    # ---- 同步实现（在线程池中执行，避免阻塞事件循环）----
+
+    def _get(self, url: str, version: str) -> Optional[CachedImage]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_hash, width, height, etag, last_modified, validated_at, version FROM images WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            content_hash, width, height, etag, last_modified, validated_at, row_version = row
+            if row_version != version or time.time() - validated_at > self._ttl_s:
+                # 过期，或者是用旧的预处理参数生成的
+                self._db.execute("DELETE FROM images WHERE url = ?", (url,))
+                self._release_blob(content_hash)
+                self._db.commit()
+                return None
+            try:
+                data = self._blob_path(content_hash).read_bytes()
+            except FileNotFoundError:
+                # 文件被外部清理（例如 /tmp 被回收）：丢弃索引
+                self._db.execute("DELETE FROM images WHERE url = ?", (url,))
+                self._db.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE images SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+        return CachedImage(data, width, height, content_hash, etag, last_modified, validated_at)
+
+    def _put(self, url: str, version: str, data: bytes, width: int, height: int,
+             etag: Optional[str], last_modified: Optional[str]) -> CachedImage:
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(content_hash)
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT content_hash FROM images WHERE url = ?", (url,)).fetchone()
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs (content_hash, size) VALUES (?, ?)",
+                (content_hash, len(data)),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO images "
+                "(url, content_hash, width, height, etag, last_modified, validated_at, accessed_at, version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, content_hash, width, height, etag, last_modified, now, now, version),
+            )
+            if old is not None and old[0] != content_hash:
+                self._release_blob(old[0])
+            self._db.commit()
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= _PRUNE_EVERY:
+                self._writes_since_prune = 0
+                self._prune()
+        return CachedImage(data, width, height, content_hash, etag, last_modified, now)
+
+    def _touch(self, url: str, etag: Optional[str], last_modified: Optional[str]):
+        """304 Not Modified：刷新验证时间（服务器返回了新的验证器时一并更新）"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE images SET validated_at = ?, accessed_at = ?, "
+                "etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (now, now, etag, last_modified, url),
+            )
+            self._db.commit()
+
+    def _release_blob(self, content_hash: str) -> int:
+        """图片不再被任何 URL 引用时删除文件，返回释放的字节数（调用方持有锁，负责 commit）"""
+        if self._db.execute("SELECT 1 FROM images WHERE content_hash = ? LIMIT 1", (content_hash,)).fetchone():
+            return 0
+        row = self._db.execute("SELECT size FROM blobs WHERE content_hash = ?", (content_hash,)).fetchone()
+        self._blob_path(content_hash).unlink(missing_ok=True)
+        self._db.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+        return row[0] if row else 0
+
+    def _prune(self):
+        """淘汰过期条目；超出容量时按最近访问时间淘汰最旧的条目（调用方持有锁）"""
+        expired = self._db.execute(
+            "SELECT url, content_hash FROM images WHERE validated_at < ?", (time.time() - self._ttl_s,)
+        ).fetchall()
+        removed = 0
+        for url, content_hash in expired:
+            self._db.execute("DELETE FROM images WHERE url = ?", (url,))
+            removed += self._release_blob(content_hash) > 0
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total > self._max_bytes:
+            target = int(self._max_bytes * 0.9)
+            for url, content_hash in self._db.execute(
+                "SELECT url, content_hash FROM images ORDER BY accessed_at ASC"
+            ).fetchall():
+                if total <= target:
+                    break
+                self._db.execute("DELETE FROM images WHERE url = ?", (url,))
+                freed = self._release_blob(content_hash)
+                total -= freed
+                removed += freed > 0
+        self._db.commit()
+        if expired or removed:
+            metrics.inc("image_cache_evictions", removed)
+            print(f"[ImageCache] Pruned {len(expired)} expired URL(s), {removed} image(s) (now {total} bytes)")
+    
+    # ---- 对外接口 ----
+
+    async def get(self, url: str, version: str = "") -> Optional[CachedImage]:
+        """读取缓存；条目的预处理版本与 version 不同时视为未命中"""
+        try:
+            return await asyncio.to_thread(self._get, url, version)
+        except Exception as e:
+            print(f"[ImageCache] Read failed: {type(e).__name__}: {e}")
+            return None
+
+    async def put(self, url: str, data: bytes, width: int, height: int,
+                  etag: Optional[str] = None, last_modified: Optional[str] = None, version: str = "") -> CachedImage:
+        """写入缓存并返回条目；写入失败时仍返回（未持久化的）条目"""
+        try:
+            return await asyncio.to_thread(self._put, url, version, data, width, height, etag, last_modified)
+        except Exception as e:
+            print(f"[ImageCache] Write failed: {type(e).__name__}: {e}")
+            return CachedImage(data, width, height, hashlib.sha256(data).hexdigest(), etag, last_modified, time.time())
+
+    async def touch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        try:
+            await asyncio.to_thread(self._touch, url, etag, last_modified)
+        except Exception as e:
+            print(f"[ImageCache] Write failed: {type(e).__name__}: {e}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# 缓存（单例）
+_cache: Optional[ImageCache] = None
+_disabled = not (IMAGE_CACHE_ENABLED and IMAGE_CACHE_DIR)
+
+
+def get_image_cache() -> Optional[ImageCache]:
+    """获取图片缓存；IMAGE_CACHE_ENABLED=false、IMAGE_CACHE_DIR 为空或目录不可写时返回 None"""
+    global _cache, _disabled
+    if _disabled:
+        return None
+    if _cache is None:
+        try:
+            _cache = ImageCache(Path(IMAGE_CACHE_DIR), IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_TTL_S)
+        except Exception as e:
+            print(f"[ImageCache] WARNING: disabled ({type(e).__name__}: {e})")
+            _disabled = True
+    return _cache
+
+
+def close_image_cache():
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
@@ -0,0 +1,101 @@
+"""
+图片处理执行池
+PIL 解码、LANCZOS 缩放、多轮 JPEG 编码和 Base64 都是 CPU 密集操作，放在事件循环线程里执行时
+一张 4K 截图就会卡住同一 worker 上的所有请求。所有图片处理都通过 run_image_task() 交给独立的执行池：
+
+- IMAGE_POOL_KIND=thread：线程池（默认；PIL 的缩放 / 编码会释放 GIL）
+- IMAGE_POOL_KIND=process：进程池（完全绕开 GIL，代价是图片字节需要在进程间复制）
+
+同时提交给执行池的任务数不超过 IMAGE_POOL_MAX_PENDING，超出的调用方在事件循环里等待，
+排队深度和耗时见 image_pool_* 指标
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from . import metrics
+from .config import IMAGE_POOL_KIND, IMAGE_POOL_WORKERS, IMAGE_POOL_MAX_PENDING
+
+
+class ImagePool:
+    """有界的图片处理执行池"""
+
+    def __init__(self, kind: str, workers: int, max_pending: int):
+        self.kind = kind if kind in ("thread", "process") else "thread"
+        self.workers = max(1, workers)
+        self._executor: Optional[Executor] = None
+        self._slots = asyncio.Semaphore(max(self.workers, max_pending))
+        self.loop = asyncio.get_running_loop()
+        self._waiting = 0
+        self._running = 0
+        metrics.register_gauge("image_pool_queue_depth", lambda: self._waiting)
+        metrics.register_gauge("image_pool_in_flight", lambda: self._running)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        started = time.monotonic()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        self._running += 1
+        submitted = time.monotonic()
+        metrics.observe("image_pool_wait_ms", (submitted - started) * 1000.0)
+        try:
+            return await self.loop.run_in_executor(self._get_executor(), functools.partial(fn, *args))
+        except BrokenProcessPool:
+            # 子进程异常退出（例如被 OOM kill）：丢弃整个进程池，下次调用时重建
+            print(f"[ImagePool] Process pool broken while running {getattr(fn, '__name__', fn)}, recreating")
+            metrics.inc("image_pool_broken")
+            self.shutdown(wait=False)
+            return None
+        finally:
+            self._running -= 1
+            self._slots.release()
+            metrics.observe("image_pool_run_ms", (time.monotonic() - submitted) * 1000.0)
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+
+# 图片处理执行池（按事件循环懒加载）
+_pool: Optional[ImagePool] = None
+
+
+def get_image_pool() -> ImagePool:
+    global _pool
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool.loop is not loop:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ImagePool(IMAGE_POOL_KIND, IMAGE_POOL_WORKERS, IMAGE_POOL_MAX_PENDING)
+        print(f"[ImagePool] {_pool.kind} pool with {_pool.workers} worker(s)")
+    return _pool
+
+
+async def run_image_task(fn: Callable[..., Any], *args: Any) -> Any:
+    """在图片执行池中运行 fn(*args)；进程池模式下 fn 和参数必须可以被 pickle"""
+    return await get_image_pool().run(fn, *args)
+
+
+def close_image_pool():
+    """关闭执行池（shutdown 时调用）"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
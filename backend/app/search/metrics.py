@@ -0,0 +1,104 @@
+"""
+进程内指标模块
+提供计数器、仪表盘和分布统计，通过 /api/v1/search/metrics 暴露给运维查看
+"""
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+# 分布统计保留最近 N 个样本，用于计算分位数
+SUMMARY_WINDOW = 1024
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_gauge_callbacks: Dict[str, Callable[[], float]] = {}
+_summaries: Dict[str, "_Summary"] = {}
+
+
+class _Summary:
+    """简单的分布统计：总数、总和、最值，以及滑动窗口内的分位数"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.recent: Deque[float] = deque(maxlen=SUMMARY_WINDOW)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.recent.append(value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.recent:
+            return None
+        values = sorted(self.recent)
+        idx = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+        return values[idx]
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 4),
+            "avg": round(self.total / self.count, 4) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+def inc(name: str, value: float = 1.0):
+    """计数器 +value"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0.0) + value
+
+
+def set_gauge(name: str, value: float):
+    """设置仪表盘数值"""
+    with _lock:
+        _gauges[name] = value
+
+
+def register_gauge(name: str, callback: Callable[[], float]):
+    """注册回调型仪表盘（在 snapshot 时实时读取，例如队列深度）"""
+    with _lock:
+        _gauge_callbacks[name] = callback
+
+
+def observe(name: str, value: float):
+    """记录一个分布样本（例如批大小、排队耗时）"""
+    with _lock:
+        summary = _summaries.get(name)
+        if summary is None:
+            summary = _summaries[name] = _Summary()
+        summary.observe(value)
+
+
+def get_summary(name: str) -> Optional[_Summary]:
+    return _summaries.get(name)
+
+
+def snapshot() -> Dict:
+    """导出所有指标的当前值"""
+    with _lock:
+        gauges = dict(_gauges)
+        callbacks = dict(_gauge_callbacks)
+        result = {
+            "counters": dict(_counters),
+            "summaries": {name: s.to_dict() for name, s in _summaries.items()},
+        }
+    for name, callback in callbacks.items():
+        try:
+            gauges[name] = callback()
+        except Exception as e:
+            print(f"[Metrics] Failed to read gauge {name}: {e}")
+    result["gauges"] = gauges
+    return result
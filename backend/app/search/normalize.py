@@ -4,6 +4,10 @@ OpenGraph 数据规范化模块
 """
 from typing import Dict, List, Optional, Any, Union
 
+from .canonical import canonicalize_url
+from .config import MM_EMBED_DIM
+from .vectors import as_vector
+
 
 def normalize_opengraph_item(item: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -11,15 +15,17 @@ def normalize_opengraph_item(item: Dict[str, Any]) -> Dict[str, Any]:
     
     规则：
     - url: str (required)
+    - canonical_url: str（canonicalize_url(url)）
     - title: str | None
     - description: str | None
     - image: str | None (必须是字符串，不能是数组)
     - site_name: str | None
     - tab_id: int | None
     - tab_title: str | None
-    - text_embedding: List[float] | None (1024维)
-    - image_embedding: List[float] | None (1024维)
+    - text_embedding: np.ndarray(float32) | None (MM_EMBED_DIM 维，默认 1024)
+    - image_embedding: np.ndarray(float32) | None (MM_EMBED_DIM 维，默认 1024)
     - metadata: Dict | None
+    - embed_model / embed_version: str | None（向量的来源标记，没有向量时不保留）
     - is_doc_card: bool
     - is_screenshot: bool
     - success: bool
@@ -40,6 +46,8 @@ def normalize_opengraph_item(item: Dict[str, Any]) -> Dict[str, Any]:
     if not url:
         raise ValueError("url is required")
     normalized["url"] = str(url).strip()
+    # 规范化 URL：批次内去重和数据库存储的 key（url 保持原样返回给前端）
+    normalized["canonical_url"] = canonicalize_url(normalized["url"])
     
     # 2. title (string | None)
     title = item.get("title") or item.get("og:title") or item.get("tab_title")
@@ -83,31 +91,17 @@ def normalize_opengraph_item(item: Dict[str, Any]) -> Dict[str, Any]:
     tab_title = item.get("tab_title")
     normalized["tab_title"] = str(tab_title).strip() if tab_title else None
     
-    # 8. text_embedding (List[float] | None)
-    text_embedding = item.get("text_embedding")
-    if text_embedding and isinstance(text_embedding, list) and len(text_embedding) > 0:
-        try:
-            # 验证是数字列表
-            normalized["text_embedding"] = [float(x) for x in text_embedding]
-            # 验证维度（应该是1024）
-            if len(normalized["text_embedding"]) != 1024:
-                print(f"[Normalize] Warning: text_embedding has {len(normalized['text_embedding'])} dims, expected 1024")
-        except (ValueError, TypeError):
-            normalized["text_embedding"] = None
-    else:
-        normalized["text_embedding"] = None
+    # 8. text_embedding (float32 数组 | None)
+    # 已经是 float32 数组时不复制；list 只在这里转换一次
+    normalized["text_embedding"] = as_vector(item.get("text_embedding"))
+    # 验证维度（应与当前集合的维度一致）
+    if normalized["text_embedding"] is not None and normalized["text_embedding"].size != MM_EMBED_DIM:
+        print(f"[Normalize] Warning: text_embedding has {normalized['text_embedding'].size} dims, expected {MM_EMBED_DIM}")
     
-    # 9. image_embedding (List[float] | None)
-    image_embedding = item.get("image_embedding")
-    if image_embedding and isinstance(image_embedding, list) and len(image_embedding) > 0:
-        try:
-            normalized["image_embedding"] = [float(x) for x in image_embedding]
-            if len(normalized["image_embedding"]) != 1024:
-                print(f"[Normalize] Warning: image_embedding has {len(normalized['image_embedding'])} dims, expected 1024")
-        except (ValueError, TypeError):
-            normalized["image_embedding"] = None
-    else:
-        normalized["image_embedding"] = None
+    # 9. image_embedding (float32 数组 | None)
+    normalized["image_embedding"] = as_vector(item.get("image_embedding"))
+    if normalized["image_embedding"] is not None and normalized["image_embedding"].size != MM_EMBED_DIM:
+        print(f"[Normalize] Warning: image_embedding has {normalized['image_embedding'].size} dims, expected {MM_EMBED_DIM}")
     
     # 10. metadata (Dict | None)
     metadata = item.get("metadata")
@@ -121,7 +115,13 @@ def normalize_opengraph_item(item: Dict[str, Any]) -> Dict[str, Any]:
     normalized["is_screenshot"] = bool(item.get("is_screenshot", False))
     normalized["success"] = bool(item.get("success", True))
     
-    # 12. 其他字段（保留但不强制）
+    # 12. 向量的来源标记（生成向量的模型 / 预处理版本）
+    if normalized["text_embedding"] is not None or normalized["image_embedding"] is not None:
+        for key in ("embed_model", "embed_version"):
+            if item.get(key):
+                normalized[key] = str(item[key])
+    
+    # 13. 其他字段（保留但不强制）
     if "image_width" in item:
         try:
             normalized["image_width"] = int(item["image_width"]) if item["image_width"] else None
@@ -4,110 +4,124 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
 
 from .config import (
     USE_REMOTE_EMBEDDING,
     USE_IMAGE_EMBEDDING,
-    EMBED_SLEEP_S,
-    QUERY_SLEEP_S,
+    EMBED_QUERY_DEADLINE_S,
+    INGEST_WORKERS,
+    INGEST_MAX_DOWNLOADS,
+    INGEST_MAX_CPU,
+    INGEST_MAX_EMBED_CALLS,
+    INGEST_IMAGE_RESERVE_BYTES,
+    INGEST_EMBED_MODE,
+    INGEST_FUSED_TEXT_WEIGHT,
     get_api_key,
 )
-from .preprocess import download_image, process_image, extract_text_from_item
-from .embed import embed_text, embed_image
-from .rank import sort_by_vector_similarity, fuzzy_score
+from .budget import Reservation, get_image_budget
+from .preprocess import download_image, process_image_async, estimate_image_memory, extract_text_from_item
+from .embed import embed_text, embed_image, embed_text_image, embedding_available, embedding_tag
+from .canonical import canonicalize_url
+from .fingerprint import reusable_vectors
+from .priority import INTERACTIVE, embed_priority
+from .fuse import FUSED_EMBEDDING_MODE
+from .rank import sort_by_vector_similarity, sort_by_fuzzy_score
+from .vectors import has_vector, fuse_vectors
+
+
+# 各阶段的并发上限（进程级单例，多个 ingest 请求共享同一组上限）
+_STAGE_LIMITS = {
+    "download": INGEST_MAX_DOWNLOADS,
+    "cpu": INGEST_MAX_CPU,
+    "embed": INGEST_MAX_EMBED_CALLS,
+}
+# 信号量按事件循环懒加载（与 embed._get_batcher 相同）：换了事件循环时重新创建，不复用绑定在旧循环上的信号量
+_stages: Dict[str, asyncio.Semaphore] = {}
+_stages_loop: Optional[asyncio.AbstractEventLoop] = None
 
 
-async def _build_item_embedding(item: Dict, verbose: bool = False) -> Dict:
+def _stage(name: str) -> asyncio.Semaphore:
+    global _stages_loop
+    loop = asyncio.get_running_loop()
+    if _stages_loop is not loop:
+        _stages.clear()
+        _stages_loop = loop
+    sem = _stages.get(name)
+    if sem is None:
+        sem = _stages[name] = asyncio.Semaphore(max(1, _STAGE_LIMITS[name]))
+    return sem
+
+
+async def _prepare_item_image(item: Dict, verbose: bool = False, reservation: Optional[Reservation] = None) -> Optional[str]:
     """
-    为单个 OpenGraph 项生成文本和图像 embedding
+    准备单个 OpenGraph 项的图片输入（Base64 Data URI），供批量图像 embedding 使用
+    
+    流程：
+    - 如果是截图（Base64）：直接使用
+    - 如果是 OpenGraph 图片 URL：下载 → 处理为 Base64
     
-    使用统一的 qwen2.5-vl-embedding 模型，确保文本和图像在同一向量空间（1024维）
+    reservation 为该图片的字节预算占用，下载完成后按实际大小追加；预算不足被拒绝时返回 None
     """
-    # 提取文本：title + og:title + og:description
-    text = extract_text_from_item(item)
-    text_vec = None
+    # 从 OpenGraph 数据中获取图片（可能是 URL 或 Base64 截图）
+    img_data = item.get("image")
+    is_screenshot = item.get("is_screenshot", False)
     
-    # 文本 embedding（使用统一的 qwen2.5-vl-embedding）
-    if USE_REMOTE_EMBEDDING and text:
-        try:
-            text_vec = await embed_text(text)
-            if verbose:
-                if text_vec:
-                    print(f"[Pipeline] Text vector: {len(text_vec)} dims")
-                else:
-                    print(f"[Pipeline] Text vector: None")
-        except Exception as e:
-            print(f"[Pipeline] ERROR getting text embedding: {type(e).__name__}: {str(e)}")
-            text_vec = None
+    if not img_data:
+        if verbose:
+            print(f"[Pipeline] No image data in OpenGraph item (item.get('image') is empty)")
+        return None
     
-    # 图像 embedding（使用统一的 qwen2.5-vl-embedding）
-    # 流程：
-    # - 如果是截图（Base64）：直接使用
-    # - 如果是 OpenGraph 图片 URL：下载 → 处理为 Base64 → 生成 embedding
-    image_vec = None
-    if USE_REMOTE_EMBEDDING and USE_IMAGE_EMBEDDING:
-        # 从 OpenGraph 数据中获取图片（可能是 URL 或 Base64 截图）
-        img_data = item.get("image")
-        is_screenshot = item.get("is_screenshot", False)
+    if verbose:
+        if is_screenshot:
+            print(f"[Pipeline] Image is screenshot (Base64), length: {len(img_data)}")
+        else:
+            print(f"[Pipeline] Image URL from OpenGraph: {img_data[:60]}...")
+    
+    try:
+        # 检查是否为 Base64 截图（以 data:image 开头）
+        if is_screenshot or (isinstance(img_data, str) and img_data.startswith("data:image")):
+            # 已经是 Base64 格式，直接使用
+            if verbose:
+                print(f"[Pipeline] Using screenshot Base64 directly (length: {len(img_data)})")
+            return img_data
         
-        if img_data:
+        # 是 URL，需要下载并处理
+        # 步骤1：下载图片到内存（来自 opengraph.py 的 og:image URL）
+        async with _stage("download"):
+            image_data = await download_image(img_data)
+        if not image_data:
             if verbose:
-                if is_screenshot:
-                    print(f"[Pipeline] Image is screenshot (Base64), length: {len(img_data)}")
-                else:
-                    print(f"[Pipeline] Image URL from OpenGraph: {img_data[:60]}...")
-            
-            try:
-                # 检查是否为 Base64 截图（以 data:image 开头）
-                if is_screenshot or (isinstance(img_data, str) and img_data.startswith("data:image")):
-                    # 已经是 Base64 格式，直接使用
-                    if verbose:
-                        print(f"[Pipeline] Using screenshot Base64 directly (length: {len(img_data)})")
-                    image_vec = await embed_image(img_data)
-                    if verbose:
-                        if image_vec:
-                            print(f"[Pipeline] Image vector generated from screenshot: {len(image_vec)} dims")
-                        else:
-                            print(f"[Pipeline] Image vector: None (embedding API failed)")
-                else:
-                    # 是 URL，需要下载并处理
-                    # 步骤1：下载图片到内存（来自 opengraph.py 的 og:image URL）
-                    image_data = await download_image(img_data)
-                    if not image_data:
-                        if verbose:
-                            print(f"[Pipeline] Failed to download image from URL")
-                        image_vec = None
-                    else:
-                        if verbose:
-                            print(f"[Pipeline] Downloaded {len(image_data)} bytes from OpenGraph image URL")
-                        
-                        # 步骤2：处理图片（调整大小、压缩、转换为 Base64）
-                        img_b64 = process_image(image_data)
-                        if not img_b64:
-                            if verbose:
-                                print(f"[Pipeline] Failed to process image (process_image returned None)")
-                            image_vec = None
-                        else:
-                            if verbose:
-                                print(f"[Pipeline] Processed image to Base64 (length: {len(img_b64)})")
-                            
-                            # 步骤3：生成 embedding（使用 Base64 数据）
-                            image_vec = await embed_image(img_b64)
-                            if verbose:
-                                if image_vec:
-                                    print(f"[Pipeline] Image vector generated: {len(image_vec)} dims")
-                                else:
-                                    print(f"[Pipeline] Image vector: None (embedding API failed)")
-            except Exception as e:
-                print(f"[Pipeline] ERROR getting image embedding: {type(e).__name__}: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                image_vec = None
-        else:
+                print(f"[Pipeline] Failed to download image from URL")
+            return None
+        if verbose:
+            print(f"[Pipeline] Downloaded {len(image_data)} bytes from OpenGraph image URL")
+        if reservation is not None and not await reservation.grow(estimate_image_memory(image_data)):
+            print(f"[Pipeline] Image budget exhausted, skipping image ({len(image_data)} bytes): {img_data[:60]}...")
+            return None
+        
+        # 步骤2：处理图片（调整大小、压缩、转换为 Base64），在图片执行池中执行，不阻塞事件循环
+        async with _stage("cpu"):
+            img_b64 = await process_image_async(image_data)
+        if not img_b64:
             if verbose:
-                print(f"[Pipeline] No image data in OpenGraph item (item.get('image') is empty)")
-    
+                print(f"[Pipeline] Failed to process image (process_image returned None)")
+            return None
+        if verbose:
+            print(f"[Pipeline] Processed image to Base64 (length: {len(img_b64)})")
+        return img_b64
+    except Exception as e:
+        print(f"[Pipeline] ERROR preparing image: {type(e).__name__}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+def _enrich_item(item: Dict, text: str, text_vec: Optional[np.ndarray], image_vec: Optional[np.ndarray]) -> Dict:
+    """组装带 embedding 的结果项"""
     # 检查是否有任何 embedding
     has_embedding = (text_vec is not None) or (image_vec is not None)
     
@@ -121,45 +135,215 @@ async def _build_item_embedding(item: Dict, verbose: bool = False) -> Dict:
     }
 
 
-async def process_opengraph_for_search(opengraph_items: List[Dict]) -> List[Dict]:
+async def _embed_item_text(text: str) -> Optional[np.ndarray]:
+    if not USE_REMOTE_EMBEDDING or not text:
+        return None
+    try:
+        async with _stage("embed"):
+            return await embed_text(text)
+    except Exception as e:
+        print(f"[Pipeline] ERROR getting text embedding: {type(e).__name__}: {str(e)}")
+        return None
+
+
+@asynccontextmanager
+async def _item_image_input(item: Dict, verbose: bool) -> AsyncIterator[Optional[str]]:
     """
-    批量处理 OpenGraph 数据，生成文本和图像 embedding
+    在字节预算内准备条目的图片输入，退出时释放预算；预算不足或图片无法处理时产出 None
     
-    使用统一的 qwen2.5-vl-embedding 模型，文本和图像在同一向量空间（1024维）
+    字节预算：Base64 截图按请求体和上游请求体两份计；图片 URL 先按预估额度占用，下载后按实际大小追加
+    """
+    img_data = item.get("image") or ""
+    is_data_uri = isinstance(img_data, str) and img_data.startswith("data:")
+    estimate = 2 * len(img_data) if is_data_uri else INGEST_IMAGE_RESERVE_BYTES
+    async with get_image_budget().reserve(estimate) as reservation:
+        if not reservation.admitted:
+            print(f"[Pipeline] Image budget exhausted, skipping image embedding for: {item.get('url', '')[:60]}")
+            yield None
+            return
+        yield await _prepare_item_image(item, verbose=verbose, reservation=reservation)
+
+
+async def _embed_item_image(item: Dict, verbose: bool) -> Optional[np.ndarray]:
+    if not (USE_REMOTE_EMBEDDING and USE_IMAGE_EMBEDDING):
+        return None
+    async with _item_image_input(item, verbose) as image_input:
+        if not image_input:
+            return None
+        try:
+            async with _stage("embed"):
+                return await embed_image(image_input)
+        except Exception as e:
+            print(f"[Pipeline] ERROR getting image embedding: {type(e).__name__}: {str(e)}")
+            return None
+
+
+async def _embed_item_joint(item: Dict, text: str, verbose: bool) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], bool]:
+    """
+    paired / fused 模式：文本和图像放进同一个请求，返回 (text_vec, image_vec, fused)
+    
+    fused 模式下融合向量只放在 text_vec，image_vec 为 None（避免同一个向量在两列各算一次），fused=True
+    """
+    async with _item_image_input(item, verbose) as image_input:
+        if not image_input:
+            return await _embed_item_text(text), None, False
+        try:
+            async with _stage("embed"):
+                text_vec, image_vec = await embed_text_image(text, image_input)
+        except Exception as e:
+            print(f"[Pipeline] ERROR getting joint embedding: {type(e).__name__}: {str(e)}")
+            return None, None, False
+    if INGEST_EMBED_MODE == "fused" and text_vec is not None and image_vec is not None:
+        return fuse_vectors(text_vec, image_vec, INGEST_FUSED_TEXT_WEIGHT), None, True
+    return text_vec, image_vec, False
+
+
+async def _process_item(item: Dict, text: str, verbose: bool = False, reuse: Optional[Dict] = None) -> Dict:
     """
+    单个条目：文本 embedding 与图片下载 → 处理 → 图像 embedding 并行进行
+    
+    reuse 为内容指纹一致时可复用的已存储向量（见 fingerprint.reusable_vectors），命中的那一路不再生成；
+    INGEST_EMBED_MODE 为 paired / fused 且文本和图片都需要生成时，两者合并为一次请求
+    结果带有生成向量的 embed_model / embed_version（复用的向量只在来源标记与当前一致时才会命中，标记相同）
+    """
+    reuse = reuse or {}
+    # 在生成之前取标记：处理过程中切换 provider 时，向量仍按实际生成它们的模型入库
+    embed_model, embed_version = embedding_tag()
+
+    async def text_vec():
+        if "text_embedding" in reuse:
+            return reuse["text_embedding"]
+        return await _embed_item_text(text)
+
+    async def image_vec():
+        if "image_embedding" in reuse:
+            return reuse["image_embedding"]
+        return await _embed_item_image(item, verbose)
+    
+    joint = (
+        INGEST_EMBED_MODE in ("paired", "fused")
+        and not reuse and text
+        and USE_REMOTE_EMBEDDING and USE_IMAGE_EMBEDDING and item.get("image")
+    )
+    fused = reuse.get("embedding_mode") == FUSED_EMBEDDING_MODE
+    if joint:
+        text_result, image_result, fused = await _embed_item_joint(item, text, verbose)
+    else:
+        text_result, image_result = await asyncio.gather(text_vec(), image_vec())
+    enriched = _enrich_item(item, text, text_result, image_result)
+    if enriched["has_embedding"]:
+        enriched["embed_model"], enriched["embed_version"] = embed_model, embed_version
+    if fused:
+        enriched["embedding_mode"] = FUSED_EMBEDDING_MODE
+    # 所有需要的向量都来自数据库：内容未变化，调用方无需再写库
+    needs_image = USE_REMOTE_EMBEDDING and USE_IMAGE_EMBEDDING and bool(item.get("image"))
+    enriched["unchanged"] = bool(reuse) and ("text_embedding" in reuse or not text) and ("image_embedding" in reuse or not needs_image)
+    return enriched
+
+
+async def iter_opengraph_for_search(
+    opengraph_items: List[Dict],
+    stored: Optional[Dict[str, Dict]] = None,
+) -> AsyncIterator[Tuple[int, Dict]]:
+    """
+    流式版本的 process_opengraph_for_search：每个条目处理完成后立即产出 (index, enriched_item)
+    
+    index 为条目在过滤（success=True）后列表中的下标；产出顺序为完成顺序，不是输入顺序。
+    调用方提前停止迭代（例如客户端断开）时，未完成的 worker 会被取消。
+    规范化 URL 相同的条目只处理一次，重复条目与首个条目一起产出（duplicate_of 为首个条目的 index）
+    
+    stored 为 {url: 已存储的行}（vector_db.get_stored_embeddings 的结果），内容指纹一致的条目复用已存储向量
+    """
+    stored = stored or {}
     api_key = get_api_key()
     print(f"[Pipeline] USE_REMOTE_EMBEDDING={USE_REMOTE_EMBEDDING}, USE_IMAGE_EMBEDDING={USE_IMAGE_EMBEDDING}")
     print(f"[Pipeline] API key present: {bool(api_key)}, length: {len(api_key) if api_key else 0}")
     
-    results: List[Dict] = []
-    total = len([it for it in (opengraph_items or []) if it and it.get("success", False)])
-    print(f"[Pipeline] Processing {total} items for embedding generation")
+    items = [it for it in (opengraph_items or []) if it and it.get("success", False)]
+    total = len(items)
+    print(f"[Pipeline] Processing {total} items for embedding generation (workers={INGEST_WORKERS})")
+    if total == 0:
+        return
     
-    for idx, it in enumerate(opengraph_items or []):
-        if not it or not it.get("success", False):
-            continue
-        
-        verbose = idx < 3
-        if verbose:
-            print(f"[Pipeline] Processing item {idx+1}/{total}: {it.get('title', it.get('tab_title', 'Unknown'))[:50]}")
-        
-        try:
-            enriched = await _build_item_embedding(it, verbose=verbose)
-            results.append(enriched)
-        except Exception as e:
-            print(f"[Pipeline] ERROR processing item {idx+1}: {type(e).__name__}: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            # 即使失败，也添加一个基础项
-            results.append({
-                **it,
-                "embedding": None,
-                "text_embedding": None,
-                "image_embedding": None,
-                "has_embedding": False,
-            })
-        
-        await asyncio.sleep(EMBED_SLEEP_S)
+    # 提取文本：title + og:title + og:description
+    texts = [extract_text_from_item(it) for it in items]
+    reuse = [reusable_vectors(it, stored.get(it.get("url"))) for it in items]
+    if stored:
+        print(f"[Pipeline] {sum(1 for r in reuse if r)}/{total} items unchanged since last ingest, reusing stored vectors")
+    
+    # 批次内去重：规范化 URL 相同的条目只处理第一个，其余直接复用它的向量
+    leaders: Dict[str, int] = {}
+    duplicates: Dict[int, List[int]] = {}
+    for idx, it in enumerate(items):
+        key = it.get("canonical_url") or canonicalize_url(it.get("url", ""))
+        if key in leaders:
+            duplicates.setdefault(leaders[key], []).append(idx)
+        else:
+            leaders[key] = idx
+    if len(leaders) < total:
+        print(f"[Pipeline] {total - len(leaders)} duplicate items (same canonical URL) will reuse vectors within the batch")
+    
+    pending: asyncio.Queue = asyncio.Queue()
+    for idx in leaders.values():
+        pending.put_nowait(idx)
+    done: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while True:
+            try:
+                idx = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            it = items[idx]
+            verbose = idx < 3
+            if verbose:
+                print(f"[Pipeline] Processing item {idx+1}/{total}: {(it.get('title') or it.get('tab_title') or 'Unknown')[:50]}")
+            try:
+                enriched = await _process_item(it, texts[idx], verbose=verbose, reuse=reuse[idx])
+            except Exception as e:
+                print(f"[Pipeline] ERROR processing item {idx+1}: {type(e).__name__}: {str(e)}")
+                import traceback
+                traceback.print_exc()
+                enriched = _enrich_item(it, texts[idx], None, None)
+            done.put_nowait((idx, enriched))
+    
+    workers = [asyncio.create_task(worker()) for _ in range(min(max(1, INGEST_WORKERS), len(leaders)))]
+    try:
+        for _ in range(len(leaders)):
+            idx, enriched = await done.get()
+            yield idx, enriched
+            for dup in duplicates.get(idx, ()):
+                yield dup, {
+                    **_enrich_item(items[dup], texts[dup], enriched["text_embedding"], enriched["image_embedding"]),
+                    "embed_model": enriched.get("embed_model"),
+                    "embed_version": enriched.get("embed_version"),
+                    "embedding_mode": enriched.get("embedding_mode"),
+                    "unchanged": enriched.get("unchanged", False),
+                    "duplicate_of": idx,
+                }
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def process_opengraph_for_search(
+    opengraph_items: List[Dict],
+    stored: Optional[Dict[str, Dict]] = None,
+) -> List[Dict]:
+    """
+    批量处理 OpenGraph 数据，生成文本和图像 embedding
+    
+    使用统一的 qwen2.5-vl-embedding 模型，文本和图像在同一向量空间（1024维）
+    INGEST_WORKERS 个 worker 并发处理条目；下载、图片处理、embedding 各阶段另有并发上限，
+    并发的单条 embedding 调用由微批合并成批量请求。结果顺序与输入一致
+    
+    stored 见 iter_opengraph_for_search：内容未变化的条目复用已存储向量，结果中 unchanged=True
+    """
+    results: Dict[int, Dict] = {}
+    async for idx, enriched in iter_opengraph_for_search(opengraph_items, stored):
+        results[idx] = enriched
+    results = [results[idx] for idx in range(len(results))]
     
     successful = sum(1 for r in results if r.get("has_embedding", False))
     print(f"[Pipeline] Generated embeddings for {len(results)} items, {successful} have embedding")
@@ -185,12 +369,14 @@ async def search_relevant_items(
     
     # 生成查询向量
     query_vec = None
-    if USE_REMOTE_EMBEDDING and query_text:
+    if USE_REMOTE_EMBEDDING and query_text and not embedding_available():
+        print(f"[Search] Embedding circuit breaker open, skipping query embedding")
+    elif USE_REMOTE_EMBEDDING and query_text:
         try:
             print(f"[Search] Generating query embedding for: '{query_text[:50]}...'")
-            query_vec = await embed_text(query_text or "")
-            await asyncio.sleep(QUERY_SLEEP_S)
-            if query_vec:
+            with embed_priority(INTERACTIVE):
+                query_vec = await embed_text(query_text or "", timeout=EMBED_QUERY_DEADLINE_S)
+            if query_vec is not None:
                 print(f"[Search] Query embedding generated: {len(query_vec)} dims")
             else:
                 print(f"[Search] Query embedding generation FAILED (returned None)")
@@ -208,14 +394,15 @@ async def search_relevant_items(
     docs = [dict(x) for x in (opengraph_items or [])]
     print(f"[Search] Processing {len(docs)} documents")
     
-    if query_vec:
+    if query_vec is not None:
         # 检查文档是否有 embedding（text_embedding 或 image_embedding）
-        docs_with_embedding = [
-            d for d in docs
-            if (d.get("text_embedding") and isinstance(d.get("text_embedding"), list) and len(d.get("text_embedding", [])) > 0)
-            or (d.get("image_embedding") and isinstance(d.get("image_embedding"), list) and len(d.get("image_embedding", [])) > 0)
-        ]
-        docs_without_embedding = [d for d in docs if d not in docs_with_embedding]
+        docs_with_embedding = []
+        docs_without_embedding = []
+        for d in docs:
+            if has_vector(d.get("text_embedding")) or has_vector(d.get("image_embedding")):
+                docs_with_embedding.append(d)
+            else:
+                docs_without_embedding.append(d)
         print(f"[Search] Docs with embedding: {len(docs_with_embedding)}, without: {len(docs_without_embedding)}")
         
         if docs_with_embedding:
@@ -236,22 +423,8 @@ async def search_relevant_items(
         else:
             print("[Search] No documents have embedding, falling back to fuzzy search")
             # 所有文档都没有 embedding，使用模糊搜索
-            for d in docs:
-                title = d.get("title") or d.get("tab_title", "")
-                desc = d.get("description", "")
-                score = fuzzy_score(query_text or "", title, desc)
-                d["similarity"] = score
-            docs.sort(key=lambda x: x.get("similarity", 0.0), reverse=True)
-            print(f"[Search] Top 3 fuzzy scores: {[d.get('similarity', 0.0) for d in docs[:3]]}")
-            return docs[:top_k]
+            return sort_by_fuzzy_score(query_text or "", docs)[:top_k]
     
     # 远端不可用/失败 → 本地模糊兜底
     print("[Search] Using fuzzy search fallback (query_vec is None)")
-    for d in docs:
-        title = d.get("title") or d.get("tab_title", "")
-        desc = d.get("description", "")
-        score = fuzzy_score(query_text or "", title, desc)
-        d["similarity"] = score
-    docs.sort(key=lambda x: x.get("similarity", 0.0), reverse=True)
-    print(f"[Search] Top 3 fuzzy scores: {[d.get('similarity', 0.0) for d in docs[:3]]}")
-    return docs[:top_k]
+    return sort_by_fuzzy_score(query_text or "", docs)[:top_k]
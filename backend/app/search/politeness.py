@@ -0,0 +1,160 @@
+"""
+抓取图片 / 网页的按 host 调度
+一次整理的标签页经常集中在少数几个站点（几十个 Pinterest pin、小红书笔记），
+不加限制地并发请求同一个 CDN 会被限流或直接 403。download_image 和 fetch_opengraph 的请求都经过这里：
+
+- 每个 host 一个并发上限（FETCH_HOST_CONCURRENCY，可按站点覆盖）
+- 每个 host 一个自适应令牌桶（ratelimit.AdaptiveRateLimiter）：成功时慢慢提速，被拒绝时减半
+- 429 / 403 后冷却该 host（优先使用 Retry-After，连续被拒绝时冷却时间翻倍）；
+  冷却剩余时间超过 FETCH_HOST_MAX_WAIT_S 的请求直接抛出 HostCoolingDown，不占用调用方的时间
+- 站点专用的 headers（例如小红书 CDN 的 Referer / Origin）由 FETCH_HOST_RULES 统一配置
+
+不同 host 之间互不影响，整体吞吐量由共享连接池（http_client.get_fetch_client）决定
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from . import metrics
+from .config import (
+    FETCH_HOST_CONCURRENCY,
+    FETCH_HOST_RATE_DEFAULTS,
+    FETCH_HOST_COOLDOWN_S,
+    FETCH_HOST_COOLDOWN_MAX_S,
+    FETCH_HOST_MAX_WAIT_S,
+    FETCH_HOST_RULES,
+)
+from .ratelimit import AdaptiveRateLimiter, parse_retry_after
+
+# 触发冷却的状态码
+_THROTTLE_STATUS = (429, 403)
+# 记录的 host 超过此数量时，清理空闲的 host
+_MAX_HOSTS = 1024
+_HOST_IDLE_S = 600
+
+
+class HostCoolingDown(Exception):
+    """host 处于冷却期（之前返回了 429 / 403）"""
+
+
+def _host_rule(host: str) -> Dict:
+    """按 host 后缀匹配站点规则（xhscdn.com 同时匹配 sns-webpic-qc.xhscdn.com）"""
+    for suffix, rule in FETCH_HOST_RULES.items():
+        if host == suffix or host.endswith("." + suffix):
+            return rule
+    return {}
+
+
+class HostState:
+    """单个 host 的并发名额、令牌桶和冷却状态"""
+
+    def __init__(self, host: str):
+        self.host = host
+        rule = _host_rule(host)
+        self.headers: Dict[str, str] = dict(rule.get("headers") or {})
+        self.concurrency = max(1, int(rule.get("concurrency", FETCH_HOST_CONCURRENCY)))
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.limiter = AdaptiveRateLimiter(
+            name=f"fetch_{host}",
+            **{**FETCH_HOST_RATE_DEFAULTS, **{k: v for k, v in rule.items() if k in FETCH_HOST_RATE_DEFAULTS}},
+            report_gauge=False,
+        )
+        self.strikes = 0
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+
+    def record(self, status_code: int, retry_after: Optional[str] = None):
+        """根据响应状态调整速率：429 / 403 冷却，2xx / 304 恢复"""
+        if status_code in _THROTTLE_STATUS:
+            self.strikes += 1
+            cooldown = parse_retry_after(retry_after)
+            if cooldown is None:
+                cooldown = min(FETCH_HOST_COOLDOWN_S * 2 ** (self.strikes - 1), FETCH_HOST_COOLDOWN_MAX_S)
+            metrics.inc("fetch_host_throttled")
+            print(f"[Politeness] {self.host} returned {status_code}, cooling down for {cooldown:.0f}s (strike {self.strikes})")
+            self.limiter.on_throttle(cooldown)
+        elif status_code < 400:
+            self.strikes = 0
+            self.limiter.on_success()
+
+
+class HostScheduler:
+    """按 host 分配并发名额和令牌"""
+
+    def __init__(self):
+        self._hosts: Dict[str, HostState] = {}
+        self.loop = asyncio.get_running_loop()
+        metrics.register_gauge("fetch_hosts_active", lambda: sum(1 for h in self._hosts.values() if h.in_flight))
+        metrics.register_gauge("fetch_hosts_cooling_down", lambda: sum(1 for h in self._hosts.values() if h.limiter.blocked_for() > 0))
+
+    def _state(self, url: str) -> HostState:
+        host = (urlsplit(url).hostname or "").lower()
+        state = self._hosts.get(host)
+        if state is None:
+            if len(self._hosts) >= _MAX_HOSTS:
+                self._prune()
+            state = HostState(host)
+            self._hosts[host] = state
+        state.last_used = time.monotonic()
+        return state
+
+    def _prune(self):
+        now = time.monotonic()
+        for host, state in list(self._hosts.items()):
+            if not state.in_flight and now - state.last_used > _HOST_IDLE_S and not state.limiter.blocked_for():
+                del self._hosts[host]
+
+    def request_headers(self, url: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """在调用方的 headers 上附加站点专用的 headers"""
+        return {**(headers or {}), **self._state(url).headers}
+
+    def _check_cooldown(self, state: HostState):
+        remaining = state.limiter.blocked_for()
+        if remaining > FETCH_HOST_MAX_WAIT_S:
+            metrics.inc("fetch_host_cooldown_rejected")
+            raise HostCoolingDown(f"{state.host} is cooling down for another {remaining:.0f}s")
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """
+        占用该 host 的一个并发名额和一个令牌，返回 HostState（调用方拿到响应后调用 record()）
+        
+        冷却剩余时间超过 FETCH_HOST_MAX_WAIT_S 时抛出 HostCoolingDown
+        """
+        state = self._state(url)
+        started = time.monotonic()
+        self._check_cooldown(state)
+        async with state.slots:
+            # 排队期间该 host 可能刚被限流
+            self._check_cooldown(state)
+            await state.limiter.acquire()
+            metrics.observe("fetch_host_wait_ms", (time.monotonic() - started) * 1000.0)
+            state.in_flight += 1
+            try:
+                yield state
+            finally:
+                state.in_flight -= 1
+
+    def stats(self) -> Dict[str, Dict]:
+        """正在请求或冷却中的 host：{host: {in_flight, rps, cooldown_s}}"""
+        return {
+            host: {"in_flight": s.in_flight, "rps": round(s.limiter.rate, 2), "cooldown_s": round(s.limiter.blocked_for(), 1)}
+            for host, s in self._hosts.items()
+            if s.in_flight or s.limiter.blocked_for()
+        }
+
+
+# 抓取调度器（按事件循环懒加载）
+_scheduler: Optional[HostScheduler] = None
+
+
+def get_host_scheduler() -> HostScheduler:
+    global _scheduler
+    loop = asyncio.get_running_loop()
+    if _scheduler is None or _scheduler.loop is not loop:
+        _scheduler = HostScheduler()
+    return _scheduler
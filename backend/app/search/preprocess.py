@@ -1,105 +1,237 @@
 from __future__ import annotations
 
-import httpx
 from io import BytesIO
 from PIL import Image
 import base64
-from typing import Optional, Dict
+import hashlib
+from typing import Optional, Dict, Tuple
 
 from .config import (
     MIN_IMAGE_DIMENSION,
     TARGET_IMAGE_DIMENSION,
     MAX_IMAGE_DIMENSION,
     MAX_IMAGE_SIZE,
+    IMAGE_REDUCING_GAP,
+    EMBED_VERSION,
 )
+from . import metrics
+from .downloader import fetch_image, fetch_image_response, ImageRejected
+from .image_cache import CachedImage, ImageCache, get_image_cache
+from .image_pool import run_image_task
+from .singleflight import SingleFlight
+
+# 相同 URL 的并发下载合并为一次
+_download_flight = SingleFlight("image_download")
+_load_flight = SingleFlight("image_load")
+
+
+# 下载图片用的通用 headers；小红书等站点专用的 headers 由 politeness.HostScheduler 按 FETCH_HOST_RULES 附加
+IMAGE_REQUEST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "image/webp,image/apng,image/*,*/*;q=0.8",
+    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Cache-Control": "no-cache",
+}
 
 
 async def download_image(image_url: str, timeout: float = 10.0) -> Optional[bytes]:
     """
     下载图片数据
-    支持小红书等需要特殊 headers 的网站
+    启用图片缓存时返回缓存中处理后的 JPEG（交给 process_image 时原样透传，不会重复压缩）
+    相同 URL 的并发下载只发起一次请求，其余调用方共享结果
+    """
+    if get_image_cache() is not None:
+        cached = await load_image(image_url, timeout=timeout)
+        return cached.data if cached else None
+    return await _download_flight.do(image_url, lambda: _download_image(image_url, timeout))
+
+
+async def _download_image(image_url: str, timeout: float = 10.0) -> Optional[bytes]:
+    """
+    下载图片数据（共享连接池、流式读取，超过 MAX_IMAGE_SIZE 或不是图片时不读完响应体）
     """
     try:
-        # 构建 headers，针对不同网站使用不同的策略
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "image/webp,image/apng,image/*,*/*;q=0.8",
-            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Cache-Control": "no-cache",
-        }
-        
-        # 小红书图片需要 Referer（包括所有 xhscdn.com 域名）
-        if ("xiaohongshu.com" in image_url.lower() or 
-            "picasso-static.xiaohongshu.com" in image_url.lower() or
-            "xhscdn.com" in image_url.lower() or
-            "sns-webpic-qc.xhscdn.com" in image_url.lower()):
-            headers["Referer"] = "https://www.xiaohongshu.com/"
-            headers["Origin"] = "https://www.xiaohongshu.com"
-        
-        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
-            resp = await client.get(image_url, headers=headers)
-            resp.raise_for_status()
-            if len(resp.content) > MAX_IMAGE_SIZE:
-                print(f"[Preprocess] Image too large: {len(resp.content)} bytes, skipping")
-                return None
-            return resp.content
+        return await fetch_image(image_url, headers=IMAGE_REQUEST_HEADERS, max_bytes=MAX_IMAGE_SIZE, timeout=timeout)
+    except ImageRejected as e:
+        print(f"[Preprocess] Skipping image {image_url[:60]}...: {e}")
+        return None
     except Exception as e:
         print(f"[Preprocess] Error downloading image {image_url[:60]}...: {e}")
         return None
 
 
-def process_image(image_data: bytes, max_dimension: int = TARGET_IMAGE_DIMENSION) -> Optional[str]:
+async def load_image(image_url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 10.0) -> Optional[CachedImage]:
+    """
+    经过磁盘图片缓存获取处理后的图片（含原图尺寸）；图片缓存未启用时返回 None
+    
+    - 缓存新鲜：不发请求
+    - 缓存过期：带 If-None-Match / If-Modified-Since 重新验证，304 时继续使用缓存
+    - 未命中：下载、在图片执行池中处理后写入缓存
+    """
+    cache = get_image_cache()
+    if cache is None:
+        return None
+    headers = headers or IMAGE_REQUEST_HEADERS
+    return await _load_flight.do(image_url, lambda: _load_image(cache, image_url, headers, timeout))
+
+
+async def _load_image(cache: ImageCache, image_url: str, headers: Dict[str, str], timeout: float) -> Optional[CachedImage]:
+    cached = await cache.get(image_url, PREPROCESS_VERSION)
+    if cached is not None and cached.is_fresh():
+        metrics.inc("image_cache_hits")
+        return cached
+    
     try:
-        img = Image.open(BytesIO(image_data))
-        w, h = img.size
+        if cached is not None:
+            headers = {**headers, **cached.revalidation_headers()}
+            headers.pop("Cache-Control", None)
+        fetched = await fetch_image_response(image_url, headers=headers, max_bytes=MAX_IMAGE_SIZE, timeout=timeout)
+    except ImageRejected as e:
+        print(f"[Preprocess] Skipping image {image_url[:60]}...: {e}")
+        return None
+    except Exception as e:
+        if cached is not None:
+            # 重新验证失败（网络错误、限流）时继续使用过期的缓存
+            print(f"[Preprocess] Revalidation failed for {image_url[:60]}..., using stale cache: {e}")
+            metrics.inc("image_cache_stale_served")
+            return cached
+        print(f"[Preprocess] Error downloading image {image_url[:60]}...: {e}")
+        return None
+    
+    if fetched.not_modified and cached is not None:
+        metrics.inc("image_cache_revalidated")
+        await cache.touch(image_url, fetched.etag, fetched.last_modified)
+        return cached
+    
+    metrics.inc("image_cache_misses")
+    processed = await run_image_task(process_image_bytes, fetched.data)
+    if processed is None:
+        print(f"[Preprocess] Failed to process image {image_url[:60]}...")
+        return None
+    data, width, height = processed
+    return await cache.put(image_url, data, width, height, fetched.etag, fetched.last_modified, version=PREPROCESS_VERSION)
+
+
+def estimate_image_memory(image_data: bytes) -> int:
+    """
+    估算处理一张图片的峰值内存：原始字节 + 解码后的像素（按 RGBA 计）+ 输出的 Base64
+    只读取图片头部获取尺寸，不解码像素
+    """
+    try:
+        w, h = Image.open(BytesIO(image_data)).size
+    except Exception:
+        return len(image_data) * 2
+    target = min(max(w, h), TARGET_IMAGE_DIMENSION)
+    return len(image_data) + w * h * 4 + target * target * 2
 
+
+# JPEG 输出大小相对 quality=85 的经验比例，用于直接预测满足大小上限的质量档位
+_JPEG_QUALITY_SIZE_RATIO = ((85, 1.0), (70, 0.62), (60, 0.5), (50, 0.43), (40, 0.36))
+
+# 修改 process_image_bytes 的处理逻辑（而不只是参数）时递增
+_PREPROCESS_REVISION = 1
+# 预处理版本：图片缓存中保存的是处理后的 JPEG，参数或 EMBED_VERSION 变化后旧条目不再使用
+PREPROCESS_VERSION = hashlib.sha1(repr((
+    _PREPROCESS_REVISION,
+    MIN_IMAGE_DIMENSION,
+    TARGET_IMAGE_DIMENSION,
+    MAX_IMAGE_DIMENSION,
+    MAX_IMAGE_SIZE,
+    IMAGE_REDUCING_GAP,
+    _JPEG_QUALITY_SIZE_RATIO,
+    EMBED_VERSION,
+)).encode()).hexdigest()[:12]
+
+
+def encode_jpeg(img: Image.Image, max_bytes: int, quality: int = 85, allow_oversize: bool = False) -> Optional[bytes]:
+    """
+    编码为 JPEG，输出不超过 max_bytes；超限时按首次编码的大小预测质量档位重新编码，
+    而不是逐档尝试（最多编码三次），仍然超限返回 None（allow_oversize=True 时返回最低质量档位的编码）
+    """
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True)
+    b = out.getvalue()
+    if len(b) <= max_bytes:
+        return b
+    base = dict(_JPEG_QUALITY_SIZE_RATIO).get(quality, 1.0)
+    predicted = next(
+        (q for q, ratio in _JPEG_QUALITY_SIZE_RATIO if q < quality and len(b) * ratio / base <= max_bytes * 0.9),
+        _JPEG_QUALITY_SIZE_RATIO[-1][0],
+    )
+    for q in dict.fromkeys((predicted, _JPEG_QUALITY_SIZE_RATIO[-1][0])):
+        out = BytesIO()
+        img.save(out, format="JPEG", quality=q, optimize=True)
+        b = out.getvalue()
+        if len(b) <= max_bytes:
+            return b
+    return b if allow_oversize else None
+
+
+def to_rgb(img: Image.Image) -> Image.Image:
+    """透明背景铺白，其他模式转换为 RGB"""
+    if img.mode in ("RGBA", "LA", "P"):
+        if img.mode == "P":
+            img = img.convert("RGBA")
+        bg = Image.new("RGB", img.size, (255, 255, 255))
+        bg.paste(img, mask=img.split()[-1] if img.mode in ("RGBA", "LA") else None)
+        return bg
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+
+def process_image_bytes(image_data: bytes, max_dimension: int = TARGET_IMAGE_DIMENSION) -> Optional[Tuple[bytes, int, int]]:
+    """
+    把图片缩放、压缩为 JPEG，返回 (JPEG 字节, 原图宽, 原图高)
+    
+    - 尺寸已在范围内的 RGB JPEG 直接透传，不重新编码
+    - 大图只缩放一次：thumbnail 对 JPEG 使用 draft 在解码时按 1/2、1/4、1/8 缩小，
+      其他格式先用 reduce() 整数倍缩小，再用 LANCZOS 缩放到目标尺寸
+    """
+    try:
+        img = Image.open(BytesIO(image_data))
+        w, h = orig_w, orig_h = img.size
+        limit = min(max_dimension, MAX_IMAGE_DIMENSION)
+        
+        if (
+            img.format == "JPEG" and img.mode == "RGB"
+            and min(w, h) >= MIN_IMAGE_DIMENSION and max(w, h) <= limit
+            and len(image_data) <= MAX_IMAGE_SIZE
+        ):
+            return image_data, orig_w, orig_h
+        
         # upscale if too small
         if w < MIN_IMAGE_DIMENSION or h < MIN_IMAGE_DIMENSION:
             scale = max(MIN_IMAGE_DIMENSION / max(w, 1), MIN_IMAGE_DIMENSION / max(h, 1))
             w, h = int(round(w * scale)), int(round(h * scale))
             img = img.resize((w, h), Image.Resampling.LANCZOS)
+        
+        # downscale if too large（单次缩放）
+        if w > limit or h > limit:
+            img.thumbnail((limit, limit), Image.Resampling.LANCZOS, reducing_gap=IMAGE_REDUCING_GAP)
+        
+        b = encode_jpeg(to_rgb(img), MAX_IMAGE_SIZE)
+        if b is None:
+            return None
+        return b, orig_w, orig_h
+    except Exception:
+        return None
 
-        # downscale if too large
-        if w > max_dimension or h > max_dimension:
-            if w > h:
-                nw, nh = max_dimension, int(h * (max_dimension / w))
-            else:
-                nh, nw = max_dimension, int(w * (max_dimension / h))
-            img = img.resize((nw, nh), Image.Resampling.LANCZOS)
-            w, h = nw, nh
-
-        if w > MAX_IMAGE_DIMENSION or h > MAX_IMAGE_DIMENSION:
-            scale = min(MAX_IMAGE_DIMENSION / w, MAX_IMAGE_DIMENSION / h)
-            w, h = int(w * scale), int(h * scale)
-            img = img.resize((w, h), Image.Resampling.LANCZOS)
 
-        if img.mode in ("RGBA", "LA", "P"):
-            bg = Image.new("RGB", img.size, (255, 255, 255))
-            if img.mode == "P":
-                img = img.convert("RGBA")
-            bg.paste(img, mask=img.split()[-1] if img.mode == "RGBA" else None)
-            img = bg
-        elif img.mode != "RGB":
-            img = img.convert("RGB")
+def process_image(image_data: bytes, max_dimension: int = TARGET_IMAGE_DIMENSION) -> Optional[str]:
+    """把图片缩放、压缩为 JPEG Data URI（见 process_image_bytes）"""
+    processed = process_image_bytes(image_data, max_dimension)
+    if processed is None:
+        return None
+    
+    b64 = base64.b64encode(processed[0]).decode("utf-8")
+    return f"data:image/jpeg;base64,{b64}"
 
-        out = BytesIO()
-        img.save(out, format="JPEG", quality=85, optimize=True)
-        b = out.getvalue()
-        if len(b) > MAX_IMAGE_SIZE:
-            for q in (70, 60, 50, 40):
-                out = BytesIO()
-                img.save(out, format="JPEG", quality=q, optimize=True)
-                b = out.getvalue()
-                if len(b) <= MAX_IMAGE_SIZE:
-                    break
-        if len(b) > MAX_IMAGE_SIZE:
-            return None
 
-        b64 = base64.b64encode(b).decode("utf-8")
-        return f"data:image/jpeg;base64,{b64}"
-    except Exception:
-        return None
+async def process_image_async(image_data: bytes, max_dimension: int = TARGET_IMAGE_DIMENSION) -> Optional[str]:
+    """process_image 的异步版本：在图片执行池中运行，不阻塞事件循环"""
+    return await run_image_task(process_image, image_data, max_dimension)
 
 
 def extract_text_from_item(item: Dict) -> str:
@@ -0,0 +1,150 @@
+"""
+Embedding 请求的优先级调度
+查询、批量入库和后台预取共用同一份上游配额和连接。上游请求按调用方的优先级类别排队：
+
+- interactive：搜索查询，可以使用全部并发名额，其中 EMBED_DISPATCH_INTERACTIVE_RESERVED 个只留给它
+- normal：/api/v1/search/embedding 等用户触发的批量入库
+- background：后台任务和 OpenGraph 预取，最多同时占用 EMBED_DISPATCH_BACKGROUND_MAX 个名额
+
+名额释放时按 interactive → normal → background 的顺序唤醒等待者。
+调用方通过 embed_priority() 设置当前上下文的类别（contextvar，会随 asyncio 任务传递）
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional, Tuple
+
+from . import metrics
+from .config import (
+    EMBED_DISPATCH_MAX_INFLIGHT,
+    EMBED_DISPATCH_INTERACTIVE_RESERVED,
+    EMBED_DISPATCH_BACKGROUND_MAX,
+)
+
+INTERACTIVE = "interactive"
+NORMAL = "normal"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, NORMAL, BACKGROUND)
+
+_current_priority: ContextVar[str] = ContextVar("embed_priority", default=NORMAL)
+
+
+@contextmanager
+def embed_priority(priority: str):
+    """在此上下文（以及其中创建的任务）发起的 embedding 请求使用指定优先级"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown embed priority {priority!r}, expected one of {PRIORITIES}")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+class PriorityDispatcher:
+    """
+    按优先级分配上游并发名额
+    
+    - capacity：总名额
+    - reserved：只有 interactive 能使用的名额（normal / background 最多使用 capacity - reserved）
+    - background_max：background 自身最多同时占用的名额
+    """
+
+    def __init__(self, name: str, capacity: int, reserved: int, background_max: int):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.reserved = min(max(0, reserved), self.capacity - 1)
+        self.background_max = max(1, background_max)
+        self._inflight: Dict[str, int] = {p: 0 for p in PRIORITIES}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {p: deque() for p in PRIORITIES}
+        self.loop = asyncio.get_running_loop()
+        for p in PRIORITIES:
+            metrics.register_gauge(f"{name}_queue_depth_{p}", lambda p=p: len(self._waiters[p]))
+            metrics.register_gauge(f"{name}_inflight_{p}", lambda p=p: self._inflight[p])
+
+    def _can_start(self, priority: str) -> bool:
+        total = sum(self._inflight.values())
+        if priority == INTERACTIVE:
+            return total < self.capacity
+        if total >= self.capacity - self.reserved:
+            return False
+        return priority != BACKGROUND or self._inflight[BACKGROUND] < self.background_max
+
+    def _has_waiters_before(self, priority: str) -> bool:
+        """同级或更高优先级是否已有排队者（保证 FIFO，且不插队到更高优先级之前）"""
+        for p in PRIORITIES[:PRIORITIES.index(priority) + 1]:
+            if self._waiters[p]:
+                return True
+        return False
+
+    async def acquire(self, priority: str):
+        if not self._has_waiters_before(priority) and self._can_start(priority):
+            self._inflight[priority] += 1
+            return
+        
+        fut = self.loop.create_future()
+        self._waiters[priority].append(fut)
+        started = time.monotonic()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # 名额已经分配给我们，但调用方被取消：交还名额
+                self.release(priority)
+            else:
+                self._waiters[priority].remove(fut)
+            raise
+        metrics.observe(f"{self.name}_wait_ms_{priority}", (time.monotonic() - started) * 1000.0)
+
+    def release(self, priority: str):
+        self._inflight[priority] -= 1
+        self._wake()
+
+    def _wake(self):
+        for p in PRIORITIES:
+            waiters = self._waiters[p]
+            while waiters and self._can_start(p):
+                fut = waiters.popleft()
+                if fut.done():
+                    continue
+                self._inflight[p] += 1
+                fut.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None):
+        """占用一个名额（默认使用当前上下文的优先级）"""
+        priority = priority or current_priority()
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self) -> Dict[str, Tuple[int, int]]:
+        """{priority: (in_flight, queued)}"""
+        return {p: (self._inflight[p], len(self._waiters[p])) for p in PRIORITIES}
+
+
+# 上游 embedding 请求的调度器（按事件循环懒加载）
+_dispatcher: Optional[PriorityDispatcher] = None
+
+
+def get_dispatcher() -> PriorityDispatcher:
+    global _dispatcher
+    loop = asyncio.get_running_loop()
+    if _dispatcher is None or _dispatcher.loop is not loop:
+        _dispatcher = PriorityDispatcher(
+            "embed_dispatch",
+            capacity=EMBED_DISPATCH_MAX_INFLIGHT,
+            reserved=EMBED_DISPATCH_INTERACTIVE_RESERVED,
+            background_max=EMBED_DISPATCH_BACKGROUND_MAX,
+        )
+    return _dispatcher
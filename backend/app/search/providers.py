@@ -0,0 +1,276 @@
+"""
+Embedding Provider 抽象
+embed_text / embed_image 等接口背后的具体实现，由 EMBED_PROVIDER 选择：
+- dashscope：DashScope qwen2.5-vl-embedding（远端，文本和图像同一向量空间）
+- hashing：本地 CPU 特征哈希（确定性、无网络，适合离线开发与可复现的压测）
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import re
+import time
+import unicodedata
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+import httpx
+import numpy as np
+
+from .config import (
+    MM_EMBED_ENDPOINT,
+    MM_EMBED_MODEL,
+    MM_EMBED_DIM,
+    EMBED_PROVIDER,
+    EMBED_HEDGE_MIN_SAMPLES,
+    get_api_key,
+)
+from .http_client import get_embed_client, host_slot
+from .ratelimit import get_rate_limiter, parse_retry_after
+from .retry import LatencyTracker
+
+
+class EmbedRequestError(Exception):
+    """上游 embedding 请求失败（status 为 None 表示网络错误 / 超时）"""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        """网络错误、429 和 5xx 属于暂时性错误；其余 4xx 通常是输入本身的问题"""
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+class EmbeddingProvider:
+    """
+    Embedding 后端接口
+    
+    子类实现 embed(contents)：contents 为 [{"text": ...} | {"image": "data:image/...;base64,..."}]，
+    返回与 contents 按下标对应的 float32 向量列表（某一项缺失时为 None），整体失败时抛出 EmbedRequestError；
+    远端 provider 在排队（令牌桶、host 并发）结束、请求真正发出时调用 on_sent（对冲计时从这里开始）
+    
+    Attributes:
+        name: provider 名称（EMBED_PROVIDER 的取值）
+        model: 模型标识，参与缓存 key 的计算，不同 provider / 模型的向量不会混用
+        dimensions: 输出向量维度
+        remote: 是否走网络（远端 provider 才需要微批、重试、对冲和熔断）
+    """
+    
+    name = "base"
+    remote = False
+
+    def __init__(self, model: str, dimensions: int):
+        self.model = model
+        self.dimensions = dimensions
+        # 成功请求的耗时（用于计算对冲阈值）
+        self.latency = LatencyTracker(min_samples=EMBED_HEDGE_MIN_SAMPLES)
+
+    def available(self) -> bool:
+        """配置是否齐全（例如 API key）"""
+        return True
+
+    async def embed(self, contents: List[dict], on_sent: Optional[Callable[[], None]] = None) -> List[Optional[np.ndarray]]:
+        raise NotImplementedError
+
+
+class DashScopeProvider(EmbeddingProvider):
+    """DashScope multimodal-embedding（qwen2.5-vl-embedding）"""
+    
+    name = "dashscope"
+    remote = True
+
+    def __init__(self, model: str = MM_EMBED_MODEL, dimensions: int = MM_EMBED_DIM):
+        super().__init__(model, dimensions)
+
+    def available(self) -> bool:
+        return bool(get_api_key())
+
+    async def embed(self, contents: List[dict], on_sent: Optional[Callable[[], None]] = None) -> List[Optional[np.ndarray]]:
+        """
+        发送一次 multimodal-embedding 请求（经过全局自适应限流，不重试）
+        
+        Raises:
+            EmbedRequestError: HTTP 非 200、网络错误或响应中没有可用向量
+        """
+        api_key = get_api_key()
+        if not api_key:
+            raise EmbedRequestError("API key not found", status=401)
+        
+        payload = {
+            "model": self.model,
+            "input": {"contents": contents},
+        }
+        
+        # qwen2.5-vl-embedding 支持 dimensions 参数
+        if self.model == "qwen2.5-vl-embedding":
+            payload["parameters"] = {
+                "dimensions": self.dimensions
+            }
+        
+        # 全局令牌桶：按上游反馈自适应调速，取代固定 sleep
+        limiter = get_rate_limiter(self.model)
+        await limiter.acquire()
+        
+        # 使用应用级共享连接池（keep-alive + HTTP/2），不再每次新建 AsyncClient
+        client = get_embed_client()
+        started = time.monotonic()
+        try:
+            async with host_slot(MM_EMBED_ENDPOINT):
+                if on_sent is not None:
+                    on_sent()
+                resp = await client.post(
+                    MM_EMBED_ENDPOINT,
+                    headers={
+                        "Authorization": f"Bearer {api_key}",
+                        "Content-Type": "application/json",
+                    },
+                    json=payload,
+                )
+        except httpx.HTTPError as e:
+            print(f"[Embed] ERROR: {type(e).__name__}: {str(e)}")
+            raise EmbedRequestError(f"{type(e).__name__}: {str(e)}") from e
+        
+        if resp.status_code != 200:
+            error_text = resp.text[:500]
+            print(f"[Embed] ERROR: HTTP {resp.status_code}, response: {error_text}")
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            if resp.status_code == 429:
+                limiter.on_throttle(retry_after)
+            raise EmbedRequestError(f"HTTP {resp.status_code}: {error_text}", status=resp.status_code, retry_after=retry_after)
+        
+        limiter.on_success()
+        self.latency.record(time.monotonic() - started)
+        data = resp.json()
+        embs = data.get("output", {}).get("embeddings") or []
+        
+        if not embs:
+            print(f"[Embed] ERROR: No embeddings in response. Response keys: {list(data.keys())}")
+            raise EmbedRequestError("No embeddings in response", status=resp.status_code)
+        
+        # 响应格式：output.embeddings[i] = {"index": i, "embedding": [...], "type": "text"|"image"}
+        # 按 index 映射回输入下标；没有 index 字段时按返回顺序对应
+        vectors: List[Optional[np.ndarray]] = [None] * len(contents)
+        for pos, entry in enumerate(embs):
+            idx = entry.get("index", pos)
+            emb = entry.get("embedding")
+            if isinstance(idx, int) and 0 <= idx < len(contents) and isinstance(emb, list) and emb:
+                # 解析后立即转换为 float32 连续数组，之后全程不再转换
+                vectors[idx] = np.asarray(emb, dtype=np.float32)
+        
+        ok = sum(1 for v in vectors if v is not None)
+        if ok == 0:
+            print(f"[Embed] ERROR: Invalid embedding format")
+            raise EmbedRequestError("Invalid embedding format", status=resp.status_code)
+        
+        dims = next(len(v) for v in vectors if v is not None)
+        print(f"[Embed] SUCCESS: Generated {ok}/{len(contents)} {dims}-dim vectors")
+        return vectors
+
+
+# 文本分词：ASCII 单词 / 数字，CJK 按单字（再组合成 n-gram）
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+
+class HashingProvider(EmbeddingProvider):
+    """
+    本地 CPU 特征哈希（signed feature hashing）
+    
+    - 文本：单词 + 相邻词 bigram + 字符 trigram，哈希到固定维度并做 L2 归一化，
+      词面相近的文本得到相近的向量
+    - 图像：按图片字节的 SHA-256 生成确定性的随机单位向量（相同图片 → 相同向量，
+      不具备视觉语义，只用于离线运行和压测）
+    """
+    
+    name = "hashing"
+    model = "hashing-v1"
+
+    def __init__(self):
+        super().__init__(self.model, MM_EMBED_DIM)
+
+    def _features(self, text: str) -> List[str]:
+        text = unicodedata.normalize("NFKC", text).lower()
+        tokens = _TOKEN_RE.findall(text)
+        features = [f"w:{t}" for t in tokens]
+        features += [f"b:{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        compact = "".join(text.split())
+        features += [f"c:{compact[i:i + 3]}" for i in range(max(0, len(compact) - 2))]
+        return features
+
+    def _hash(self, feature: str) -> int:
+        return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+    def _embed_text(self, text: str) -> Optional[np.ndarray]:
+        vec = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in self._features(text):
+            h = self._hash(feature)
+            vec[h % self.dimensions] += 1.0 if (h >> 63) & 1 else -1.0
+        norm = float(np.linalg.norm(vec))
+        if norm == 0.0:
+            return None
+        return vec / norm
+
+    def _embed_image(self, image: str) -> Optional[np.ndarray]:
+        payload = image.split(",", 1)[1] if image.startswith("data:") else image
+        try:
+            data = base64.b64decode(payload, validate=False)
+        except (ValueError, TypeError):
+            data = image.encode("utf-8")
+        seed = int.from_bytes(hashlib.sha256(data).digest()[:8], "little")
+        vec = np.random.default_rng(seed).standard_normal(self.dimensions).astype(np.float32)
+        return vec / np.linalg.norm(vec)
+
+    async def embed(self, contents: List[dict], on_sent: Optional[Callable[[], None]] = None) -> List[Optional[np.ndarray]]:
+        vectors: List[Optional[np.ndarray]] = []
+        for content in contents:
+            if content.get("text"):
+                vectors.append(self._embed_text(content["text"]))
+            elif content.get("image"):
+                vectors.append(self._embed_image(content["image"]))
+            else:
+                vectors.append(None)
+        return vectors
+
+
+_PROVIDERS: Dict[str, Type[EmbeddingProvider]] = {
+    DashScopeProvider.name: DashScopeProvider,
+    HashingProvider.name: HashingProvider,
+}
+
+# 当前 provider（单例）
+_provider: Optional[EmbeddingProvider] = None
+
+
+def get_provider() -> EmbeddingProvider:
+    """按 EMBED_PROVIDER 创建并返回当前 provider（未知取值时退回 dashscope）"""
+    global _provider
+    if _provider is None:
+        cls = _PROVIDERS.get(EMBED_PROVIDER)
+        if cls is None:
+            print(f"[Embed] WARNING: unknown EMBED_PROVIDER={EMBED_PROVIDER!r}, using dashscope")
+            cls = DashScopeProvider
+        _provider = cls()
+        print(f"[Embed] Provider: {_provider.name} (model={_provider.model}, dimensions={_provider.dimensions})")
+    return _provider
+
+
+# 按 (模型名, 维度) 创建的其他 provider（回填期间为旧模型的行生成查询向量）
+_model_providers: Dict[Tuple[str, int], EmbeddingProvider] = {}
+
+
+def get_provider_for_model(model: str, dimensions: Optional[int] = None) -> Optional[EmbeddingProvider]:
+    """
+    返回按指定模型和维度（None 表示当前维度）生成向量的 provider：与当前 provider 相同时直接返回当前 provider；
+    DashScope 可以按模型名请求其他模型，本地 provider 只有一个模型，返回 None
+    """
+    provider = get_provider()
+    dimensions = dimensions or provider.dimensions
+    if model == provider.model and dimensions == provider.dimensions:
+        return provider
+    if not isinstance(provider, DashScopeProvider):
+        return None
+    key = (model, dimensions)
+    if key not in _model_providers:
+        _model_providers[key] = DashScopeProvider(model, dimensions)
+    return _model_providers[key]
@@ -4,8 +4,12 @@
 """
 from __future__ import annotations
 
-from typing import List, Dict, Tuple
-from .fuse import cosine_similarity, fuse_similarity_scores
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from .fuse import cosine_similarity, fuse_similarity_scores, is_fused_item
+from .vectors import has_vector
 from .config import DEFAULT_WEIGHTS, IMAGE_FOCUSED_WEIGHTS, DOC_FOCUSED_WEIGHTS
 
 
@@ -27,6 +31,21 @@ def fuzzy_score(query: str, title: str, description: str) -> float:
     return min(score, 1.0)
 
 
+def sort_by_fuzzy_score(query: str, docs: List[Dict]) -> List[Dict]:
+    """
+    本地文本排序（不依赖 embedding）：用 fuzzy_score 给每个文档打分并排序
+    
+    用于 embedding 不可用（熔断 / 超时）或文档没有向量时的降级路径
+    """
+    for d in docs:
+        title = d.get("title") or d.get("tab_title", "")
+        desc = d.get("description", "")
+        d["similarity"] = fuzzy_score(query or "", title, desc)
+    docs.sort(key=lambda x: x.get("similarity", 0.0), reverse=True)
+    print(f"[Rank] Top 3 fuzzy scores: {[d.get('similarity', 0.0) for d in docs[:3]]}")
+    return docs
+
+
 def _choose_weights(item: Dict) -> Tuple[float, float]:
     """
     根据内容类型选择融合权重
@@ -55,7 +74,7 @@ def _choose_weights(item: Dict) -> Tuple[float, float]:
 
 
 def sort_by_vector_similarity(
-    query_vec: List[float],
+    query_vec: Optional[np.ndarray],
     docs: List[Dict],
     weights: Tuple[float, float] = None,  # 如果为None，会根据文档类型自适应
 ) -> List[Dict]:
@@ -66,14 +85,14 @@ def sort_by_vector_similarity(
     可以直接计算余弦相似度，无需降维或跨空间对齐。
     
     Args:
-        query_vec: 查询向量（文本embedding，1024维）
+        query_vec: 查询向量（文本embedding，1024维 float32 数组）
         docs: 文档列表，每个文档包含 text_embedding 和 image_embedding
         weights: 融合权重 (text_weight, image_weight)，如果为None则自适应
     
     Returns:
         按相似度排序的文档列表
     """
-    if not query_vec:
+    if not has_vector(query_vec):
         print("[Rank] Warning: query_vec is None or empty")
         for d in docs:
             d["similarity"] = 0.0
@@ -87,20 +106,20 @@ def sort_by_vector_similarity(
         
         # 调试：检查前3个文档的embedding字段
         if idx < 3:
-            has_text = text_emb is not None and isinstance(text_emb, list) and len(text_emb) > 0
-            has_image = image_emb is not None and isinstance(image_emb, list) and len(image_emb) > 0
+            has_text = has_vector(text_emb)
+            has_image = has_vector(image_emb)
             print(f"[Rank] Doc {idx} embeddings check: text={has_text}, image={has_image}")
         
         text_sim = 0.0
         image_sim = 0.0
         
         # 计算文本相似度（同一向量空间，直接比较）
-        if text_emb and isinstance(text_emb, list) and len(text_emb) > 0:
+        if has_vector(text_emb):
             verbose = idx == 0
             text_sim = cosine_similarity(query_vec, text_emb, verbose=verbose)
         
         # 计算图像相似度（同一向量空间，直接比较）
-        if image_emb and isinstance(image_emb, list) and len(image_emb) > 0:
+        if has_vector(image_emb):
             verbose = idx == 0
             image_sim = cosine_similarity(query_vec, image_emb, verbose=verbose)
         
@@ -115,16 +134,17 @@ def sort_by_vector_similarity(
             text_sim=text_sim,
             image_sim=image_sim,
             weights=doc_weights,
-            has_text=text_emb is not None and isinstance(text_emb, list) and len(text_emb) > 0,
-            has_image=image_emb is not None and isinstance(image_emb, list) and len(image_emb) > 0,
+            has_text=has_vector(text_emb),
+            has_image=has_vector(image_emb),
+            fused=is_fused_item(d),
         )
         
         d["similarity"] = final_sim
         
         if idx < 5:
             title = d.get("title") or d.get("tab_title", "")[:30]
-            text_info = f"text_sim={text_sim:.6f}" if text_emb else "text_sim=N/A"
-            image_info = f"image_sim={image_sim:.6f}" if image_emb else "image_sim=N/A"
+            text_info = f"text_sim={text_sim:.6f}" if has_vector(text_emb) else "text_sim=N/A"
+            image_info = f"image_sim={image_sim:.6f}" if has_vector(image_emb) else "image_sim=N/A"
             print(f"[Rank] Doc {idx} '{title}': final={final_sim:.10f} ({text_info}, {image_info}, weights={doc_weights})")
     
     # 按相似度排序
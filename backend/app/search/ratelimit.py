@@ -0,0 +1,131 @@
+"""
+自适应限流模块
+进程内全局的令牌桶，按模型区分；根据上游 HTTP 429 / Retry-After 用 AIMD 动态调整速率：
+- 成功：加性增长（大约每秒 +increase_rps）
+- 被限流：乘性下降，并在 Retry-After 期间暂停发放令牌
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from . import metrics
+from .config import EMBED_RATE_LIMITS, EMBED_RATE_DEFAULTS
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头（秒数或 HTTP 日期），返回需要等待的秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    """AIMD 令牌桶"""
+
+    def __init__(
+        self,
+        name: str,
+        initial_rps: float,
+        min_rps: float,
+        max_rps: float,
+        burst: float,
+        increase_rps: float,
+        decrease_factor: float,
+        report_gauge: bool = True,
+    ):
+        self.name = name
+        self.rate = initial_rps
+        self.min_rps = min_rps
+        self.max_rps = max_rps
+        self.burst = max(1.0, burst)
+        self.increase_rps = increase_rps
+        self.decrease_factor = decrease_factor
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+        if report_gauge:
+            metrics.register_gauge(f"ratelimit_{name}_rps", lambda: round(self.rate, 3))
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+    def _loop_lock(self) -> asyncio.Lock:
+        """
+        按事件循环创建锁：限流器是进程内单例，事件循环变化后（多次 asyncio.run、worker 重载）
+        旧的锁不能再用；速率和令牌等状态与事件循环无关，继续保留
+        """
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    async def acquire(self):
+        """获取一个令牌；没有令牌或处于 Retry-After 冷却期时等待"""
+        waited = 0.0
+        async with self._loop_lock():
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                elif self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    break
+                else:
+                    delay = (1.0 - self._tokens) / max(self.rate, 1e-6)
+                waited += delay
+                await asyncio.sleep(delay)
+        if waited > 0:
+            metrics.observe(f"ratelimit_{self.name}_wait_ms", waited * 1000.0)
+
+    def blocked_for(self) -> float:
+        """Retry-After 冷却期的剩余秒数"""
+        return max(0.0, self._blocked_until - time.monotonic())
+
+    def on_success(self):
+        """加性增长：每次成功增加 increase_rps / rate，约等于每秒增长 increase_rps"""
+        self.rate = min(self.max_rps, self.rate + self.increase_rps / max(self.rate, 1.0))
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        """乘性下降；同一批并发请求同时收到 429 时只下降一次"""
+        now = time.monotonic()
+        metrics.inc(f"ratelimit_{self.name}_throttled")
+        if now - self._last_decrease >= 1.0:
+            self._last_decrease = now
+            old = self.rate
+            self.rate = max(self.min_rps, self.rate * self.decrease_factor)
+            print(f"[RateLimit] {self.name}: throttled, rate {old:.2f} -> {self.rate:.2f} rps")
+        self._tokens = 0.0
+        if retry_after:
+            self._blocked_until = max(self._blocked_until, now + retry_after)
+            print(f"[RateLimit] {self.name}: Retry-After {retry_after:.2f}s")
+
+
+# 每个模型一个限流器（进程内全局）
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+
+
+def get_rate_limiter(model: str) -> AdaptiveRateLimiter:
+    limiter = _limiters.get(model)
+    if limiter is None:
+        cfg = {**EMBED_RATE_DEFAULTS, **EMBED_RATE_LIMITS.get(model, {})}
+        limiter = AdaptiveRateLimiter(name=model.replace(".", "_").replace("-", "_"), **cfg)
+        _limiters[model] = limiter
+    return limiter
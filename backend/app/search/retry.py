@@ -0,0 +1,132 @@
+"""
+重试与对冲请求
+- call_with_retry：有界重试 + 带抖动的指数退避（full jitter），受总截止时间约束
+- hedged：请求发出后耗时超过近期 p95 时再发一个相同请求，谁先成功用谁（排队时间不计）
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+
+from . import metrics
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """记录最近的请求耗时，用于计算对冲阈值（p95）"""
+
+    def __init__(self, window: int = 256, min_samples: int = 20):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._min_samples = min_samples
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self._samples) < self._min_samples:
+            return None
+        values = sorted(self._samples)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def backoff_delay(attempt: int, base_s: float, max_s: float) -> float:
+    """第 attempt 次重试（从 0 开始）的等待时间：full jitter 指数退避"""
+    return random.uniform(0, min(max_s, base_s * (2 ** attempt)))
+
+
+async def call_with_retry(
+    fn: Callable[[], Awaitable[T]],
+    *,
+    max_retries: int,
+    base_s: float,
+    max_s: float,
+    deadline: Optional[float] = None,
+    is_retryable: Callable[[BaseException], bool] = lambda e: True,
+    retry_after: Callable[[BaseException], Optional[float]] = lambda e: None,
+    name: str = "call",
+) -> T:
+    """
+    调用 fn()，遇到可重试的异常时退避后重试
+    
+    Args:
+        max_retries: 最多重试次数（总尝试次数 = max_retries + 1）
+        deadline: time.monotonic() 意义下的截止时间；到期后不再重试，单次尝试也会被截断
+        is_retryable: 判断异常是否可重试
+        retry_after: 从异常中读取服务端建议的等待时间（例如 Retry-After）
+    """
+    attempt = 0
+    while True:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            metrics.inc(f"{name}_deadline_exceeded")
+            raise asyncio.TimeoutError(f"{name}: deadline exceeded before attempt {attempt + 1}")
+        try:
+            if remaining is None:
+                return await fn()
+            return await asyncio.wait_for(fn(), timeout=remaining)
+        except asyncio.TimeoutError:
+            if deadline is not None and time.monotonic() >= deadline:
+                metrics.inc(f"{name}_deadline_exceeded")
+                raise
+            error: BaseException = asyncio.TimeoutError()
+        except Exception as e:
+            error = e
+        if attempt >= max_retries or not is_retryable(error):
+            raise error
+        delay = max(backoff_delay(attempt, base_s, max_s), retry_after(error) or 0.0)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            metrics.inc(f"{name}_deadline_exceeded")
+            raise error
+        attempt += 1
+        metrics.inc(f"{name}_retries_total")
+        print(f"[Retry] {name}: attempt {attempt} failed ({type(error).__name__}: {error}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+
+async def hedged(fn: Callable[[Callable[[], None]], Awaitable[T]], hedge_after_s: Optional[float], name: str = "call") -> T:
+    """
+    对冲请求：主请求发出后 hedge_after_s 内没有完成时再发一个副本，返回先成功的那个
+    
+    fn(on_sent) 在请求真正发出（拿到并发名额和令牌）时调用 on_sent()：排队时间不计入对冲延迟，
+    否则限流排队时每个请求都会被对冲，反而加重排队。
+    hedge_after_s 为 None 时不对冲。任一请求成功后取消另一个；两个都失败时抛出主请求的异常
+    """
+    sent = asyncio.Event()
+    primary = asyncio.ensure_future(fn(sent.set))
+    if hedge_after_s is None:
+        return await primary
+    waiter = asyncio.ensure_future(sent.wait())
+    try:
+        await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        if not primary.done():
+            await asyncio.wait({primary}, timeout=hedge_after_s)
+    except asyncio.CancelledError:
+        primary.cancel()
+        raise
+    finally:
+        waiter.cancel()
+    if primary.done():
+        return primary.result()
+    
+    metrics.inc(f"{name}_hedges_total")
+    backup = asyncio.ensure_future(fn(lambda: None))
+    pending = {primary, backup}
+    first_error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        metrics.inc(f"{name}_hedge_wins")
+                    return task.result()
+                if first_error is None or task is primary:
+                    first_error = task.exception()
+        raise first_error
+    finally:
+        for task in pending:
+            task.cancel()
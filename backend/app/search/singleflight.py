@@ -0,0 +1,83 @@
+"""
+Single-flight 请求合并
+相同 key 的并发调用只执行一次，其余调用方等待同一个在途结果
+（例如多个标签页共享同一张 og:image、多个用户同时搜索同一个热词）
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, Tuple
+
+from . import metrics
+
+
+class SingleFlight:
+    """按 key 合并在途的异步调用"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._inflight: Dict[Any, asyncio.Future] = {}
+        metrics.register_gauge(f"{name}_singleflight_inflight", lambda: len(self._inflight))
+
+    def _register(self, key: Any, fut: asyncio.Future):
+        self._inflight[key] = fut
+
+        def _cleanup(done: asyncio.Future):
+            if self._inflight.get(key) is done:
+                del self._inflight[key]
+            if not done.cancelled():
+                done.exception()  # 避免 "exception was never retrieved" 警告
+        
+        fut.add_done_callback(_cleanup)
+
+    async def do(self, key: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行 fn()；若相同 key 已有在途调用，则直接等待它的结果
+        
+        使用 shield：某个调用方被取消（例如请求超时）不会取消其他调用方共享的任务
+        """
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fn())
+            self._register(key, fut)
+            metrics.inc(f"{self._name}_singleflight_leader")
+        else:
+            metrics.inc(f"{self._name}_singleflight_shared")
+        return await asyncio.shield(fut)
+
+    def claim_many(self, keys: Iterable[Any]) -> Tuple[Dict[Any, asyncio.Future], Dict[Any, asyncio.Future]]:
+        """
+        批量认领 key（供批量接口使用）
+        
+        Returns:
+            (owned, shared)
+            - owned: 本次由调用方负责计算的 key，完成后必须调用 resolve()
+            - shared: 已有其他调用方在途的 key，直接等待对应的 future
+        """
+        loop = asyncio.get_running_loop()
+        owned: Dict[Any, asyncio.Future] = {}
+        shared: Dict[Any, asyncio.Future] = {}
+        for key in keys:
+            if key in owned or key in shared:
+                continue
+            fut = self._inflight.get(key)
+            if fut is not None:
+                shared[key] = fut
+                metrics.inc(f"{self._name}_singleflight_shared")
+            else:
+                fut = loop.create_future()
+                self._register(key, fut)
+                owned[key] = fut
+                metrics.inc(f"{self._name}_singleflight_leader")
+        return owned, shared
+
+    @staticmethod
+    def resolve(owned: Dict[Any, asyncio.Future], results: Dict[Any, Any], error: BaseException = None):
+        """完成 claim_many 认领的 key；缺失的 key 以 None 结束，error 不为空时以异常结束"""
+        for key, fut in owned.items():
+            if fut.done():
+                continue
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(results.get(key))
@@ -0,0 +1,82 @@
+"""
+Embedding 向量表示
+进程内统一使用连续的 float32 np.ndarray（1024 维约 4 KB，而 list[float] 约 33 KB），
+只在 JSON 边界（HTTP 响应）转换为 list
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+def as_vector(value: Any) -> Optional[np.ndarray]:
+    """
+    转换为连续的 float32 一维数组
+    
+    支持 list / tuple / np.ndarray，以及 pgvector 的文本格式 "[0.1,0.2,...]"；
+    空值、空向量或无法解析时返回 None。已经是 float32 连续数组时不复制
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        text = value.strip().strip("[]")
+        if not text:
+            return None
+        try:
+            arr = np.array(text.split(","), dtype=np.float32)
+        except ValueError:
+            return None
+    else:
+        try:
+            arr = np.ascontiguousarray(value, dtype=np.float32)
+        except (ValueError, TypeError):
+            return None
+    if arr.ndim != 1 or arr.size == 0:
+        return None
+    return arr
+
+
+def has_vector(value: Any) -> bool:
+    """是否为非空向量（list 或 ndarray），避免对 ndarray 做真值判断"""
+    if isinstance(value, np.ndarray):
+        return value.size > 0
+    return isinstance(value, (list, tuple)) and len(value) > 0
+
+
+def truncate_vector(value: Any, dim: int) -> Optional[np.ndarray]:
+    """
+    Matryoshka 截断：保留前 dim 维并重新做 L2 归一化
+    
+    qwen2.5-vl-embedding 的低维输出与高维向量的前缀一致，截断后可直接用于余弦检索，无需重新请求
+    """
+    vec = as_vector(value)
+    if vec is None or vec.size < dim:
+        return None
+    head = vec[:dim]
+    norm = float(np.linalg.norm(head))
+    if norm == 0.0:
+        return None
+    return np.ascontiguousarray(head / norm, dtype=np.float32)
+
+
+def fuse_vectors(text_vec: Any, image_vec: Any, text_weight: float = 0.5) -> Optional[np.ndarray]:
+    """
+    文本、图像向量加权求和后 L2 归一化（两者在同一向量空间）；只有一路时返回该路向量
+    """
+    text_vec, image_vec = as_vector(text_vec), as_vector(image_vec)
+    if text_vec is None or image_vec is None or text_vec.size != image_vec.size:
+        return text_vec if image_vec is None else image_vec
+    fused = text_weight * text_vec / (np.linalg.norm(text_vec) or 1.0) + (1.0 - text_weight) * image_vec / (np.linalg.norm(image_vec) or 1.0)
+    norm = float(np.linalg.norm(fused))
+    if norm == 0.0:
+        return None
+    return (fused / norm).astype(np.float32)
+
+
+def vector_to_list(value: Any) -> Any:
+    """JSON 边界：ndarray → list[float]，其他值原样返回"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
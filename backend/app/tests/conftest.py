@@ -0,0 +1,15 @@
+"""
+测试环境：本地 hashing embedding，关闭 embedding / 图片磁盘缓存，不依赖外部服务
+"""
+import os
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+os.environ.setdefault("EMBED_PROVIDER", "hashing")
+os.environ.setdefault("EMBED_CACHE_ENABLED", "false")
+os.environ.setdefault("IMAGE_CACHE_ENABLED", "false")
+
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
@@ -0,0 +1,77 @@
+"""
+/api/v1/search/embedding（Vercel 入口 api/main.py）：向量在内部是 float32 ndarray，
+数据库读出的向量和新生成的向量都要在 JSON 边界转换成列表
+"""
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import vector_db
+
+# backend/app/api 与仓库根目录的 api 包同名，按文件路径加载 Vercel 入口
+_spec = importlib.util.spec_from_file_location("vercel_api_main", Path(__file__).resolve().parents[3] / "api" / "main.py")
+_module = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_module)
+app = _module.app
+
+ITEMS = [
+    {"url": "https://a.example.com/cats", "title": "cats", "description": "kittens", "success": True},
+    {"url": "https://b.example.com/dogs", "title": "dogs", "success": True},
+]
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def _assert_vector_list(value):
+    assert isinstance(value, list) and value
+    assert all(isinstance(x, float) for x in value)
+
+
+def test_generates_embeddings_without_database(client, monkeypatch):
+    monkeypatch.delenv("ADBPG_HOST", raising=False)
+    resp = client.post("/api/v1/search/embedding", json={"opengraph_items": ITEMS})
+    
+    assert resp.status_code == 200
+    data = resp.json()["data"]
+    assert [d["url"] for d in data] == [item["url"] for item in ITEMS]
+    for d in data:
+        assert d["has_embedding"]
+        _assert_vector_list(d["text_embedding"])
+
+
+def test_database_ndarray_vectors_are_serialized(client, monkeypatch):
+    monkeypatch.setenv("ADBPG_HOST", "db.invalid")
+    stored = {
+        "url": ITEMS[0]["url"],
+        "title": "cats",
+        "text_embedding": np.linspace(0, 1, 8, dtype=np.float32),
+        "image_embedding": None,
+    }
+    upserts = []
+
+    async def fake_get(url):
+        return stored if url == stored["url"] else None
+
+    async def fake_upsert(**kwargs):
+        upserts.append(kwargs)
+        return True
+    
+    monkeypatch.setattr(vector_db, "get_opengraph_item", fake_get)
+    monkeypatch.setattr(vector_db, "upsert_opengraph_item", fake_upsert)
+    resp = client.post("/api/v1/search/embedding", json={"opengraph_items": ITEMS})
+    
+    assert resp.status_code == 200
+    from_db, generated = resp.json()["data"]
+    assert from_db["text_embedding"] == pytest.approx(stored["text_embedding"].tolist())
+    assert from_db["image_embedding"] is None
+    _assert_vector_list(generated["text_embedding"])
+    
+    assert [u["url"] for u in upserts] == [ITEMS[1]["url"]]
+    assert isinstance(upserts[0]["text_embedding"], np.ndarray)
+    assert upserts[0]["embed_model"] and upserts[0]["embed_version"]
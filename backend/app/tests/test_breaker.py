@@ -0,0 +1,96 @@
+import asyncio
+
+import numpy as np
+
+from search import embed
+from search.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from search.retry import LatencyTracker
+
+
+def _open_breaker(**kwargs):
+    breaker = CircuitBreaker("test", failure_threshold=3, **kwargs)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures_and_rejects():
+    breaker = CircuitBreaker("test", failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED  # 成功会清零连续失败计数
+    
+    breaker = _open_breaker()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_half_open_allows_limited_probes_and_closes_on_success():
+    breaker = _open_breaker(open_s=0.0, half_open_max_calls=1)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = _open_breaker(open_s=60.0)
+    breaker._opened_at -= 60.0
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_ignored_call_releases_probe_slot():
+    breaker = _open_breaker(open_s=0.0)
+    assert breaker.allow()
+    breaker.record_ignored()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_slow_success_counts_as_failure():
+    breaker = CircuitBreaker("test", failure_threshold=2, slow_call_s=1.0)
+    breaker.record_success(latency_s=0.5)
+    breaker.record_success(latency_s=2.0)
+    breaker.record_success(latency_s=2.0)
+    assert breaker.state == OPEN
+
+
+class _QueuedProvider:
+    """远端 provider 替身：发出请求前排队 queue_s 秒，上游响应耗时 upstream_s 秒"""
+    
+    remote = True
+
+    def __init__(self, queue_s, upstream_s):
+        self.queue_s = queue_s
+        self.upstream_s = upstream_s
+        self.latency = LatencyTracker()
+
+    async def embed(self, contents, on_sent=None):
+        await asyncio.sleep(self.queue_s)
+        on_sent()
+        await asyncio.sleep(self.upstream_s)
+        return [np.zeros(4, dtype=np.float32) for _ in contents]
+
+
+def _post_with(monkeypatch, provider):
+    breaker = CircuitBreaker("test_embed", failure_threshold=1, slow_call_s=0.1)
+    monkeypatch.setattr(embed, "_breaker", breaker)
+    monkeypatch.setattr(embed, "get_provider", lambda: provider)
+    asyncio.run(embed._post_embeddings([{"text": "hello"}]))
+    return breaker
+
+
+def test_queueing_before_send_is_not_a_slow_call(monkeypatch):
+    assert _post_with(monkeypatch, _QueuedProvider(queue_s=0.2, upstream_s=0.0)).state == CLOSED
+
+
+def test_slow_upstream_response_opens_breaker(monkeypatch):
+    assert _post_with(monkeypatch, _QueuedProvider(queue_s=0.0, upstream_s=0.2)).state == OPEN
@@ -0,0 +1,94 @@
+import asyncio
+
+from search.budget import BLOCK, SHED, ByteBudget, get_image_budget
+
+
+def test_shed_rejects_when_full_and_releases_on_exit():
+    async def main():
+        budget = ByteBudget("test_shed", 100, mode=SHED)
+        async with budget.reserve(80) as first:
+            assert first.admitted
+            async with budget.reserve(30) as second:
+                assert not second.admitted
+                assert budget.in_flight == 80
+        assert budget.in_flight == 0
+    
+    asyncio.run(main())
+
+
+def test_oversized_request_is_admitted_when_idle():
+    async def main():
+        budget = ByteBudget("test_oversized", 100, mode=SHED)
+        async with budget.reserve(500) as r:
+            assert r.admitted
+            assert budget.in_flight == 500
+        assert budget.in_flight == 0
+    
+    asyncio.run(main())
+
+
+def test_block_waits_for_release():
+    async def main():
+        budget = ByteBudget("test_block", 100, mode=BLOCK)
+        order = []
+
+        async def holder():
+            async with budget.reserve(100):
+                order.append("held")
+                await asyncio.sleep(0.02)
+            order.append("released")
+
+        async def waiter():
+            await asyncio.sleep(0.005)
+            async with budget.reserve(50) as r:
+                order.append("admitted" if r.admitted else "shed")
+        
+        await asyncio.gather(holder(), waiter())
+        return order
+    
+    assert asyncio.run(main()) == ["held", "released", "admitted"]
+
+
+def test_block_gives_up_after_max_wait():
+    async def main():
+        budget = ByteBudget("test_timeout", 100, mode=BLOCK, max_wait_s=0.01)
+        assert await budget.acquire(100)
+        assert not await budget.acquire(10)
+        assert budget.in_flight == 100
+    
+    asyncio.run(main())
+
+
+def test_grow_reserves_more_and_releases_everything():
+    async def main():
+        budget = ByteBudget("test_grow", 100, mode=SHED)
+        async with budget.reserve(10) as r:
+            assert await r.grow(60)
+            assert budget.in_flight == 60
+            assert await r.grow(40)  # 小于已占用时不变
+            assert budget.in_flight == 60
+            async with budget.reserve(30) as other:
+                assert other.admitted
+                assert not await r.grow(90)
+                assert not r.admitted
+                assert budget.in_flight == 30
+        assert budget.in_flight == 0
+    
+    asyncio.run(main())
+
+
+def test_image_budget_is_recreated_per_event_loop():
+    async def contend():
+        budget = get_image_budget()
+
+        async def hold():
+            async with budget.reserve(budget.capacity):
+                await asyncio.sleep(0.01)
+        
+        await asyncio.gather(hold(), hold())
+        return budget
+    
+    first = asyncio.run(contend())
+    second = asyncio.run(contend())
+    assert first is not second
+    assert second.in_flight == 0
@@ -0,0 +1,59 @@
+from search.canonical import canonicalize_url
+
+
+def test_tracking_params_www_and_trailing_slash_collapse():
+    urls = [
+        "https://www.example.com/article/",
+        "https://example.com/article?utm_source=x&utm_medium=y",
+        "HTTPS://Example.com:443/article?fbclid=abc",
+        "https://example.com//article#comments",
+    ]
+    assert {canonicalize_url(u) for u in urls} == {"https://example.com/article"}
+
+
+def test_non_tracking_params_are_kept_and_sorted():
+    assert canonicalize_url("https://example.com/p?b=2&a=1&utm_campaign=z") == "https://example.com/p?a=1&b=2"
+
+
+def test_hash_routes_are_kept():
+    assert canonicalize_url("https://app.example.com/#/boards/1") == "https://app.example.com/#/boards/1"
+    assert canonicalize_url("https://app.example.com/#!/boards/1") == "https://app.example.com/#!/boards/1"
+    assert canonicalize_url("https://app.example.com/#/a") != canonicalize_url("https://app.example.com/#/b")
+
+
+def test_non_default_port_and_root_path():
+    assert canonicalize_url("http://example.com:8080") == "http://example.com:8080/"
+    assert canonicalize_url("http://example.com:80/") == "http://example.com/"
+
+
+def test_non_http_urls_are_untouched():
+    for url in ("chrome://extensions/", "data:image/png;base64,AAAA", "", "not a url"):
+        assert canonicalize_url(url) == url
+
+
+def test_site_rule_unifies_host_and_strips_pin_suffix():
+    a = canonicalize_url("https://cn.pinterest.com/pin/12345/?mt=login")
+    b = canonicalize_url("https://www.pinterest.com/pin/12345/sent/?invite_code=x")
+    assert a == b == "https://pinterest.com/pin/12345"
+
+
+def test_youtube_watch_keeps_only_whitelisted_params():
+    a = canonicalize_url("https://m.youtube.com/watch?v=abc&t=42s&feature=share")
+    b = canonicalize_url("https://www.youtube.com/watch?v=abc&si=xyz")
+    assert a == b == "https://youtube.com/watch?v=abc"
+    assert canonicalize_url("https://youtube.com/watch?v=abc&list=L1") == "https://youtube.com/watch?list=L1&v=abc"
+    assert canonicalize_url("https://youtube.com/watch?v=abc") != canonicalize_url("https://youtube.com/watch?v=def")
+
+
+def test_search_pages_outside_path_rules_keep_their_query():
+    a = canonicalize_url("https://www.youtube.com/results?search_query=cats&utm_source=x")
+    b = canonicalize_url("https://www.youtube.com/results?search_query=dogs")
+    assert a == "https://youtube.com/results?search_query=cats"
+    assert a != b
+    assert canonicalize_url("https://pinterest.com/search/pins/?q=chair") == "https://pinterest.com/search/pins?q=chair"
+
+
+def test_bilibili_keeps_part_number():
+    a = canonicalize_url("https://www.bilibili.com/video/BV1xx411c7mD/?p=2&vd_source=abc&spm_id_from=1")
+    assert a == "https://bilibili.com/video/BV1xx411c7mD?p=2"
+    assert a != canonicalize_url("https://www.bilibili.com/video/BV1xx411c7mD/?p=3")
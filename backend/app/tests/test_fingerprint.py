@@ -0,0 +1,58 @@
+import numpy as np
+
+from search.embed import embedding_tag
+from search.fingerprint import content_fingerprint, item_fingerprint, reusable_vectors
+
+
+def _stored(item, **overrides):
+    model, version = embedding_tag()
+    row = {
+        "content_fingerprint": item_fingerprint(item),
+        "embed_model": model,
+        "embed_version": version,
+        "text_embedding": np.ones(4, dtype=np.float32),
+        "image_embedding": np.zeros(4, dtype=np.float32),
+    }
+    row.update(overrides)
+    return row
+
+
+def test_whitespace_and_unicode_normalization_do_not_change_fingerprint():
+    a = content_fingerprint("Café  menu", "best\n coffee", "https://img.example.com/a.jpg")
+    b = content_fingerprint("Café menu", " best coffee ", "https://img.example.com/a.jpg")
+    assert a == b
+
+
+def test_fields_are_not_interchangeable():
+    assert content_fingerprint("a b", "", None) != content_fingerprint("a", "b", None)
+    assert content_fingerprint("a", None, None) != content_fingerprint(None, "a", None)
+    assert content_fingerprint("a", "b", "x.jpg") != content_fingerprint("a", "b", "y.jpg")
+
+
+def test_item_fingerprint_falls_back_to_tab_title():
+    assert item_fingerprint({"tab_title": "Hello"}) == content_fingerprint("Hello", None, None)
+    assert item_fingerprint({"title": "OG", "tab_title": "Tab"}) == content_fingerprint("OG", None, None)
+
+
+def test_reusable_vectors_requires_matching_fingerprint_and_tag():
+    item = {"title": "t", "description": "d", "image": "https://img.example.com/a.jpg"}
+    reused = reusable_vectors(item, _stored(item))
+    assert set(reused) == {"text_embedding", "image_embedding"}
+    
+    assert reusable_vectors({**item, "description": "changed"}, _stored(item)) == {}
+    assert reusable_vectors(item, _stored(item, embed_version="old")) == {}
+    assert reusable_vectors(item, None) == {}
+
+
+def test_reusable_vectors_skips_missing_modalities():
+    item = {"title": "t"}
+    assert set(reusable_vectors(item, _stored(item, image_embedding=None))) == {"text_embedding"}
+
+
+def test_fused_rows_reuse_only_the_fused_vector():
+    item = {"title": "t", "image": "https://img.example.com/a.jpg"}
+    stored = _stored(item, image_embedding=None, metadata={"embedding_mode": "fused"})
+    reused = reusable_vectors(item, stored)
+    assert reused["embedding_mode"] == "fused"
+    assert reused["image_embedding"] is None
+    assert reused["text_embedding"] is stored["text_embedding"]
@@ -0,0 +1,118 @@
+import asyncio
+import time
+from io import BytesIO
+
+import httpx
+import pytest
+from PIL import Image
+
+from search import http_client, preprocess
+from search.config import IMAGE_CACHE_FRESH_S
+from search.image_cache import ImageCache
+
+URL = "https://img.example.com/a.jpg"
+
+
+def _jpeg(color):
+    out = BytesIO()
+    Image.new("RGB", (200, 150), color).save(out, format="JPEG")
+    return out.getvalue()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ImageCache(tmp_path / "images", max_bytes=10 * 1024 * 1024, ttl_s=IMAGE_CACHE_FRESH_S * 10)
+    monkeypatch.setattr(preprocess, "get_image_cache", lambda: cache)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """替换共享抓取客户端的传输层，记录收到的请求；responses 中放入待返回的响应（或异常）"""
+    state = {"requests": [], "responses": []}
+
+    def handler(request):
+        state["requests"].append(request)
+        response = state["responses"].pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    
+    monkeypatch.setattr(http_client, "_fetch_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return state
+
+
+def _image_response(data, etag):
+    return httpx.Response(200, content=data, headers={"content-type": "image/jpeg", "etag": etag})
+
+
+def _expire(cache):
+    """让条目超过新鲜期（仍在 TTL 内），下次读取时需要重新验证"""
+    with cache._lock:
+        cache._db.execute("UPDATE images SET validated_at = ?", (time.time() - IMAGE_CACHE_FRESH_S - 1,))
+        cache._db.commit()
+
+
+def _load():
+    return asyncio.run(preprocess.load_image(URL))
+
+
+def test_miss_downloads_once_then_serves_fresh_entry(cache, upstream):
+    original = _jpeg("red")
+    upstream["responses"].append(_image_response(original, '"v1"'))
+    
+    first = _load()
+    assert first.data == original
+    assert (first.width, first.height, first.etag) == (200, 150, '"v1"')
+    
+    second = _load()
+    assert second.data == original
+    assert len(upstream["requests"]) == 1
+
+
+def test_stale_entry_is_revalidated_with_304(cache, upstream):
+    original = _jpeg("red")
+    upstream["responses"] += [_image_response(original, '"v1"'), httpx.Response(304, headers={"etag": '"v1"'})]
+    _load()
+    _expire(cache)
+    
+    revalidated = _load()
+    assert revalidated.data == original
+    conditional = upstream["requests"][1]
+    assert conditional.headers["if-none-match"] == '"v1"'
+    assert "cache-control" not in conditional.headers
+    # 304 刷新了验证时间：再次读取不发请求
+    assert _load().data == original
+    assert len(upstream["requests"]) == 2
+
+
+def test_stale_entry_is_replaced_when_image_changed(cache, upstream):
+    upstream["responses"] += [_image_response(_jpeg("red"), '"v1"'), _image_response(_jpeg("blue"), '"v2"')]
+    first = _load()
+    _expire(cache)
+    
+    second = _load()
+    assert second.etag == '"v2"'
+    assert second.content_hash != first.content_hash
+    assert not cache._blob_path(first.content_hash).exists()
+
+
+def test_stale_entry_is_served_when_revalidation_fails(cache, upstream):
+    original = _jpeg("red")
+    upstream["responses"] += [_image_response(original, '"v1"'), httpx.ConnectError("down")]
+    _load()
+    _expire(cache)
+    
+    assert _load().data == original
+
+
+def test_entries_from_other_preprocess_versions_are_misses(cache, upstream, monkeypatch):
+    upstream["responses"] += [_image_response(_jpeg("red"), '"v1"'), _image_response(_jpeg("red"), '"v1"')]
+    _load()
+    monkeypatch.setattr(preprocess, "PREPROCESS_VERSION", "other")
+    
+    _load()
+    # 版本不同时不带条件头，重新下载
+    assert len(upstream["requests"]) == 2
+    assert "if-none-match" not in upstream["requests"][1].headers
@@ -0,0 +1,46 @@
+import base64
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+import screenshot
+from search.preprocess import encode_jpeg
+
+
+def _noise(size=(512, 512)):
+    """随机噪声图：JPEG 几乎无法压缩，用来构造超过大小上限的输出"""
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+
+
+def test_encode_jpeg_lowers_quality_to_fit():
+    img = _noise()
+    full = encode_jpeg(img, 10 * 1024 * 1024)
+    reduced = encode_jpeg(img, int(len(full) * 0.7))
+    assert reduced is not None and len(reduced) <= len(full) * 0.7
+
+
+def test_encode_jpeg_returns_none_when_it_cannot_fit():
+    img = _noise()
+    assert encode_jpeg(img, 1024) is None
+    fallback = encode_jpeg(img, 1024, allow_oversize=True)
+    assert fallback is not None and len(fallback) > 1024
+
+
+def test_oversized_screenshot_is_still_returned(monkeypatch):
+    # 把 5MB 上限对应的编码结果模拟为“始终超限”：截图仍按最低质量返回，而不是丢弃
+    calls = []
+
+    def fake_encode(img, max_bytes, quality=85, allow_oversize=False):
+        calls.append(allow_oversize)
+        return encode_jpeg(img, 1024, quality, allow_oversize)
+    
+    monkeypatch.setattr("search.preprocess.encode_jpeg", fake_encode)
+    out = BytesIO()
+    _noise((800, 600)).save(out, format="PNG")
+    
+    data_uri = screenshot.process_screenshot_to_base64(out.getvalue(), max_dimension=400)
+    assert calls == [True]
+    assert data_uri.startswith("data:image/jpeg;base64,")
+    assert Image.open(BytesIO(base64.b64decode(data_uri.split(",", 1)[1]))).size == (400, 300)
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import jobs
+from jobs import DONE, FAILED, ITEM_DONE, PENDING, QUEUED, RUNNING, SKIPPED, JobRunner, JobStore
+
+
+def _items(n):
+    return [{"url": f"https://example.com/{i}", "success": True} for i in range(n)]
+
+
+def test_create_claim_and_complete(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    job_id = store.create_job(_items(2) + [{"url": "https://example.com/bad", "success": False}])
+    assert store.claim_job() == job_id
+    assert store.claim_job() is None
+    
+    assert [idx for idx, _ in store.next_items(job_id, 10)] == [0, 1]
+    store.complete_item(job_id, 0, {"has_embedding": True, "saved": True})
+    store.complete_item(job_id, 1, {"has_embedding": True, "unchanged": True})
+    assert store.next_items(job_id, 10) == []
+    store.finish_job(job_id)
+    
+    job = store.get_job(job_id)
+    assert job["status"] == DONE
+    assert job["counts"] == {PENDING: 0, ITEM_DONE: 2, FAILED: 0, SKIPPED: 1}
+    assert job["progress"] == 1.0
+    assert job["items"][1]["unchanged"] and not job["items"][1]["saved"]
+
+
+def test_progress_survives_reopen_and_running_jobs_are_recovered(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    store = JobStore(path)
+    job_id = store.create_job(_items(3))
+    store.claim_job()
+    store.complete_item(job_id, 0, {"saved": True})
+    store.close()
+    
+    store = JobStore(path)
+    assert store.get_job(job_id)["status"] == RUNNING
+    assert store.recover() == 1
+    assert store.claim_job() == job_id
+    assert [idx for idx, _ in store.next_items(job_id, 10)] == [1, 2]
+
+
+def test_failed_items_back_off_and_job_is_deferred(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "backoff_delay", lambda attempt, base, cap: 60.0)
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    job_id = store.create_job(_items(2))
+    store.claim_job()
+    store.fail_items(job_id, [0], "boom")
+    
+    # 退避期间不再取出失败的条目
+    assert [idx for idx, _ in store.next_items(job_id, 10)] == [1]
+    store.complete_item(job_id, 1, {})
+    assert store.next_items(job_id, 10) == []
+    
+    retry_at = store.defer_job(job_id)
+    assert retry_at is not None and retry_at > time.time() + 50
+    assert store.get_job(job_id)["status"] == QUEUED
+    assert store.claim_job() is None
+
+
+def test_items_fail_permanently_after_max_attempts(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "backoff_delay", lambda attempt, base, cap: 0.0)
+    monkeypatch.setattr(jobs, "JOBS_MAX_ATTEMPTS", 2)
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    job_id = store.create_job(_items(1))
+    store.fail_items(job_id, [0], "first")
+    assert store.get_job(job_id)["items"][0]["status"] == PENDING
+    store.fail_items(job_id, [0], "second")
+    
+    item = store.get_job(job_id)["items"][0]
+    assert item["status"] == FAILED
+    assert item["attempts"] == 2
+    assert item["error"] == "second"
+    assert store.defer_job(job_id) is None
+
+
+def test_runner_retries_missing_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "backoff_delay", lambda attempt, base, cap: 0.0)
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    job_id = store.create_job(_items(3))
+    calls = []
+
+    async def handler(batch):
+        calls.append([item["url"] for item in batch])
+        for pos, item in enumerate(batch):
+            # 第一次处理时条目 1 没有产出结果
+            if item["url"].endswith("/1") and len(calls) == 1:
+                continue
+            yield pos, {"has_embedding": True, "saved": True}
+
+    async def main():
+        runner = JobRunner(store, handler, workers=1)
+        assert store.claim_job() == job_id
+        await runner._run_job(job_id)
+    
+    asyncio.run(main())
+    assert calls == [[f"https://example.com/{i}" for i in range(3)], ["https://example.com/1"]]
+    job = store.get_job(job_id)
+    assert job["status"] == DONE
+    assert job["items"][1]["attempts"] == 2
+    assert job["counts"][ITEM_DONE] == 3
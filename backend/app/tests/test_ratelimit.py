@@ -0,0 +1,92 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+
+from search.ratelimit import AdaptiveRateLimiter, parse_retry_after
+
+
+def _limiter(**overrides):
+    cfg = dict(
+        name="test", initial_rps=10.0, min_rps=1.0, max_rps=20.0, burst=2,
+        increase_rps=1.0, decrease_factor=0.5, report_gauge=False,
+    )
+    cfg.update(overrides)
+    return AdaptiveRateLimiter(**cfg)
+
+
+def test_burst_is_immediate_then_paced_by_rate():
+    async def main():
+        limiter = _limiter()
+        started = time.monotonic()
+        await limiter.acquire()
+        await limiter.acquire()
+        burst_elapsed = time.monotonic() - started
+        await limiter.acquire()
+        return burst_elapsed, time.monotonic() - started
+    
+    burst_elapsed, total = asyncio.run(main())
+    assert burst_elapsed < 0.05
+    assert total >= 0.08  # 第三个令牌按 10 rps 补充，约 0.1s
+
+
+def test_additive_increase_is_capped():
+    limiter = _limiter(initial_rps=19.99)
+    limiter.on_success()
+    assert limiter.rate == 20.0
+    
+    limiter = _limiter(initial_rps=4.0)
+    limiter.on_success()
+    assert limiter.rate == pytest.approx(4.25)
+
+
+def test_multiplicative_decrease_once_per_burst_of_throttles():
+    limiter = _limiter(initial_rps=8.0)
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.rate == 4.0
+    
+    limiter._last_decrease -= 1.0
+    limiter.on_throttle()
+    assert limiter.rate == 2.0
+    
+    limiter._last_decrease -= 1.0
+    limiter.on_throttle()
+    limiter._last_decrease -= 1.0
+    limiter.on_throttle()
+    assert limiter.rate == 1.0  # 不低于 min_rps
+
+
+def test_retry_after_blocks_acquire():
+    async def main():
+        limiter = _limiter(burst=5)
+        limiter.on_throttle(retry_after=0.1)
+        assert 0 < limiter.blocked_for() <= 0.1
+        started = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - started
+    
+    assert asyncio.run(main()) >= 0.09
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(" 1.5 ") == 1.5
+    assert parse_retry_after("-2") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert 5 <= parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+
+
+def test_limiter_can_be_reused_across_event_loops():
+    limiter = _limiter(initial_rps=100.0)
+
+    async def contend():
+        await asyncio.gather(*(limiter.acquire() for _ in range(4)))
+    
+    asyncio.run(contend())
+    limiter.on_success()
+    rate = limiter.rate
+    asyncio.run(contend())
+    assert limiter.rate == rate
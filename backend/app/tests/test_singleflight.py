@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from search.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def main():
+        flight = SingleFlight("test_share")
+        results = await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+        assert results == ["ok"] * 5
+        # 完成后不再合并，新的调用重新执行
+        assert await flight.do("k", work) == "ok"
+    
+    asyncio.run(main())
+    assert calls == 2
+
+
+def test_different_keys_run_separately():
+    async def main():
+        flight = SingleFlight("test_keys")
+
+        async def echo(v):
+            await asyncio.sleep(0)
+            return v
+        
+        return await asyncio.gather(flight.do("a", lambda: echo(1)), flight.do("b", lambda: echo(2)))
+    
+    assert asyncio.run(main()) == [1, 2]
+
+
+def test_errors_propagate_to_all_waiters_and_are_not_cached():
+    calls = 0
+
+    async def fail():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        flight = SingleFlight("test_errors")
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        with pytest.raises(ValueError):
+            await flight.do("k", fail)
+    
+    asyncio.run(main())
+    assert calls == 2
+
+
+def test_cancelling_one_caller_does_not_cancel_shared_work():
+    async def main():
+        flight = SingleFlight("test_cancel")
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "done"
+        
+        first = asyncio.ensure_future(flight.do("k", slow))
+        second = asyncio.ensure_future(flight.do("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "done"
+        assert first.cancelled()
+    
+    asyncio.run(main())
+
+
+def test_claim_many_splits_owned_and_shared_keys():
+    async def main():
+        leader = SingleFlight("test_claim")
+        owned, shared = leader.claim_many(["a", "b", "a"])
+        assert set(owned) == {"a", "b"} and shared == {}
+        
+        owned2, shared2 = leader.claim_many(["b", "c"])
+        assert set(owned2) == {"c"} and set(shared2) == {"b"}
+        
+        SingleFlight.resolve(owned, {"a": 1})
+        SingleFlight.resolve(owned2, {"c": 3})
+        assert await shared2["b"] is None
+        assert owned["a"].result() == 1
+        # 完成后（done 回调执行后）key 被释放，可以重新认领
+        await asyncio.sleep(0)
+        owned3, _ = leader.claim_many(["a"])
+        assert set(owned3) == {"a"}
+        SingleFlight.resolve(owned3, {}, error=RuntimeError("x"))
+        with pytest.raises(RuntimeError):
+            await owned3["a"]
+    
+    asyncio.run(main())
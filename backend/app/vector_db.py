@@ -3,22 +3,50 @@
 用于存储和检索 OpenGraph 数据的 embedding 向量
 """
 import os
+import re
 import asyncpg
 import json
 from typing import Dict, List, Optional, Tuple
 import numpy as np
 from datetime import datetime
 
+from search.canonical import canonicalize_url
+from search.config import get_collection_dim
+from search.fingerprint import content_fingerprint
+from search.vectors import as_vector
 
-def to_vector_str(vec: Optional[List[float]]) -> Optional[str]:
+
+def to_vector_str(vec: Optional[np.ndarray]) -> Optional[str]:
     """
-    Convert a Python list[float] into the string format expected by ADBPG's vector(1024) type.
+    Convert a float32 array (or list[float]) into the string format expected by ADBPG's vector(EMBED_DIM) type.
     For example: [0.1, 0.2, 0.3] -> "[0.1,0.2,0.3]".
-    If vec is falsy or empty, return None.
+    If vec is None or empty, return None.
     """
-    if not vec:
+    arr = as_vector(vec)
+    if arr is None:
         return None
-    return "[" + ",".join(str(float(x)) for x in vec) + "]"
+    # %.9g 足以无损表示 float32
+    return "[" + ",".join(np.char.mod("%.9g", arr)) + "]"
+
+
+def _vector_dim(*vectors) -> Optional[int]:
+    """第一个非空向量的维度（随来源标记入库，即生成向量时请求的维度）"""
+    for vec in vectors:
+        arr = as_vector(vec)
+        if arr is not None:
+            return int(arr.size)
+    return None
+
+
+def _row_to_item(row) -> Dict:
+    """把查询结果行转换为字典：vector 列解析为 float32 数组，metadata 解析为字典"""
+    item = dict(row)
+    for key in ("text_embedding", "image_embedding"):
+        if key in item:
+            item[key] = as_vector(item[key])
+    if item.get('metadata'):
+        item['metadata'] = json.loads(item['metadata']) if isinstance(item['metadata'], str) else item['metadata']
+    return item
 
 # 数据库连接配置
 DB_HOST = os.getenv("ADBPG_HOST", "gp-uf6j424dtk2ww5291o-master.gpdb.rds.aliyuncs.com")
@@ -31,6 +59,10 @@ DB_NAME = os.getenv("ADBPG_DBNAME", "postgres")
 DB_USER = os.getenv("ADBPG_USER", "cleantab_db")
 DB_PASSWORD = os.getenv("ADBPG_PASSWORD", "CleanTabV5")
 NAMESPACE = os.getenv("ADBPG_NAMESPACE", "cleantab")
+# 当前集合（Namespace）的向量维度，见 search/config.py 的 EMBED_COLLECTION_DIMS / MM_EMBED_DIM
+EMBED_DIM = get_collection_dim(NAMESPACE)
+# embed_model / embed_version 列出现之前写入的行所对应的来源标记
+LEGACY_EMBED_TAG = ("qwen2.5-vl-embedding", "v1")
 
 # 连接池
 _pool: Optional[asyncpg.Pool] = None
@@ -197,8 +229,12 @@ async def init_schema():
                         site_name TEXT,
                         tab_id INTEGER,
                         tab_title TEXT,
-                        text_embedding vector(1024),
-                        image_embedding vector(1024),
+                        text_embedding vector({EMBED_DIM}),
+                        image_embedding vector({EMBED_DIM}),
+                        content_fingerprint TEXT,
+                        embed_model TEXT,
+                        embed_version TEXT,
+                        embed_dim INTEGER,
                         metadata JSONB,
                         created_at TIMESTAMP DEFAULT NOW(),
                         updated_at TIMESTAMP DEFAULT NOW()
@@ -210,21 +246,45 @@ async def init_schema():
                 print(f"[VectorDB] ✓ Table {NAMESPACE}.opengraph_items already exists")
                 is_valid, error_msg = await check_table_constraints(conn)
                 
-                # 检查并添加 screenshot_image 字段（如果不存在）
-                column_exists = await conn.fetchval(f"""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.columns 
-                        WHERE table_schema = '{NAMESPACE}' 
-                        AND table_name = 'opengraph_items'
-                        AND column_name = 'screenshot_image'
-                    );
-                """)
-                if not column_exists:
-                    await conn.execute(f"""
-                        ALTER TABLE {NAMESPACE}.opengraph_items 
-                        ADD COLUMN screenshot_image TEXT;
+                # 检查并添加后续新增的字段（如果不存在）
+                for column_name, column_type in (
+                    ("screenshot_image", "TEXT"),
+                    ("content_fingerprint", "TEXT"),
+                    ("embed_model", "TEXT"),
+                    ("embed_version", "TEXT"),
+                    ("embed_dim", "INTEGER"),
+                ):
+                    column_exists = await conn.fetchval(f"""
+                        SELECT EXISTS (
+                            SELECT FROM information_schema.columns 
+                            WHERE table_schema = '{NAMESPACE}' 
+                            AND table_name = 'opengraph_items'
+                            AND column_name = '{column_name}'
+                        );
                     """)
-                    print(f"[VectorDB] ✓ Added screenshot_image column to {NAMESPACE}.opengraph_items")
+                    if not column_exists:
+                        await conn.execute(f"""
+                            ALTER TABLE {NAMESPACE}.opengraph_items 
+                            ADD COLUMN {column_name} {column_type};
+                        """)
+                        print(f"[VectorDB] ✓ Added {column_name} column to {NAMESPACE}.opengraph_items")
+                        if column_name == "embed_version":
+                            # 加列之前写入的向量都来自最初的模型和预处理
+                            await conn.execute(f"""
+                                UPDATE {NAMESPACE}.opengraph_items
+                                SET embed_model = $1, embed_version = $2
+                                WHERE embed_model IS NULL;
+                            """, *LEGACY_EMBED_TAG)
+                            print(f"[VectorDB] ✓ Tagged existing rows with embed_model/embed_version {LEGACY_EMBED_TAG}")
+                        elif column_name == "embed_dim":
+                            # 加列之前写入的向量就是当前列的维度
+                            column_dim = await get_embedding_column_dim(conn, "text_embedding")
+                            await conn.execute(f"""
+                                UPDATE {NAMESPACE}.opengraph_items
+                                SET embed_dim = $1
+                                WHERE embed_dim IS NULL AND embed_model IS NOT NULL;
+                            """, column_dim)
+                            print(f"[VectorDB] ✓ Tagged existing rows with embed_dim={column_dim}")
                 
                 if not is_valid:
                     # 检查是否设置了强制重建标志
@@ -246,8 +306,12 @@ async def init_schema():
                                 site_name TEXT,
                                 tab_id INTEGER,
                                 tab_title TEXT,
-                                text_embedding vector(1024),
-                                image_embedding vector(1024),
+                                text_embedding vector({EMBED_DIM}),
+                                image_embedding vector({EMBED_DIM}),
+                                content_fingerprint TEXT,
+                                embed_model TEXT,
+                                embed_version TEXT,
+                                embed_dim INTEGER,
                                 metadata JSONB,
                                 created_at TIMESTAMP DEFAULT NOW(),
                                 updated_at TIMESTAMP DEFAULT NOW()
@@ -276,35 +340,16 @@ async def init_schema():
                 print(f"[VectorDB] Warning: could not create idx_opengraph_url: {e}")
             
             # 创建向量索引（用于相似度搜索）
-            # 注意：如果表中有数据，索引创建可能需要一些时间
-            # 使用阿里云 AnalyticDB 的 FastANN 索引（HNSW，关闭 PQ）
-            try:
-                await conn.execute(f"""
-                    CREATE INDEX idx_text_embedding_cosine
-                    ON {NAMESPACE}.opengraph_items
-                    USING ann(text_embedding)
-                    WITH (
-                        distancemeasure = cosine,
-                        hnsw_m           = 64,
-                        pq_enable        = 0      -- ✨ 关闭 PQ
-                    );
-                """)
-            except Exception as e:
-                print(f"[VectorDB] Warning: Could not create text_embedding index: {e}")
+            await _create_vector_indexes(conn)
             
-            try:
-                await conn.execute(f"""
-                    CREATE INDEX idx_image_embedding_cosine
-                    ON {NAMESPACE}.opengraph_items
-                    USING ann(image_embedding)
-                    WITH (
-                        distancemeasure = cosine,
-                        hnsw_m           = 64,
-                        pq_enable        = 0      -- ✨ 关闭 PQ
-                    );
-                """)
-            except Exception as e:
-                print(f"[VectorDB] Warning: Could not create image_embedding index: {e}")
+            # 已有表的向量列维度与配置不一致时只告警，不自动改表（迁移需要重新生成或截断向量）
+            for column in EMBEDDING_COLUMNS:
+                column_dim = await get_embedding_column_dim(conn, column)
+                if column_dim is not None and column_dim != EMBED_DIM:
+                    print(
+                        f"[VectorDB] ⚠ {NAMESPACE}.opengraph_items.{column} is vector({column_dim}), "
+                        f"but EMBED_DIM={EMBED_DIM}. Run: python migrate_embedding_dim.py --dim {EMBED_DIM}"
+                    )
             
             print(f"[VectorDB] ✓ Schema initialized for namespace: {NAMESPACE}")
     except Exception as e:
@@ -314,6 +359,259 @@ async def init_schema():
         raise
 
 
+EMBEDDING_COLUMNS = ("text_embedding", "image_embedding")
+# 迁移时整行复制的列（url、metadata 单独处理）
+_ROW_COLUMNS = (
+    "title", "description", "image", "screenshot_image", "site_name", "tab_id", "tab_title",
+    "text_embedding", "image_embedding", "content_fingerprint", "embed_model", "embed_version", "embed_dim",
+    "created_at", "updated_at",
+)
+
+
+async def migrate_canonical_urls(dry_run: bool = False) -> Tuple[int, int]:
+    """
+    一次性数据迁移（由 migrate_canonical_urls.py 调用，不在 init_schema 中自动执行）：
+    把按原始 URL 存储的行改为按 canonicalize_url 存储（与 upsert_opengraph_item 一致），原始 URL 记录在 metadata.original_url
+    
+    规范化后相同的多行只保留一行：优先有向量的，其次最近更新的，其余删除。
+    规范化规则调整后可以重新运行
+    
+    Returns:
+        (改为规范化 URL 的行数, 合并删除的重复行数)；dry_run 时只统计，不修改
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT url, (text_embedding IS NOT NULL OR image_embedding IS NOT NULL) AS has_embedding, updated_at
+            FROM {NAMESPACE}.opengraph_items;
+        """)
+        groups: Dict[str, List] = {}
+        for row in rows:
+            groups.setdefault(canonicalize_url(row["url"]), []).append(row)
+        pending = {canonical: group for canonical, group in groups.items() if len(group) > 1 or group[0]["url"] != canonical}
+        
+        columns = ", ".join(_ROW_COLUMNS)
+        rekeyed = merged = 0
+        async with conn.transaction():
+            for canonical, group in pending.items():
+                group.sort(key=lambda r: (r["has_embedding"], r["updated_at"] or datetime.min), reverse=True)
+                keep, drop = group[0]["url"], [r["url"] for r in group[1:]]
+                merged += len(drop)
+                rekeyed += keep != canonical
+                if dry_run:
+                    continue
+                if drop:
+                    await conn.execute(f"DELETE FROM {NAMESPACE}.opengraph_items WHERE url = ANY($1::text[]);", drop)
+                if keep != canonical:
+                    # url 是分布键，用 INSERT ... SELECT + DELETE 代替 UPDATE url
+                    await conn.execute(f"""
+                        INSERT INTO {NAMESPACE}.opengraph_items (url, metadata, {columns})
+                        SELECT $2, jsonb_build_object('original_url', $1::text) || COALESCE(metadata, '{{}}'::jsonb), {columns}
+                        FROM {NAMESPACE}.opengraph_items WHERE url = $1;
+                    """, keep, canonical)
+                    await conn.execute(f"DELETE FROM {NAMESPACE}.opengraph_items WHERE url = $1;", keep)
+    return rekeyed, merged
+
+
+async def _create_vector_indexes(conn, columns: Tuple[str, ...] = EMBEDDING_COLUMNS):
+    """
+    创建向量索引（用于相似度搜索）
+    注意：如果表中有数据，索引创建可能需要一些时间
+    使用阿里云 AnalyticDB 的 FastANN 索引（HNSW，关闭 PQ）
+    """
+    for column in columns:
+        try:
+            await conn.execute(f"""
+                CREATE INDEX idx_{column}_cosine
+                ON {NAMESPACE}.opengraph_items
+                USING ann({column})
+                WITH (
+                    distancemeasure = cosine,
+                    hnsw_m           = 64,
+                    pq_enable        = 0      -- ✨ 关闭 PQ
+                );
+            """)
+        except Exception as e:
+            print(f"[VectorDB] Warning: Could not create {column} index: {e}")
+
+
+async def _drop_vector_indexes(conn, columns: Tuple[str, ...] = EMBEDDING_COLUMNS):
+    for column in columns:
+        await conn.execute(f"DROP INDEX IF EXISTS {NAMESPACE}.idx_{column}_cosine;")
+
+
+async def get_embedding_column_dim(conn, column: str) -> Optional[int]:
+    """
+    读取向量列的声明维度（vector(N) 中的 N）
+    
+    Returns:
+        维度；列不存在或未声明维度时返回 None
+    """
+    type_name = await conn.fetchval("""
+        SELECT format_type(a.atttypid, a.atttypmod)
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = $1
+          AND c.relname = 'opengraph_items'
+          AND a.attname = $2
+          AND NOT a.attisdropped;
+    """, NAMESPACE, column)
+    match = re.search(r"\((\d+)\)", type_name or "")
+    return int(match.group(1)) if match else None
+
+
+async def add_staging_embedding_columns(dim: int) -> None:
+    """迁移第一步：为每个向量列添加 vector(dim) 的临时列 {column}_new"""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        for column in EMBEDDING_COLUMNS:
+            # 上次中断留下的临时列直接丢弃，重新开始
+            await conn.execute(f"ALTER TABLE {NAMESPACE}.opengraph_items DROP COLUMN IF EXISTS {column}_new;")
+            await conn.execute(f"ALTER TABLE {NAMESPACE}.opengraph_items ADD COLUMN {column}_new vector({dim});")
+    print(f"[VectorDB] ✓ Added staging columns vector({dim})")
+
+
+async def fetch_items_for_migration(after_url: Optional[str], limit: int) -> List[Dict]:
+    """按 url 顺序分页读取待迁移的行（包括原向量和生成向量需要的字段）"""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT url, title, description, image, screenshot_image, site_name, tab_id, tab_title,
+                   text_embedding, image_embedding, metadata, created_at, updated_at
+            FROM {NAMESPACE}.opengraph_items
+            WHERE $1::text IS NULL OR url > $1
+            ORDER BY url
+            LIMIT $2;
+        """, after_url, limit)
+        return [_row_to_item(row) for row in rows]
+
+
+async def write_staging_embeddings(
+    dim: int,
+    rows: List[Tuple[str, Optional[np.ndarray], Optional[np.ndarray]]],
+    embed_tag: Optional[Tuple[str, str]] = None,
+) -> int:
+    """
+    写入临时列；rows 为 (url, text_embedding, image_embedding)
+    
+    embed_tag 为 (embed_model, embed_version) 时表示向量是按 dim 重新生成的（文本、图像分别生成），
+    同时更新来源标记和 embed_dim、清除 fused 标记；
+    截断得到的向量不传，保留原来的来源标记（embed_dim 仍为生成时的维度）
+    """
+    if not rows:
+        return 0
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        if embed_tag is None:
+            await conn.executemany(f"""
+                UPDATE {NAMESPACE}.opengraph_items
+                SET text_embedding_new = $2::vector({dim}),
+                    image_embedding_new = $3::vector({dim})
+                WHERE url = $1;
+            """, [(url, to_vector_str(text_emb), to_vector_str(image_emb)) for url, text_emb, image_emb in rows])
+        else:
+            await conn.executemany(f"""
+                UPDATE {NAMESPACE}.opengraph_items
+                SET text_embedding_new = $2::vector({dim}),
+                    image_embedding_new = $3::vector({dim}),
+                    embed_model = $4,
+                    embed_version = $5,
+                    embed_dim = $6,
+                    metadata = COALESCE(metadata, '{{}}'::jsonb) - 'embedding_mode'
+                WHERE url = $1;
+            """, [
+                (url, to_vector_str(text_emb), to_vector_str(image_emb), *embed_tag, dim)
+                for url, text_emb, image_emb in rows
+            ])
+    return len(rows)
+
+
+async def swap_staging_embedding_columns() -> None:
+    """
+    迁移最后一步（单个事务）：删除旧向量索引和旧列，把 {column}_new 重命名为正式列，再重建索引
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await _drop_vector_indexes(conn)
+            for column in EMBEDDING_COLUMNS:
+                await conn.execute(f"ALTER TABLE {NAMESPACE}.opengraph_items DROP COLUMN {column};")
+                await conn.execute(f"ALTER TABLE {NAMESPACE}.opengraph_items RENAME COLUMN {column}_new TO {column};")
+        await _create_vector_indexes(conn)
+    print(f"[VectorDB] ✓ Swapped embedding columns and rebuilt vector indexes")
+
+
+async def count_stale_embeddings(embed_model: str, embed_version: str) -> List[Dict]:
+    """
+    统计来源标记与 (embed_model, embed_version) 不一致的行
+    
+    Returns:
+        [{"embed_model", "embed_version", "embed_dim", "count"}]，按 count 降序
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT embed_model, embed_version, embed_dim, COUNT(*) AS count
+            FROM {NAMESPACE}.opengraph_items
+            WHERE embed_model IS DISTINCT FROM $1 OR embed_version IS DISTINCT FROM $2
+            GROUP BY embed_model, embed_version, embed_dim
+            ORDER BY count DESC;
+        """, embed_model, embed_version)
+        return [dict(row) for row in rows]
+
+
+async def fetch_stale_items(embed_model: str, embed_version: str, after_url: Optional[str], limit: int) -> List[Dict]:
+    """按 url 顺序分页读取来源标记过期的行（生成向量需要的字段和内容指纹）"""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT url, title, description, image, screenshot_image, tab_title, content_fingerprint
+            FROM {NAMESPACE}.opengraph_items
+            WHERE (embed_model IS DISTINCT FROM $1 OR embed_version IS DISTINCT FROM $2)
+              AND ($3::text IS NULL OR url > $3)
+            ORDER BY url
+            LIMIT $4;
+        """, embed_model, embed_version, after_url, limit)
+        return [_row_to_item(row) for row in rows]
+
+
+async def write_backfill_embeddings(
+    embed_model: str,
+    embed_version: str,
+    rows: List[Tuple[str, Optional[str], Optional[np.ndarray], Optional[np.ndarray]]],
+) -> int:
+    """
+    写入回填生成的向量和来源标记；rows 为 (url, content_fingerprint, text_embedding, image_embedding)
+    
+    回填按文本、图像分别生成向量，原来的 fused 标记（metadata.embedding_mode）一并清除
+    
+    只更新内容指纹未变化的行：回填期间被重新 ingest 的行已经是新向量，不会被覆盖
+    
+    Returns:
+        实际更新的行数
+    """
+    if not rows:
+        return 0
+    pool = await get_pool()
+    updated = 0
+    async with pool.acquire() as conn:
+        for url, fingerprint, text_emb, image_emb in rows:
+            result = await conn.execute(f"""
+                UPDATE {NAMESPACE}.opengraph_items
+                SET text_embedding = $3::vector({EMBED_DIM}),
+                    image_embedding = $4::vector({EMBED_DIM}),
+                    embed_model = $5,
+                    embed_version = $6,
+                    embed_dim = $7,
+                    metadata = COALESCE(metadata, '{{}}'::jsonb) - 'embedding_mode'
+                WHERE url = $1 AND content_fingerprint IS NOT DISTINCT FROM $2;
+            """, url, fingerprint, to_vector_str(text_emb), to_vector_str(image_emb), embed_model, embed_version,
+                _vector_dim(text_emb, image_emb))
+            updated += int(result.split()[-1]) if result else 0
+    return updated
+
+
 async def upsert_opengraph_item(
     url: str,
     title: Optional[str] = None,
@@ -322,24 +620,28 @@ async def upsert_opengraph_item(
     site_name: Optional[str] = None,
     tab_id: Optional[int] = None,
     tab_title: Optional[str] = None,
-    text_embedding: Optional[List[float]] = None,
-    image_embedding: Optional[List[float]] = None,
+    text_embedding: Optional[np.ndarray] = None,
+    image_embedding: Optional[np.ndarray] = None,
     metadata: Optional[Dict] = None,
+    embed_model: Optional[str] = None,
+    embed_version: Optional[str] = None,
 ) -> bool:
     """
     插入或更新 OpenGraph 数据
     
     Args:
-        url: 网页 URL（唯一标识）
+        url: 网页 URL（按 canonicalize_url 规范化后作为唯一标识，原始 URL 记录在 metadata.original_url）
         title: 标题
         description: 描述
         image: 图片 URL 或 Base64（必须是字符串，不能是数组）
         site_name: 站点名称
         tab_id: 标签页 ID
         tab_title: 标签页标题
-        text_embedding: 文本 embedding 向量（1024维）
-        image_embedding: 图像 embedding 向量（1024维）
+        text_embedding: 文本 embedding 向量（EMBED_DIM 维）
+        image_embedding: 图像 embedding 向量（EMBED_DIM 维）
         metadata: 其他元数据
+        embed_model / embed_version: 生成这两个向量的模型和版本（pipeline 产出的条目自带，见 embed.embedding_tag）；
+            来源未知时为 None，该行会被回填任务重新生成。向量维度按实际长度记录在 embed_dim 列
     
     Returns:
         是否成功
@@ -372,22 +674,36 @@ async def upsert_opengraph_item(
             except (ValueError, TypeError):
                 tab_id = None
         
+        # 按规范化 URL 存储：只差跟踪参数 / fragment / www. 的页面共用一行
+        canonical_url = canonicalize_url(url)
+        metadata = dict(metadata or {})
+        if canonical_url != url:
+            metadata.setdefault("original_url", url)
+        url = canonical_url
+        
         pool = await get_pool()
         
         async with pool.acquire() as conn:
             # 准备 metadata
-            metadata_json = json.dumps(metadata or {})
+            metadata_json = json.dumps(metadata)
             
-            # 将 embedding 列表转换为 ADBPG 需要的字符串格式
+            # 将 embedding 向量转换为 ADBPG 需要的字符串格式
             text_vec = to_vector_str(text_embedding)
             image_vec = to_vector_str(image_embedding)
+            # 内容指纹：下次 ingest 时内容未变化的条目直接复用这里存储的向量
+            fingerprint = content_fingerprint(title or tab_title, description, image)
+            embed_dim = _vector_dim(text_embedding, image_embedding)
             
             # 使用 INSERT ... ON CONFLICT 实现 upsert
             await conn.execute(f"""
                 INSERT INTO {NAMESPACE}.opengraph_items (
                     url, title, description, image, site_name,
-                    tab_id, tab_title, text_embedding, image_embedding, metadata, updated_at
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8::vector(1024), $9::vector(1024), $10::jsonb, NOW())
+                    tab_id, tab_title, text_embedding, image_embedding, metadata, content_fingerprint,
+                    embed_model, embed_version, embed_dim, updated_at
+                ) VALUES (
+                    $1, $2, $3, $4, $5, $6, $7, $8::vector({EMBED_DIM}), $9::vector({EMBED_DIM}), $10::jsonb, $11,
+                    $12, $13, $14, NOW()
+                )
                 ON CONFLICT (url) DO UPDATE SET
                     title = EXCLUDED.title,
                     description = EXCLUDED.description,
@@ -398,9 +714,13 @@ async def upsert_opengraph_item(
                     text_embedding = EXCLUDED.text_embedding,
                     image_embedding = EXCLUDED.image_embedding,
                     metadata = EXCLUDED.metadata,
+                    content_fingerprint = EXCLUDED.content_fingerprint,
+                    embed_model = EXCLUDED.embed_model,
+                    embed_version = EXCLUDED.embed_version,
+                    embed_dim = EXCLUDED.embed_dim,
                     updated_at = NOW();
             """, url, title, description, image, site_name,
-                tab_id, tab_title, text_vec, image_vec, metadata_json)
+                tab_id, tab_title, text_vec, image_vec, metadata_json, fingerprint, embed_model, embed_version, embed_dim)
             
             return True
     except Exception as e:
@@ -430,7 +750,7 @@ async def update_opengraph_item_screenshot(url: str, screenshot_image: str) -> b
                 SET screenshot_image = $1,
                     updated_at = NOW()
                 WHERE url = $2;
-            """, screenshot_image, url)
+            """, screenshot_image, canonicalize_url(url))
             
             return True
     except Exception as e:
@@ -459,38 +779,59 @@ async def get_opengraph_item(url: str) -> Optional[Dict]:
                        tab_id, tab_title, text_embedding, image_embedding, metadata
                 FROM {NAMESPACE}.opengraph_items
                 WHERE url = $1;
-            """, url)
+            """, canonicalize_url(url))
             
             if not row:
                 return None
             
-            # 转换 vector 类型为列表
-            result = dict(row)
-            if result.get('text_embedding'):
-                result['text_embedding'] = list(result['text_embedding'])
-            if result.get('image_embedding'):
-                result['image_embedding'] = list(result['image_embedding'])
-            if result.get('metadata'):
-                result['metadata'] = json.loads(result['metadata']) if isinstance(result['metadata'], str) else result['metadata']
-            
-            return result
+            # 转换 vector 类型为 float32 数组
+            return _row_to_item(row)
     except Exception as e:
         print(f"[VectorDB] Error getting item {url[:50]}...: {e}")
         return None
 
 
+async def get_stored_embeddings(urls: List[str]) -> Dict[str, Dict]:
+    """
+    一次查询批量读取多个 URL 已存储的向量和内容指纹
+    
+    Returns:
+        {url: {"content_fingerprint", "embed_model", "embed_version", "text_embedding", "image_embedding", "metadata"}}，
+        key 为调用方传入的 URL
+        （按规范化 URL 查询），不存在的 URL 不出现在结果中
+    """
+    canonical = {u: canonicalize_url(u) for u in urls if u}
+    if not canonical:
+        return {}
+    try:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                SELECT url, content_fingerprint, embed_model, embed_version, text_embedding, image_embedding, metadata
+                FROM {NAMESPACE}.opengraph_items
+                WHERE url = ANY($1::text[]);
+            """, list(set(canonical.values())))
+            found = {row["url"]: _row_to_item(row) for row in rows}
+            return {u: found[c] for u, c in canonical.items() if c in found}
+    except Exception as e:
+        print(f"[VectorDB] Error looking up stored embeddings for {len(canonical)} urls: {e}")
+        return {}
+
+
 async def search_by_text_embedding(
-    query_embedding: List[float],
+    query_embedding: np.ndarray,
     top_k: int = 20,
-    threshold: float = 0.0
+    threshold: float = 0.0,
+    embed_model: Optional[str] = None,
 ) -> List[Dict]:
     """
     根据文本 embedding 进行相似度搜索
     
     Args:
-        query_embedding: 查询文本的 embedding 向量（1024维）
+        query_embedding: 查询文本的 embedding 向量（EMBED_DIM 维）
         top_k: 返回前 K 个结果
         threshold: 相似度阈值（0-1）
+        embed_model: 只检索该模型生成的行（回填期间新旧模型的向量分开检索）；None 表示不限
     
     Returns:
         相似度排序的结果列表
@@ -503,27 +844,17 @@ async def search_by_text_embedding(
             
             rows = await conn.fetch(f"""
                 SELECT url, title, description, image, site_name,
-                       tab_id, tab_title, text_embedding, image_embedding, metadata,
-                       1 - (text_embedding <=> $1::vector(1024)) AS similarity
+                       tab_id, tab_title, text_embedding, image_embedding, metadata, embed_model,
+                       1 - (text_embedding <=> $1::vector({EMBED_DIM})) AS similarity
                 FROM {NAMESPACE}.opengraph_items
                 WHERE text_embedding IS NOT NULL
-                  AND (1 - (text_embedding <=> $1::vector(1024))) >= $2
-                ORDER BY text_embedding <=> $1::vector(1024)
+                  AND (1 - (text_embedding <=> $1::vector({EMBED_DIM}))) >= $2
+                  AND ($4::text IS NULL OR embed_model = $4)
+                ORDER BY text_embedding <=> $1::vector({EMBED_DIM})
                 LIMIT $3;
-            """, query_vec, threshold, top_k)
+            """, query_vec, threshold, top_k, embed_model)
             
-            results = []
-            for row in rows:
-                item = dict(row)
-                if item.get('text_embedding'):
-                    item['text_embedding'] = list(item['text_embedding'])
-                if item.get('image_embedding'):
-                    item['image_embedding'] = list(item['image_embedding'])
-                if item.get('metadata'):
-                    item['metadata'] = json.loads(item['metadata']) if isinstance(item['metadata'], str) else item['metadata']
-                results.append(item)
-            
-            return results
+            return [_row_to_item(row) for row in rows]
     except Exception as e:
         print(f"[VectorDB] Error searching by text embedding: {e}")
         import traceback
@@ -532,17 +863,19 @@ async def search_by_text_embedding(
 
 
 async def search_by_image_embedding(
-    query_embedding: List[float],
+    query_embedding: np.ndarray,
     top_k: int = 20,
-    threshold: float = 0.0
+    threshold: float = 0.0,
+    embed_model: Optional[str] = None,
 ) -> List[Dict]:
     """
     根据图像 embedding 进行相似度搜索
     
     Args:
-        query_embedding: 查询图像的 embedding 向量（1024维）
+        query_embedding: 查询图像的 embedding 向量（EMBED_DIM 维）
         top_k: 返回前 K 个结果
         threshold: 相似度阈值（0-1）
+        embed_model: 只检索该模型生成的行（回填期间新旧模型的向量分开检索）；None 表示不限
     
     Returns:
         相似度排序的结果列表
@@ -555,27 +888,17 @@ async def search_by_image_embedding(
             
             rows = await conn.fetch(f"""
                 SELECT url, title, description, image, site_name,
-                       tab_id, tab_title, text_embedding, image_embedding, metadata,
-                       1 - (image_embedding <=> $1::vector(1024)) AS similarity
+                       tab_id, tab_title, text_embedding, image_embedding, metadata, embed_model,
+                       1 - (image_embedding <=> $1::vector({EMBED_DIM})) AS similarity
                 FROM {NAMESPACE}.opengraph_items
                 WHERE image_embedding IS NOT NULL
-                  AND (1 - (image_embedding <=> $1::vector(1024))) >= $2
-                ORDER BY image_embedding <=> $1::vector(1024)
+                  AND (1 - (image_embedding <=> $1::vector({EMBED_DIM}))) >= $2
+                  AND ($4::text IS NULL OR embed_model = $4)
+                ORDER BY image_embedding <=> $1::vector({EMBED_DIM})
                 LIMIT $3;
-            """, query_vec, threshold, top_k)
-            
-            results = []
-            for row in rows:
-                item = dict(row)
-                if item.get('text_embedding'):
-                    item['text_embedding'] = list(item['text_embedding'])
-                if item.get('image_embedding'):
-                    item['image_embedding'] = list(item['image_embedding'])
-                if item.get('metadata'):
-                    item['metadata'] = json.loads(item['metadata']) if isinstance(item['metadata'], str) else item['metadata']
-                results.append(item)
+            """, query_vec, threshold, top_k, embed_model)
             
-            return results
+            return [_row_to_item(row) for row in rows]
     except Exception as e:
         print(f"[VectorDB] Error searching by image embedding: {e}")
         import traceback
@@ -583,6 +906,50 @@ async def search_by_image_embedding(
         return []
 
 
+async def search_by_keyword(query: str, limit: int = 100) -> List[Dict]:
+    """
+    关键词检索（不依赖 embedding）：title / description / tab_title 中包含查询词或其任一分词
+    
+    用于 embedding 不可用时的降级搜索，结果需要再用 rank.sort_by_fuzzy_score 排序
+    
+    Args:
+        query: 查询文本
+        limit: 最多返回的候选数量
+    
+    Returns:
+        候选结果列表（不包含 embedding 字段）
+    """
+    terms = [t for t in dict.fromkeys([(query or "").strip()] + (query or "").split()) if t]
+    if not terms:
+        return []
+    # 转义 LIKE 通配符
+    patterns = [
+        "%" + t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        for t in terms
+    ]
+    try:
+        pool = await get_pool()
+        
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                SELECT url, title, description, image, site_name,
+                       tab_id, tab_title, metadata
+                FROM {NAMESPACE}.opengraph_items
+                WHERE title ILIKE ANY($1::text[])
+                   OR description ILIKE ANY($1::text[])
+                   OR tab_title ILIKE ANY($1::text[])
+                ORDER BY updated_at DESC
+                LIMIT $2;
+            """, patterns, limit)
+            
+            return [_row_to_item(row) for row in rows]
+    except Exception as e:
+        print(f"[VectorDB] Error searching by keyword: {e}")
+        import traceback
+        traceback.print_exc()
+        return []
+
+
 async def batch_upsert_items(items: List[Dict]) -> int:
     """
     批量插入或更新 OpenGraph 数据
@@ -610,6 +977,8 @@ async def batch_upsert_items(items: List[Dict]) -> int:
             text_embedding=item.get("text_embedding"),
             image_embedding=item.get("image_embedding"),
             metadata=item.get("metadata"),
+            embed_model=item.get("embed_model"),
+            embed_version=item.get("embed_version"),
         ):
             success_count += 1
     return success_count